@@ -0,0 +1,49 @@
+"""
+Compares applying a backlog of stream updates one by one with SingleLocation.apply_events.
+
+    python benchmarks/bench_apply_events.py
+"""
+import datetime
+import logging
+import timeit
+
+from homelypy.devices import SingleLocation, create_device_from_rest_response
+from homelypy.synthetic import location_response, temperature_events
+
+DEVICE_COUNT = 1000
+EVENT_COUNT = 50000
+REPEAT = 5
+
+
+def build_location(data: dict) -> SingleLocation:
+    return SingleLocation(
+        data["locationId"],
+        data["gatewayserial"],
+        data["name"],
+        data["alarmState"],
+        datetime.datetime.now(datetime.timezone.utc),
+        data["userRoleAtLocation"],
+        [create_device_from_rest_response(device) for device in data["devices"]],
+    )
+
+
+def main():
+    logging.disable(logging.WARNING)
+    data = location_response(DEVICE_COUNT)
+    events = temperature_events(data, EVENT_COUNT)
+    location = build_location(data)
+
+    def one_by_one():
+        for event in events:
+            location.update_device_state_from_stream(event)
+
+    single = min(timeit.repeat(one_by_one, number=1, repeat=REPEAT))
+    batch = min(timeit.repeat(lambda: location.apply_events(events), number=1, repeat=REPEAT))
+    print(f"{EVENT_COUNT} events over {DEVICE_COUNT} devices")
+    print(f"update_device_state_from_stream: {single * 1e3:8.1f} ms ({single / EVENT_COUNT * 1e6:.2f} µs/event)")
+    print(f"apply_events:                    {batch * 1e3:8.1f} ms ({batch / EVENT_COUNT * 1e6:.2f} µs/event)")
+    print(f"speedup: {single / batch:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
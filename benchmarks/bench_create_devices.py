@@ -0,0 +1,69 @@
+"""
+Measures create_device_from_rest_response and Device.get_entities over a large synthetic location, compared with the
+per-call dataclass introspection they used to do.
+
+    python benchmarks/bench_create_devices.py
+"""
+import dataclasses
+import timeit
+
+from homelypy.devices import DEVICE_MAP, create_device_from_rest_response
+from homelypy.states import State
+from homelypy.synthetic import location_response
+
+DEVICE_COUNT = 1000
+REPEAT = 20
+
+
+def create_with_reflection(device: dict):
+    cls = DEVICE_MAP[device["modelName"]]
+    state_fields = {}
+    for field in dataclasses.fields(cls):
+        if issubclass(field.type, State):
+            state_fields[field.name] = field.type.create_from_rest_response(device)
+    return cls(
+        device["id"],
+        device["name"],
+        device["serialNumber"],
+        device["location"],
+        device["online"],
+        device["modelId"],
+        device["modelName"],
+        **state_fields,
+    )
+
+
+def entities_with_reflection(device):
+    return [getattr(device, field.name) for field in dataclasses.fields(device) if issubclass(field.type, State)]
+
+
+def best(function) -> float:
+    return min(timeit.repeat(function, number=1, repeat=REPEAT))
+
+
+def main():
+    payload = location_response(DEVICE_COUNT)["devices"]
+    devices = [create_device_from_rest_response(device) for device in payload]
+    rows = [
+        (
+            "create_device_from_rest_response",
+            best(lambda: [create_with_reflection(device) for device in payload]),
+            best(lambda: [create_device_from_rest_response(device) for device in payload]),
+        ),
+        (
+            "get_entities",
+            best(lambda: [entities_with_reflection(device) for device in devices]),
+            best(lambda: [device.get_entities() for device in devices]),
+        ),
+    ]
+    print(f"{DEVICE_COUNT} devices")
+    print(f"{'operation':<34}{'reflection µs':>15}{'cached µs':>12}{'speedup':>10}")
+    for name, reflection, cached in rows:
+        print(
+            f"{name:<34}{reflection / DEVICE_COUNT * 1e6:>15.2f}{cached / DEVICE_COUNT * 1e6:>12.2f}"
+            f"{reflection / cached:>9.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Measures the time to import the homelypy modules in a fresh interpreter and which transports each import loads, and
+the steady-state cost per event of handling stream events and of tracing websocket frames.
+
+    PYTHONPATH=src python benchmarks/bench_import.py
+"""
+import io
+import json
+import logging
+import os
+import subprocess
+import sys
+import timeit
+
+from homelypy.homely import Homely, create_single_location
+from homelypy.synthetic import location_response, stream_events
+
+MODULES = ["homelypy.devices", "homelypy.homely", "homelypy.async_homely"]
+TRANSPORTS = ["requests", "socketio", "websocket", "dateutil", "aiohttp"]
+REPEAT = 10
+DEVICE_COUNT = 100
+EVENT_COUNT = 10000
+
+IMPORT_SCRIPT = """
+import sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(elapsed, ",".join(name for name in {transports!r} if name in sys.modules) or "-")
+"""
+
+
+def import_time(module: str):
+    """Returns the best import time in seconds over fresh interpreters, and the transports the import loaded."""
+    best, loaded = float("inf"), ""
+    for _ in range(REPEAT):
+        output = subprocess.run(
+            [sys.executable, "-c", IMPORT_SCRIPT.format(module=module, transports=TRANSPORTS)],
+            capture_output=True,
+            text=True,
+            check=True,
+            env={**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)},
+        ).stdout.split()
+        best, loaded = min(best, float(output[0])), output[1]
+    return best, loaded
+
+
+def handle_event_time(events: list) -> float:
+    """Returns the seconds per event for Homely.handle_event, the path every streamed event takes."""
+    data = location_response(DEVICE_COUNT)
+    single_location = create_single_location(data)
+    homely = Homely("user", "password", session=object())
+    homely.state_change_callback = lambda *args: None
+    messages = [{"type": "device-state-changed", "data": event} for event in events]
+
+    def handle():
+        for message in messages:
+            homely.handle_event(single_location, message)
+
+    return min(timeit.repeat(handle, number=1, repeat=5)) / len(messages)
+
+
+def frame_trace_time(events: list, trace: bool) -> float:
+    """Returns the seconds per frame websocket-client spends on tracing a received frame."""
+    import websocket
+    from websocket import ABNF
+    from websocket._logging import isEnabledForTrace, trace as trace_frame
+
+    frames = [ABNF.create_frame('42["event",' + json.dumps(event) + "]", ABNF.OPCODE_TEXT) for event in events]
+    websocket.enableTrace(trace, handler=logging.StreamHandler(io.StringIO()))
+
+    def receive():
+        # The same statements as WebSocket.recv_data_frame runs for every frame
+        for frame in frames:
+            if isEnabledForTrace():
+                trace_frame(f"++Rcv raw: {repr(frame.format())}")
+                trace_frame(f"++Rcv decoded: {frame.__str__()}")
+
+    try:
+        return min(timeit.repeat(receive, number=1, repeat=5)) / len(frames)
+    finally:
+        websocket.enableTrace(False)
+
+
+def main():
+    logging.disable(logging.WARNING)
+    print(f"{'module':<26}{'import ms':>10}  transports loaded")
+    for module in MODULES:
+        elapsed, loaded = import_time(module)
+        print(f"{module:<26}{elapsed * 1e3:>10.1f}  {loaded}")
+
+    events = stream_events(location_response(DEVICE_COUNT), EVENT_COUNT)
+    print(f"\n{'steady state':<26}{'µs/event':>10}")
+    print(f"{'handle_event':<26}{handle_event_time(events) * 1e6:>10.2f}")
+    print(f"{'frame tracing off':<26}{frame_trace_time(events, False) * 1e6:>10.2f}")
+    print(f"{'frame tracing on':<26}{frame_trace_time(events, True) * 1e6:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
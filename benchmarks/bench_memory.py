@@ -0,0 +1,29 @@
+"""
+Measures the memory held per device for a synthetic location.
+
+    python benchmarks/bench_memory.py
+"""
+import gc
+import tracemalloc
+
+from homelypy.devices import create_device_from_rest_response
+from homelypy.synthetic import location_response
+
+DEVICE_COUNT = 1000
+
+
+def main():
+    payload = location_response(DEVICE_COUNT)["devices"]
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    devices = [create_device_from_rest_response(device) for device in payload]
+    gc.collect()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    allocated = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    print(f"{len(devices)} devices: {allocated / len(devices):.0f} bytes per device")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Compares parsing a whole /homely/home response with incremental parsing by LocationStream, when visiting every device
+once: total time, time until the first device is available and peak memory.
+
+    PYTHONPATH=src python benchmarks/bench_streaming.py
+"""
+import json
+import logging
+import time
+import tracemalloc
+from typing import Callable, Iterator
+
+from homelypy.devices import Device, create_device_from_rest_response
+from homelypy.homely import DOWNLOAD_CHUNK_SIZE
+from homelypy.streaming import LocationStream
+from homelypy.synthetic import location_response
+
+DEVICE_COUNT = 10000
+REPEAT = 3
+
+
+def chunks(content: bytes) -> Iterator[bytes]:
+    for start in range(0, len(content), DOWNLOAD_CHUNK_SIZE):
+        yield content[start : start + DOWNLOAD_CHUNK_SIZE]
+
+
+def whole(content: bytes) -> Iterator[Device]:
+    data = json.loads(b"".join(chunks(content)))
+    for device in data["devices"]:
+        yield create_device_from_rest_response(device)
+
+
+def incremental(content: bytes) -> Iterator[Device]:
+    return iter(LocationStream(chunks(content)))
+
+
+def measure(parse: Callable[[bytes], Iterator[Device]], content: bytes):
+    total = first = float("inf")
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        devices = parse(content)
+        next(devices)
+        first = min(first, time.perf_counter() - start)
+        for _ in devices:
+            pass
+        total = min(total, time.perf_counter() - start)
+    tracemalloc.start()
+    for _ in parse(content):
+        pass
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return total, first, peak
+
+
+def main():
+    logging.disable(logging.WARNING)
+    content = json.dumps(location_response(DEVICE_COUNT), indent=2).encode()
+    parsers = {"json.loads": whole, "LocationStream": incremental}
+    print(f"{DEVICE_COUNT} devices, {len(content) / 1e6:.1f} MB of JSON")
+    print(f"{'parser':<18}{'total ms':>10}{'first device ms':>17}{'peak MB':>10}")
+    for name, parse in parsers.items():
+        total, first, peak = measure(parse, content)
+        print(f"{name:<18}{total * 1e3:>10.1f}{first * 1e3:>17.2f}{peak / 1e6:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
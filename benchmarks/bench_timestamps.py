@@ -0,0 +1,71 @@
+"""
+Compares timestamp parsing with dateutil against the specialised Homely parser, when building a full location and
+when applying stream changes.
+
+    python benchmarks/bench_timestamps.py
+"""
+import datetime
+import timeit
+from unittest import mock
+
+from dateutil.parser import parse
+
+import homelypy.devices
+import homelypy.states
+from homelypy.devices import SingleLocation, create_device_from_rest_response
+from homelypy.timestamps import configure_timestamp_cache, parse_timestamp
+from homelypy.synthetic import location_response, temperature_events
+
+DEVICE_COUNT = 1000
+EVENT_COUNT = 10000
+REPEAT = 5
+
+
+def build_location(data: dict) -> SingleLocation:
+    return SingleLocation(
+        data["locationId"],
+        data["gatewayserial"],
+        data["name"],
+        data["alarmState"],
+        datetime.datetime.now(datetime.timezone.utc),
+        data["userRoleAtLocation"],
+        [create_device_from_rest_response(device) for device in data["devices"]],
+    )
+
+
+def measure(parser, cache_size: int, data: dict, events: list):
+    configure_timestamp_cache(cache_size)
+    with mock.patch.object(homelypy.states, "parse_timestamp", parser), mock.patch.object(
+        homelypy.devices, "parse_timestamp", parser
+    ):
+        build = min(timeit.repeat(lambda: build_location(data), number=1, repeat=REPEAT))
+        location = build_location(data)
+
+        def apply():
+            for event in events:
+                location.update_device_state_from_stream(event)
+
+        stream = min(timeit.repeat(apply, number=1, repeat=REPEAT))
+    return build / len(data["devices"]), stream / len(events)
+
+
+def main():
+    data = location_response(DEVICE_COUNT)
+    events = temperature_events(data, EVENT_COUNT)
+    results = {
+        "dateutil": measure(parse, 0, data, events),
+        "homely format": measure(parse_timestamp, 0, data, events),
+        "homely format + LRU": measure(parse_timestamp, 256, data, events),
+    }
+    configure_timestamp_cache()
+    baseline_build, baseline_stream = results["dateutil"]
+    print(f"{'parser':<22}{'build µs/device':>18}{'stream µs/event':>18}{'speedup':>16}")
+    for name, (build, stream) in results.items():
+        print(
+            f"{name:<22}{build * 1e6:>18.2f}{stream * 1e6:>18.2f}"
+            f"{baseline_build / build:>7.1f}x /{baseline_stream / stream:>5.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
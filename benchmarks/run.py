@@ -0,0 +1,137 @@
+"""
+Benchmark suite over synthetic locations of increasing size, covering all models in DEVICE_MAP.
+
+    python benchmarks/run.py                                    # print the results
+    python benchmarks/run.py --output results.json              # also store them
+    python benchmarks/run.py --compare results.json             # flag regressions against stored results
+
+The payloads are seeded, and every timing is the best of several repeats, so results of runs on the same machine can
+be compared to track regressions.
+"""
+import argparse
+import gc
+import json
+import logging
+import platform
+import subprocess
+import sys
+import time
+import timeit
+import tracemalloc
+from typing import Callable, Dict
+
+from homelypy.devices import create_device_from_rest_response
+from homelypy.homely import create_single_location
+from homelypy.synthetic import location_response, stream_events
+
+SIZES = [10, 100, 1000, 10000]
+EVENTS_PER_DEVICE = 10
+MIN_EVENTS = 10000
+REPEAT = 5
+
+# Metrics where a higher value is better, all others are timings or sizes where lower is better
+HIGHER_IS_BETTER = {"stream_events_per_second"}
+
+
+def best(function: Callable, repeat: int) -> float:
+    return min(timeit.repeat(function, number=1, repeat=repeat))
+
+
+def measure_memory(payload: list) -> float:
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    devices = [create_device_from_rest_response(device) for device in payload]
+    gc.collect()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    return sum(stat.size_diff for stat in after.compare_to(before, "filename")) / len(devices)
+
+
+def run_size(device_count: int, repeat: int) -> Dict[str, float]:
+    data = location_response(device_count)
+    text = json.dumps(data)
+    events = stream_events(data, max(device_count * EVENTS_PER_DEVICE, MIN_EVENTS))
+    single_location = create_single_location(json.loads(text))
+
+    def stream():
+        for event in events:
+            single_location.update_device_state_from_stream(event)
+
+    create = best(lambda: [create_device_from_rest_response(device) for device in data["devices"]], repeat)
+    parse = best(lambda: create_single_location(json.loads(text)), repeat)
+    stream_time = best(stream, repeat)
+    return {
+        "create_device_us": create / device_count * 1e6,
+        "get_location_ms": parse * 1e3,
+        "stream_events_per_second": len(events) / stream_time,
+        "memory_bytes_per_device": measure_memory(data["devices"]),
+    }
+
+
+def environment() -> dict:
+    try:
+        revision = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+    return {
+        "python": sys.version.split()[0],
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+        "platform": platform.platform(),
+        "revision": revision,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> int:
+    """Prints the change of each metric against the baseline. Returns the number of regressions."""
+    regressions = 0
+    print(f"\nCompared with {baseline['environment'].get('revision')} ({baseline['environment'].get('time')})")
+    for size, metrics in results["sizes"].items():
+        for name, value in metrics.items():
+            reference = baseline["sizes"].get(size, {}).get(name)
+            if not reference:
+                continue
+            ratio = value / reference
+            worse = ratio < 1 - tolerance if name in HIGHER_IS_BETTER else ratio > 1 + tolerance
+            regressions += worse
+            print(f"{size:>6} {name:<28}{ratio:>8.2f}x{'  REGRESSION' if worse else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the homelypy benchmarks")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="Numbers of devices per location")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="Repeats per timing, the best is kept")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="Compare the results with this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Relative change reported as regression")
+    args = parser.parse_args()
+    # Unknown states and devices are logged, which should not be part of the measurements
+    logging.disable(logging.WARNING)
+
+    results = {"environment": environment(), "sizes": {}}
+    print(
+        f"{'devices':>8}{'create µs/device':>18}{'get_location ms':>17}{'stream events/s':>17}{'bytes/device':>14}"
+    )
+    for size in args.sizes:
+        metrics = run_size(size, args.repeat)
+        results["sizes"][str(size)] = metrics
+        print(
+            f"{size:>8}{metrics['create_device_us']:>18.2f}{metrics['get_location_ms']:>17.2f}"
+            f"{metrics['stream_events_per_second']:>17.0f}{metrics['memory_bytes_per_device']:>14.0f}"
+        )
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+    if args.compare:
+        with open(args.compare) as baseline:
+            if compare(results, json.load(baseline), args.tolerance):
+                sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+"""Asyncio counterpart of the Homely client. Requires aiohttp, install with `pip install homelypy[async]`."""
+import asyncio
+import inspect
+import json
+import logging
+import time
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+import aiohttp
+import socketio
+
+from homelypy.devices import Device, Location, LocationChanges, SingleLocation
+from homelypy.homely import (
+    AUTHENTICATION_ENDPOINT,
+    DEFAULT_BACKOFF_FACTOR,
+    DEFAULT_MAX_RETRIES,
+    DEFAULT_TIMEOUT,
+    LOCATIONS_ENDPOINT,
+    REFRESH_TOKEN_ENDPOINT,
+    RETRY_STATUS_CODES,
+    SDK_URL,
+    SINGLE_LOCATION_ENDPOINT,
+    WEB_SOCKET_URL,
+    AuthenticationFailedException,
+    ConnectionFailedException,
+    HomelyBase,
+    apply_stream_event,
+    create_locations,
+    create_single_location,
+)
+from homelypy.metrics import NULL_METRICS, MetricsSink
+from homelypy.reconnect import ReconnectScheduler
+from homelypy.recording import EventRecorder
+from homelypy.states import State
+
+logger = logging.getLogger(__name__)
+
+StreamEvent = Tuple[Optional[SingleLocation], Optional[Device], List[State]]
+
+
+class AsyncHomely(HomelyBase):
+    """
+    Asynchronous Homely client. The locations and devices are the same SingleLocation and Device objects as
+    returned by Homely. Use as an async context manager, or call close() when done.
+    """
+
+    def __init__(
+        self,
+        username: str,
+        password: str,
+        session: Optional[aiohttp.ClientSession] = None,
+        timeout: float = DEFAULT_TIMEOUT,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        backoff_factor: float = DEFAULT_BACKOFF_FACTOR,
+        sdk_url: str = SDK_URL,
+        web_socket_url: str = WEB_SOCKET_URL,
+        metrics: Optional[MetricsSink] = None,
+        reconnect_scheduler: Callable[[], ReconnectScheduler] = ReconnectScheduler,
+        recorder: Optional[EventRecorder] = None,
+    ):
+        super().__init__(username, password, sdk_url, web_socket_url, metrics)
+        self.reconnect_scheduler = reconnect_scheduler
+        self.recorder = recorder
+        self._owns_session = session is None
+        self.session = session
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self._authentication_lock = asyncio.Lock()
+
+    async def __aenter__(self) -> "AsyncHomely":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        """Closes the session, unless it was provided by the caller."""
+        if self._owns_session and self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def _request(self, method: str, endpoint: str, path: str = "", **kwargs) -> Tuple[int, str]:
+        """
+        Performs a request to the endpoint (with the path appended), retrying connection errors and 5xx responses
+        with exponential backoff. The latency and status of every attempt is recorded.
+        """
+        if self.session is None:
+            self.session = aiohttp.ClientSession()
+        url = self.url(endpoint) + path
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        attempt = 0
+        while True:
+            status = "error"
+            start = time.perf_counter()
+            try:
+                async with self.session.request(method, url, timeout=timeout, **kwargs) as response:
+                    status, text = response.status, await response.text()
+                if status not in RETRY_STATUS_CODES or attempt >= self.max_retries:
+                    return status, text
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if attempt >= self.max_retries:
+                    raise
+            finally:
+                self.metrics.observe("rest_request_duration_seconds", time.perf_counter() - start, endpoint=endpoint)
+                self.metrics.increment("rest_requests_total", endpoint=endpoint, status=str(status))
+            await asyncio.sleep(self.backoff_factor * (2**attempt))
+            attempt += 1
+
+    async def authenticate(self):
+        status, text = await self._request(
+            "POST", AUTHENTICATION_ENDPOINT, data={"username": self.username, "password": self.password}
+        )
+        if status == 401:
+            raise AuthenticationFailedException(text)
+        if status != 201:
+            raise ConnectionFailedException(text)
+        self.store_authentication_information(json.loads(text))
+        self.metrics.increment("authentications_total")
+
+    async def reauthenticate(self):
+        status, text = await self._request("POST", REFRESH_TOKEN_ENDPOINT, data={"refresh_token": self.refresh_token})
+        if status != 201:
+            self.invalidate_authentication_information()
+            raise ConnectionFailedException(text)
+        self.store_authentication_information(json.loads(text))
+        self.metrics.increment("token_refreshes_total")
+
+    async def authenticate_if_required(self):
+        async with self._authentication_lock:
+            if self.authentication_required():
+                await self.authenticate()
+            elif self.refresh_required():
+                await self.reauthenticate()
+
+    async def get_authorisation_header(self) -> Dict:
+        await self.authenticate_if_required()
+        return self.bearer_header()
+
+    async def get_locations(self) -> List[Location]:
+        status, text = await self._request("GET", LOCATIONS_ENDPOINT, headers=await self.get_authorisation_header())
+        if status != 200:
+            raise ConnectionFailedException(text)
+        return create_locations(json.loads(text))
+
+    async def get_location_json(self, location_id) -> dict:
+        status, text = await self._request(
+            "GET", SINGLE_LOCATION_ENDPOINT, f"/{location_id}", headers=await self.get_authorisation_header()
+        )
+        if status != 200:
+            raise ConnectionFailedException(text)
+        return json.loads(text)
+
+    async def get_location(self, location_id) -> SingleLocation:
+        return create_single_location(await self.get_location_json(location_id))
+
+    async def refresh_location(self, single_location: SingleLocation) -> LocationChanges:
+        """
+        Fetches the location again and updates the existing location in place, keeping the Device and State objects
+        of the devices that are still present. Returns the changes.
+        """
+        return single_location.merge(await self.get_location(single_location.location_id))
+
+    async def run_socket_io(
+        self,
+        single_location: SingleLocation,
+        state_change_callback: Optional[Callable[..., Any]] = None,
+    ):
+        """
+        Streams state changes for the location until cancelled, reconnecting after failures with backoff. After
+        reconnecting, the location is refreshed and the state changes missed meanwhile are passed to the callback, and
+        then the events received during the refresh. The callback may be a plain function or a coroutine function.
+        """
+        if single_location.metrics is None and self.metrics is not NULL_METRICS:
+            single_location.metrics = self.metrics
+        scheduler = self.reconnect_scheduler()
+        disconnected_at = None
+        # Events received while the location is refreshed, which are applied on top of the fetched state afterwards
+        held_events: Optional[List[dict]] = None
+
+        async def report(*result):
+            callback_result = state_change_callback(*result)
+            if inspect.isawaitable(callback_result):
+                await callback_result
+
+        async def process(data: dict):
+            start = time.perf_counter()
+            result = apply_stream_event(single_location, data)
+            self.metrics.observe("event_processing_seconds", time.perf_counter() - start, type=data["type"])
+            if result is None:
+                return
+            self.metrics.increment("events_applied_total", type=data["type"])
+            if state_change_callback is not None:
+                start = time.perf_counter()
+                await report(*result)
+                self.metrics.observe("callback_duration_seconds", time.perf_counter() - start)
+
+        async def resync():
+            try:
+                changes = await self.refresh_location(single_location)
+            except Exception:
+                logger.exception(f"Failed resyncing location {single_location} after reconnecting")
+                return
+            self.metrics.increment("resyncs_total")
+            if state_change_callback is not None:
+                try:
+                    if changes.alarm_state_changed:
+                        await report(single_location, None, [])
+                    for device, states in changes.updated:
+                        if states:
+                            await report(None, device, states)
+                except Exception:
+                    logger.exception(f"State change callback failed for the changes resynced for {single_location}")
+
+        while True:
+            sio = socketio.AsyncClient(logger=logger, engineio_logger=False, reconnection=False)
+
+            @sio.event
+            async def connect():
+                nonlocal disconnected_at, held_events
+                scheduler.connected()
+                if disconnected_at is None:
+                    return
+                self.metrics.increment("reconnects_total")
+                self.metrics.observe("reconnect_duration_seconds", time.monotonic() - disconnected_at)
+                disconnected_at = None
+                # Events are handled in their own tasks, so they arrive while the location is being fetched
+                held_events = []
+                try:
+                    await resync()
+                    while held_events:
+                        events, held_events = held_events, []
+                        for data in events:
+                            # A failing callback must not keep the remaining held events from being applied
+                            try:
+                                await process(data)
+                            except Exception:
+                                logger.exception(f"Failed applying held back event to {single_location}: {data}")
+                finally:
+                    held_events = None
+
+            @sio.on("event")
+            async def on_message(data):
+                if self.recorder is not None:
+                    self.recorder.record(data)
+                self.metrics.increment("events_received_total", type=data.get("type"))
+                if held_events is not None:
+                    held_events.append(data)
+                    return
+                await process(data)
+
+            try:
+                header = {**await self.get_authorisation_header(), "locationId": single_location.location_id}
+                url = (
+                    f"{self.web_socket_url}?locationId={single_location.location_id}"
+                    f"&token=Bearer%20{self.access_token}"
+                )
+                logger.debug(f"Connecting to web socket {url}")
+                await sio.connect(url, headers=header)
+                await sio.wait()
+            except asyncio.CancelledError:
+                await sio.disconnect()
+                raise
+            except Exception:
+                logger.exception("Exception while running socketio")
+            if disconnected_at is None:
+                disconnected_at = time.monotonic()
+            try:
+                await sio.disconnect()
+            except Exception as ex:
+                logger.warning(f"Failed disconnecting after unexpected websocket termination: {ex}")
+            delay = scheduler.next_delay()
+            logger.info(f"Socket terminating restarting in {delay:.1f} seconds")
+            await asyncio.sleep(delay)
+
+    async def stream(self, single_location: SingleLocation) -> AsyncIterator[StreamEvent]:
+        """
+        Yields (single_location, device, states) for every state change, with the same arguments as the state change
+        callback of run_socket_io.
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        task = asyncio.ensure_future(self.run_socket_io(single_location, lambda *event: queue.put_nowait(event)))
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
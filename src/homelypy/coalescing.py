@@ -0,0 +1,86 @@
+"""Merges bursts of device-state-changed events for the same device into a single update."""
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Tuple
+
+from homelypy.devices import SingleLocation
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WINDOW = 0.25
+
+
+class EventCoalescer:
+    """
+    Buffers the device-state-changed events of each device for a time window, starting at its first event, and then
+    passes a single event with the latest value of every changed state to the handler. Other events are passed on
+    immediately. The handler is called from a background thread for merged events.
+    """
+
+    def __init__(self, handler: Callable[[SingleLocation, dict], Any], window: float = DEFAULT_WINDOW):
+        self.handler = handler
+        self.window = window
+        self.received = 0
+        self.delivered = 0
+        # (location id, device id) -> [deadline, single location, merged event, {(feature, stateName): change}]
+        self._pending: Dict[Tuple[str, str], list] = {}
+        self._condition = threading.Condition()
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="homely-coalesce", daemon=True)
+        self._thread.start()
+
+    def add(self, single_location: SingleLocation, event: dict):
+        if event.get("type") != "device-state-changed":
+            self.handler(single_location, event)
+            return
+        data = event["data"]
+        with self._condition:
+            self.received += 1
+            key = (single_location.location_id, data["deviceId"])
+            entry = self._pending.get(key)
+            if entry is None:
+                entry = [time.monotonic() + self.window, single_location, {**event, "data": dict(data)}, {}]
+                self._pending[key] = entry
+                self._condition.notify()
+            for change in data["changes"]:
+                entry[3][(change["feature"], change["stateName"])] = change
+
+    def _take(self, due_before: float) -> list:
+        due = [key for key, entry in self._pending.items() if entry[0] <= due_before]
+        return [self._pending.pop(key) for key in due]
+
+    def _deliver(self, entries: list):
+        for _, single_location, event, changes in entries:
+            event["data"]["changes"] = list(changes.values())
+            try:
+                self.handler(single_location, event)
+            except Exception:
+                logger.exception(f"Failed handling coalesced event {event}")
+            self.delivered += 1
+
+    def flush(self):
+        """Delivers all buffered events now."""
+        with self._condition:
+            entries = self._take(float("inf"))
+        self._deliver(entries)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if self._stopping:
+                    return
+                if self._pending:
+                    self._condition.wait(max(min(entry[0] for entry in self._pending.values()) - time.monotonic(), 0))
+                else:
+                    self._condition.wait()
+                entries = self._take(time.monotonic())
+            self._deliver(entries)
+
+    def stop(self):
+        """Delivers the buffered events and stops the background thread."""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+        self._thread.join()
+        self.flush()
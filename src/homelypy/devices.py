@@ -3,12 +3,14 @@ import datetime
 import logging
 from dataclasses import dataclass
 from enum import Enum
-from typing import Optional, List, Tuple
-
-from dateutil.parser import parse
+from typing import Optional, List, Tuple, Dict, Iterable, Callable, Any
 
 logger = logging.getLogger(__name__)
 
+from homelypy.filters import ChangeFilter
+from homelypy.history import HistoryStore
+from homelypy.metrics import MetricsSink
+from homelypy.timestamps import parse_timestamp, timestamp_at_least
 from homelypy.states import (
     State,
     BatteryState,
@@ -45,8 +47,32 @@ class Location:
         return self.name
 
 
+DEVICE_ATTRIBUTES = ("name", "serial_number", "location", "online", "model_id", "model_name")
+# The attributes SingleLocation indexes the devices by, besides the id
+INDEXED_ATTRIBUTES = ("serial_number", "model_name", "location")
+
+
+def _make_state_setter(feature: str, state_name: str, value_name: str, timestamp_name: str):
+    def setter(
+        device: "Device", value: Any, last_updated: datetime.datetime, change_filter: Optional[ChangeFilter]
+    ) -> Tuple[State, bool]:
+        state = getattr(device, feature)
+        if change_filter is not None and not change_filter.is_change(
+            feature, state_name, getattr(state, value_name), value
+        ):
+            setattr(state, timestamp_name, last_updated)
+            return state, False
+        setattr(state, value_name, value)
+        setattr(state, timestamp_name, last_updated)
+        return state, True
+
+    return setter
+
+
 @dataclass
 class Device:
+    __slots__ = ("id", "name", "serial_number", "location", "online", "model_id", "model_name")
+
     id: str
     name: str
     serial_number: str
@@ -58,8 +84,19 @@ class Device:
     def __str__(self):
         return f"{self.name} in {self.location}"
 
-    def update_state(self, changes: List[dict]):
-        """Updates the various features of the device based on the list of changes"""
+    def update_state(
+        self,
+        changes: List[dict],
+        change_filter: Optional[ChangeFilter] = None,
+        history: Optional[HistoryStore] = None,
+        metrics: Optional[MetricsSink] = None,
+    ) -> List[State]:
+        """
+        Updates the various features of the device based on the list of changes. Returns each updated state once.
+        With a change filter, states whose value did not meaningfully change only get their timestamp refreshed and
+        are not returned. With a history store, every numeric value is recorded. With metrics, changes for unknown
+        states are counted.
+        """
         # Expects the contents of the ["data"]["changes"] key.
         # {
         #     "type": "device-state-changed",
@@ -79,23 +116,62 @@ class Device:
         #         ],
         #     },
         # }
+        update_table = self._get_update_table()
         updated_states = []
         for change in changes:
-            try:
-                state = getattr(self, change["feature"])
-                setattr(state, change["stateName"], change["value"])
-                setattr(state, f"{change['stateName']}_last_updated", parse(change["lastUpdated"]))
+            setter = update_table.get((change["feature"], change["stateName"]))
+            if setter is None:
+                self._report_unknown_change(change)
+                if metrics is not None:
+                    metrics.increment("unknown_features_total", feature=change["feature"], state=change["stateName"])
+                continue
+            last_updated = change.get("lastUpdated")
+            if last_updated is not None:
+                last_updated = parse_timestamp(last_updated)
+            state, changed = setter(self, change["value"], last_updated, change_filter)
+            if history is not None:
+                history.record(self.id, change["feature"], change["stateName"], last_updated, change["value"])
+            if changed and all(state is not updated for updated in updated_states):
                 updated_states.append(state)
-            except AttributeError:
-                logger.exception(f"Device '{self}' does not have the feature {change['feature']}")
         return updated_states
 
+    @classmethod
+    def _get_update_table(cls) -> Dict[Tuple[str, str], Callable[..., Tuple[State, bool]]]:
+        """Returns the table mapping (feature, stateName) from the stream to a setter, built once per class."""
+        table = cls.__dict__.get("_update_table")
+        if table is None:
+            table = {}
+            for name, state_class in cls._state_fields():
+                for state_name, (value_name, timestamp_name) in state_class.stream_fields().items():
+                    table[(name, state_name)] = _make_state_setter(name, state_name, value_name, timestamp_name)
+            cls._update_table = table
+            cls._reported_unknown_changes = set()
+        return table
+
+    def _report_unknown_change(self, change: dict):
+        key = (change["feature"], change["stateName"])
+        if key not in self._reported_unknown_changes:
+            self._reported_unknown_changes.add(key)
+            logger.warning(
+                f"Device type {type(self).__name__} does not have the state {change['stateName']} "
+                f"in the feature {change['feature']}"
+            )
+
+    @classmethod
+    def _state_fields(cls) -> Tuple[Tuple[str, type], ...]:
+        """Returns the name and State subclass of each state field of the device class, computed once per class."""
+        state_fields = cls.__dict__.get("_state_fields_cache")
+        if state_fields is None:
+            state_fields = tuple(
+                (field.name, field.type)
+                for field in dataclasses.fields(cls)
+                if isinstance(field.type, type) and issubclass(field.type, State)
+            )
+            cls._state_fields_cache = state_fields
+        return state_fields
+
     @classmethod
     def create_from_rest_response(cls, device: dict) -> "Device":
-        state_fields = {}
-        for field in dataclasses.fields(cls):
-            if issubclass(field.type, State):
-                state_fields[field.name] = field.type.create_from_rest_response(device)
         return cls(
             device["id"],
             device["name"],
@@ -104,15 +180,35 @@ class Device:
             device["online"],
             device["modelId"],
             device["modelName"],
-            **state_fields,
+            **{name: state_class.create_from_rest_response(device) for name, state_class in cls._state_fields()},
         )
 
     def get_entities(self) -> list[State]:
-        return [getattr(self, field.name) for field in dataclasses.fields(self) if issubclass(field.type, State)]
+        return [getattr(self, name) for name, _ in self._state_fields()]
+
+    def update_from(self, other: "Device", change_filter: Optional[ChangeFilter] = None) -> Tuple[bool, List[State]]:
+        """
+        Updates this device in place from a freshly created device of the same class, keeping state values that are
+        newer than the fresh ones. Returns whether any of the device attributes changed, and the states that changed.
+        """
+        attributes_changed = False
+        for name in DEVICE_ATTRIBUTES:
+            value = getattr(other, name)
+            if getattr(self, name) != value:
+                setattr(self, name, value)
+                attributes_changed = True
+        changed_states = []
+        for name, _ in self._state_fields():
+            state = getattr(self, name)
+            if state.update_from(getattr(other, name), change_filter):
+                changed_states.append(state)
+        return attributes_changed, changed_states
 
 
 @dataclass
 class WindowSensor(Device):
+    __slots__ = ("battery", "diagnostic", "temperature", "alarm")
+
     battery: BatteryState
     diagnostic: DiagnosticState
     temperature: TemperatureState
@@ -121,6 +217,8 @@ class WindowSensor(Device):
 
 @dataclass
 class SmokeAlarm(Device):
+    __slots__ = ("battery", "diagnostic", "temperature", "alarm")
+
     battery: BatteryState
     diagnostic: DiagnosticState
     temperature: TemperatureState
@@ -129,6 +227,8 @@ class SmokeAlarm(Device):
 
 @dataclass
 class HeatAlarm(Device):
+    __slots__ = ("battery", "diagnostic", "temperature", "alarm")
+
     battery: BatteryState
     diagnostic: DiagnosticState
     temperature: TemperatureState
@@ -137,6 +237,8 @@ class HeatAlarm(Device):
 
 @dataclass
 class MotionSensorMini(Device):
+    __slots__ = ("battery", "diagnostic", "temperature", "alarm")
+
     battery: BatteryState
     diagnostic: DiagnosticState
     temperature: TemperatureState
@@ -145,6 +247,8 @@ class MotionSensorMini(Device):
 
 @dataclass
 class EMIHANPowersSensor(Device):
+    __slots__ = ("diagnostic", "metering")
+
     diagnostic: DiagnosticState
     metering: MeteringState
 
@@ -172,6 +276,20 @@ def create_device_from_rest_response(data: dict) -> Optional[Device]:
     return device_class.create_from_rest_response(data)
 
 
+@dataclass
+class LocationChanges:
+    """The changes found when refreshing a location from the REST API."""
+
+    added: List[Device] = dataclasses.field(default_factory=list)
+    removed: List[Device] = dataclasses.field(default_factory=list)
+    # Devices whose attributes or states changed, with the changed states
+    updated: List[Tuple[Device, List[State]]] = dataclasses.field(default_factory=list)
+    alarm_state_changed: bool = False
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.updated or self.alarm_state_changed)
+
+
 @dataclass
 class SingleLocation:
     location_id: str
@@ -181,12 +299,173 @@ class SingleLocation:
     alarm_state_last_updated: datetime.datetime
     user_role_at_location: str
     devices: list[Device]
+    change_filter: Optional[ChangeFilter] = dataclasses.field(default=None, repr=False, compare=False)
+    history: Optional[HistoryStore] = dataclasses.field(default=None, repr=False, compare=False)
+    metrics: Optional[MetricsSink] = dataclasses.field(default=None, repr=False, compare=False)
+    _devices_by_id: Dict[str, Device] = dataclasses.field(default_factory=dict, init=False, repr=False, compare=False)
+    _devices_by_serial_number: Dict[str, Device] = dataclasses.field(
+        default_factory=dict, init=False, repr=False, compare=False
+    )
+    _devices_by_model_name: Dict[str, List[Device]] = dataclasses.field(
+        default_factory=dict, init=False, repr=False, compare=False
+    )
+    _devices_by_location: Dict[str, List[Device]] = dataclasses.field(
+        default_factory=dict, init=False, repr=False, compare=False
+    )
+
+    def __post_init__(self):
+        self.reindex()
 
     def __str__(self):
         return f"{self.name} with {len(self.devices)} devices"
 
+    def __getstate__(self) -> dict:
+        # The metrics sink belongs to the running process, and may hold locks that cannot be pickled
+        return {**self.__dict__, "metrics": None}
+
+    def reindex(self):
+        """Rebuilds the device lookup indexes from self.devices. Call this if the device list is modified directly."""
+        # The indexes are built aside and then swapped in, so that lookups from other threads never see them empty
+        by_id: Dict[str, Device] = {}
+        by_serial_number: Dict[str, Device] = {}
+        by_model_name: Dict[str, List[Device]] = {}
+        by_location: Dict[str, List[Device]] = {}
+        for device in self.devices:
+            by_id[device.id] = device
+            by_serial_number[device.serial_number] = device
+            by_model_name.setdefault(device.model_name, []).append(device)
+            by_location.setdefault(device.location, []).append(device)
+        self._devices_by_id = by_id
+        self._devices_by_serial_number = by_serial_number
+        self._devices_by_model_name = by_model_name
+        self._devices_by_location = by_location
+
+    def _index_device(self, device: Device):
+        self._devices_by_id[device.id] = device
+        self._devices_by_serial_number[device.serial_number] = device
+        self._devices_by_model_name.setdefault(device.model_name, []).append(device)
+        self._devices_by_location.setdefault(device.location, []).append(device)
+
+    def _unindex_device(self, device: Device):
+        self._devices_by_id.pop(device.id, None)
+        if self._devices_by_serial_number.get(device.serial_number) is device:
+            del self._devices_by_serial_number[device.serial_number]
+        for index, key in (
+            (self._devices_by_model_name, device.model_name),
+            (self._devices_by_location, device.location),
+        ):
+            devices = index.get(key)
+            if devices is None:
+                continue
+            devices[:] = [d for d in devices if d is not device]
+            if not devices:
+                del index[key]
+
+    def add_device(self, device: Device):
+        """Adds a device to the location, replacing any existing device with the same id."""
+        existing = self._devices_by_id.get(device.id)
+        if existing is not None:
+            self.remove_device(existing.id)
+        self.devices.append(device)
+        self._index_device(device)
+
+    def remove_device(self, device_id: str) -> Optional[Device]:
+        """Removes the device with the given id from the location. Returns the removed device, if any."""
+        device = self._devices_by_id.get(device_id)
+        if device is None:
+            return None
+        self.devices[:] = [d for d in self.devices if d is not device]
+        self._unindex_device(device)
+        return device
+
+    def set_devices(self, devices: Iterable[Device]):
+        """Replaces all devices of the location, e.g. after refreshing from the REST API."""
+        self.devices = list(devices)
+        self.reindex()
+
+    def merge(self, fresh: "SingleLocation") -> LocationChanges:
+        """
+        Updates the location in place from a freshly fetched copy, keeping the existing Device and State objects of
+        devices that are still present, and state values that are newer than the fetched ones. Returns the changes.
+        """
+        changes = LocationChanges()
+        if fresh.alarm_state != self.alarm_state:
+            self.alarm_state = fresh.alarm_state
+            self.alarm_state_last_updated = fresh.alarm_state_last_updated
+            changes.alarm_state_changed = True
+        self.name = fresh.name
+        self.gateway_serial = fresh.gateway_serial
+        self.user_role_at_location = fresh.user_role_at_location
+        reindex = False
+        fresh_ids = set()
+        for fresh_device in fresh.devices:
+            fresh_ids.add(fresh_device.id)
+            device = self._devices_by_id.get(fresh_device.id)
+            if device is None or type(device) is not type(fresh_device):
+                if device is not None:
+                    changes.removed.append(self.remove_device(device.id))
+                self.add_device(fresh_device)
+                changes.added.append(fresh_device)
+                continue
+            indexed = [getattr(device, name) for name in INDEXED_ATTRIBUTES]
+            attributes_changed, states = device.update_from(fresh_device, self.change_filter)
+            reindex = reindex or indexed != [getattr(device, name) for name in INDEXED_ATTRIBUTES]
+            if attributes_changed or states:
+                changes.updated.append((device, states))
+        for device in [device for device in self.devices if device.id not in fresh_ids]:
+            changes.removed.append(self.remove_device(device.id))
+        if reindex:
+            self.reindex()
+        return changes
+
     def find_device(self, device_id) -> Optional[Device]:
-        return next(filter(lambda d: d.id == device_id, self.devices), None)
+        return self._devices_by_id.get(device_id)
+
+    def find_device_by_serial_number(self, serial_number: str) -> Optional[Device]:
+        return self._devices_by_serial_number.get(serial_number)
+
+    def find_devices_by_model_name(self, model_name: str) -> List[Device]:
+        return list(self._devices_by_model_name.get(model_name, ()))
+
+    def find_devices_by_location(self, location: str) -> List[Device]:
+        return list(self._devices_by_location.get(location, ()))
+
+    def apply_events(self, events: Iterable[dict]) -> List[Tuple[Device, List[State]]]:
+        """
+        Applies a batch of stream updates in one pass, e.g. when replaying a backlog. Takes the same "data" dicts as
+        update_device_state_from_stream. Only the latest change (by lastUpdated) of each device state is applied.
+        Returns each updated device with its changed states.
+        """
+        latest_changes: Dict[str, Dict[Tuple[str, str], dict]] = {}
+        for data in events:
+            device_changes = latest_changes.get(data["deviceId"])
+            if device_changes is None:
+                device_changes = latest_changes[data["deviceId"]] = {}
+            for change in data["changes"]:
+                key = (change["feature"], change["stateName"])
+                previous = device_changes.get(key)
+                if previous is None:
+                    device_changes[key] = change
+                    continue
+                # Changes without a timestamp are older than any with one, and of equal ones the last wins
+                last_updated = change.get("lastUpdated")
+                previous_last_updated = previous.get("lastUpdated")
+                if previous_last_updated is None or (
+                    last_updated is not None and timestamp_at_least(last_updated, previous_last_updated)
+                ):
+                    device_changes[key] = change
+        delta = []
+        for device_id, device_changes in latest_changes.items():
+            device = self._devices_by_id.get(device_id)
+            if device is None:
+                logger.warning(f"Did not find a device matching {device_id} when applying events")
+                if self.metrics is not None:
+                    self.metrics.increment("unknown_devices_total")
+                continue
+            states = device.update_state(list(device_changes.values()), self.change_filter, self.history, self.metrics)
+            if states:
+                delta.append((device, states))
+        return delta
 
     def update_device_state_from_stream(self, data: dict) -> Optional[Tuple[Device, List[State]]]:
         """
@@ -214,8 +493,10 @@ class SingleLocation:
         # }
         device = self.find_device(data["deviceId"])
         if device:
-            states = device.update_state(data["changes"])
+            states = device.update_state(data["changes"], self.change_filter, self.history, self.metrics)
             return device, states
         else:
             logger.warning(f"Did not find a device matching data update: {data}")
+            if self.metrics is not None:
+                self.metrics.increment("unknown_devices_total")
             return None
@@ -0,0 +1,134 @@
+"""Runs state change callbacks on worker threads so that slow callbacks do not stall the websocket."""
+import logging
+import threading
+from collections import deque
+from enum import Enum
+from typing import Any, Callable, Deque, Dict, Hashable, List, Optional
+
+from homelypy.devices import Device, SingleLocation
+from homelypy.states import State
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_QUEUE_SIZE = 1000
+
+
+class BackpressurePolicy(Enum):
+    # Wait for the workers to make room in the queue, stalling the websocket
+    BLOCK = "BLOCK"
+    # Discard the oldest queued event to make room for the new one
+    DROP_OLDEST = "DROP_OLDEST"
+    # Merge the event into an already queued event for the same device (or alarm), otherwise block
+    COALESCE_LATEST = "COALESCE_LATEST"
+
+
+class CallbackDispatcher:
+    """
+    Bounded queue between the websocket and a state change callback, processed by a pool of worker threads. The
+    dispatcher takes the same arguments as the callback, so pass it as state_change_callback to Homely.run_socket_io.
+    With more than one worker, events may be processed out of order.
+    """
+
+    def __init__(
+        self,
+        callback: Callable[[Optional[SingleLocation], Optional[Device], List[State]], Any],
+        max_queue_size: int = DEFAULT_MAX_QUEUE_SIZE,
+        workers: int = 1,
+        policy: BackpressurePolicy = BackpressurePolicy.BLOCK,
+    ):
+        self.callback = callback
+        self.max_queue_size = max_queue_size
+        self.policy = policy
+        self.received = 0
+        self.processed = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.failed = 0
+        self._queue: Deque[list] = deque()
+        self._pending: Dict[Hashable, list] = {}
+        self._condition = threading.Condition()
+        self._stopping = False
+        self._busy = 0
+        self._workers = [
+            threading.Thread(target=self._work, name=f"homely-dispatch-{i}", daemon=True) for i in range(workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def __enter__(self) -> "CallbackDispatcher":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._queue)
+
+    @staticmethod
+    def _key(single_location: Optional[SingleLocation], device: Optional[Device]) -> Hashable:
+        if device is not None:
+            return device.id
+        return "alarm", single_location.location_id if single_location is not None else None
+
+    def __call__(self, single_location: Optional[SingleLocation], device: Optional[Device], states: List[State]):
+        with self._condition:
+            self.received += 1
+            key = self._key(single_location, device)
+            if self.policy == BackpressurePolicy.COALESCE_LATEST:
+                entry = self._pending.get(key)
+                if entry is not None:
+                    entry[3].extend(state for state in states if all(state is not s for s in entry[3]))
+                    self.coalesced += 1
+                    return
+            while len(self._queue) >= self.max_queue_size and not self._stopping:
+                if self.policy == BackpressurePolicy.DROP_OLDEST:
+                    self._discard(self._queue.popleft())
+                    self.dropped += 1
+                else:
+                    self._condition.wait()
+            entry = [key, single_location, device, list(states)]
+            self._queue.append(entry)
+            if self.policy == BackpressurePolicy.COALESCE_LATEST:
+                self._pending[key] = entry
+            self._condition.notify_all()
+
+    def _discard(self, entry: list):
+        if self._pending.get(entry[0]) is entry:
+            del self._pending[entry[0]]
+
+    def _work(self):
+        while True:
+            with self._condition:
+                while not self._queue and not self._stopping:
+                    self._condition.wait()
+                if not self._queue:
+                    return
+                entry = self._queue.popleft()
+                self._discard(entry)
+                self._busy += 1
+                self._condition.notify_all()
+            failed = False
+            try:
+                self.callback(entry[1], entry[2], entry[3])
+            except Exception:
+                failed = True
+                logger.exception(f"State change callback failed for {entry[2] or entry[1]}")
+            with self._condition:
+                self._busy -= 1
+                self.processed += 1
+                self.failed += failed
+                self._condition.notify_all()
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        """Waits until all queued events have been processed. Returns False on timeout."""
+        with self._condition:
+            return self._condition.wait_for(lambda: not self._queue and not self._busy, timeout)
+
+    def stop(self, timeout: Optional[float] = None):
+        """Processes the remaining events and stops the workers."""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        for worker in self._workers:
+            worker.join(timeout)
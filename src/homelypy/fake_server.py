@@ -0,0 +1,292 @@
+"""
+Local stand-in for the Homely cloud, for end-to-end and load testing without touching the real service. Requires
+aiohttp, install with `pip install homelypy[async]`. It serves the oauth token and refresh, locations and home
+endpoints with synthetic locations, and emits device-state-changed events on socket.io at a configurable rate. The
+lastUpdated of every event is the time it was emitted, so clients can measure the end-to-end latency.
+
+    python -m homelypy.fake_server --port 8080 --locations 2 --devices 100 --rate 50
+
+Point the client at it with Homely(username, password, sdk_url="http://localhost:8080",
+web_socket_url="http://localhost:8080").
+"""
+import argparse
+import asyncio
+import datetime
+import logging
+import random
+import secrets
+import sys
+import time
+from typing import Dict, List, Optional, Set
+from urllib.parse import parse_qs
+
+import socketio
+from aiohttp import web
+
+from homelypy.homely import (
+    AUTHENTICATION_ENDPOINT,
+    LOCATIONS_ENDPOINT,
+    REFRESH_TOKEN_ENDPOINT,
+    SINGLE_LOCATION_ENDPOINT,
+)
+from homelypy.synthetic import STATE_VALUES, location_response
+
+logger = logging.getLogger(__name__)
+
+# AsyncServer.emit in python-socketio 4 passes bare coroutines to asyncio.wait, which Python 3.11 rejects, so there
+# the event is sent to the one client directly, as emit would. python-socketio 5 wraps them in tasks.
+_DIRECT_EMIT = sys.version_info >= (3, 11) and int(socketio.__version__.split(".")[0]) < 5
+
+
+async def emit_event(sio: socketio.AsyncServer, sid: str, data: dict):
+    """Sends an "event" message to one client."""
+    if _DIRECT_EMIT:
+        await sio._emit_internal(sid, "event", data, "/")
+    else:
+        await sio.emit("event", data, room=sid)
+
+
+def format_timestamp(value: datetime.datetime) -> str:
+    return value.strftime("%Y-%m-%dT%H:%M:%S.") + f"{value.microsecond // 1000:03d}Z"
+
+
+class FakeHomelyServer:
+    """
+    Fake Homely cloud. Every location gets a synthetic payload of device_count devices. Each location emits `rate`
+    device-state-changed events per second to its connected sockets, and with a disconnect_interval every socket is
+    dropped at that interval to exercise reconnects. Access tokens expire after token_lifetime seconds.
+    """
+
+    def __init__(
+        self,
+        username: str = "user",
+        password: str = "password",
+        location_count: int = 1,
+        device_count: int = 50,
+        rate: float = 10,
+        token_lifetime: int = 1800,
+        refresh_token_lifetime: int = 3600,
+        disconnect_interval: Optional[float] = None,
+        seed: int = 0,
+    ):
+        self.username = username
+        self.password = password
+        self.rate = rate
+        self.token_lifetime = token_lifetime
+        self.refresh_token_lifetime = refresh_token_lifetime
+        self.disconnect_interval = disconnect_interval
+        self.locations: Dict[str, dict] = {}
+        for i in range(location_count):
+            location = location_response(device_count, seed + i)
+            location["name"] = f"Synthetic home {i}"
+            self.locations[location["locationId"]] = location
+        self.random = random.Random(seed)
+        self.access_tokens: Dict[str, float] = {}
+        self.refresh_tokens: Dict[str, float] = {}
+        self.counters = {
+            "authentications": 0,
+            "refreshes": 0,
+            "rejected_requests": 0,
+            "connections": 0,
+            "forced_disconnects": 0,
+            "events_emitted": 0,
+        }
+        self._sockets: Dict[str, Set[str]] = {location_id: set() for location_id in self.locations}
+        self._tasks: List[asyncio.Task] = []
+        self._runner: Optional[web.AppRunner] = None
+        self.sio = socketio.AsyncServer(async_mode="aiohttp")
+        self.sio.on("connect", self._on_connect)
+        self.sio.on("disconnect", self._on_disconnect)
+        self.app = web.Application()
+        self.app.router.add_post(AUTHENTICATION_ENDPOINT, self._token)
+        self.app.router.add_post(REFRESH_TOKEN_ENDPOINT, self._refresh_token)
+        self.app.router.add_get(LOCATIONS_ENDPOINT, self._get_locations)
+        self.app.router.add_get(SINGLE_LOCATION_ENDPOINT + "/{location_id}", self._get_location)
+        self.sio.attach(self.app)
+
+    def _issue_tokens(self) -> web.Response:
+        access_token, refresh_token = secrets.token_hex(16), secrets.token_hex(16)
+        now = time.time()
+        self.access_tokens[access_token] = now + self.token_lifetime
+        self.refresh_tokens[refresh_token] = now + self.refresh_token_lifetime
+        return web.json_response(
+            {
+                "access_token": access_token,
+                "expires_in": self.token_lifetime,
+                "refresh_token": refresh_token,
+                "refresh_expires_in": self.refresh_token_lifetime,
+            },
+            status=201,
+        )
+
+    def _valid_access_token(self, authorization: Optional[str]) -> bool:
+        if not authorization or not authorization.startswith("Bearer "):
+            return False
+        return self.access_tokens.get(authorization[len("Bearer ") :], 0) > time.time()
+
+    def _reject(self) -> web.Response:
+        self.counters["rejected_requests"] += 1
+        return web.Response(status=401, text="Unauthorized")
+
+    async def _token(self, request: web.Request) -> web.Response:
+        data = await request.post()
+        if data.get("username") != self.username or data.get("password") != self.password:
+            return self._reject()
+        self.counters["authentications"] += 1
+        return self._issue_tokens()
+
+    async def _refresh_token(self, request: web.Request) -> web.Response:
+        data = await request.post()
+        if self.refresh_tokens.pop(data.get("refresh_token"), 0) <= time.time():
+            return self._reject()
+        self.counters["refreshes"] += 1
+        return self._issue_tokens()
+
+    async def _get_locations(self, request: web.Request) -> web.Response:
+        if not self._valid_access_token(request.headers.get("Authorization")):
+            return self._reject()
+        return web.json_response(
+            [
+                {
+                    "name": location["name"],
+                    "role": location["userRoleAtLocation"],
+                    "userId": self.username,
+                    "locationId": location_id,
+                    "gatewayserial": location["gatewayserial"],
+                }
+                for location_id, location in self.locations.items()
+            ]
+        )
+
+    async def _get_location(self, request: web.Request) -> web.Response:
+        if not self._valid_access_token(request.headers.get("Authorization")):
+            return self._reject()
+        location = self.locations.get(request.match_info["location_id"])
+        if location is None:
+            return web.Response(status=404, text="Not found")
+        return web.json_response(location)
+
+    async def _on_connect(self, sid: str, environ: dict):
+        query = parse_qs(environ.get("QUERY_STRING", ""))
+        authorization = environ.get("HTTP_AUTHORIZATION") or next(iter(query.get("token", [])), None)
+        location_id = environ.get("HTTP_LOCATIONID") or next(iter(query.get("locationId", [])), None)
+        if not self._valid_access_token(authorization) or location_id not in self.locations:
+            self.counters["rejected_requests"] += 1
+            return False
+        self.counters["connections"] += 1
+        self._sockets[location_id].add(sid)
+        return True
+
+    async def _on_disconnect(self, sid: str):
+        for sids in self._sockets.values():
+            sids.discard(sid)
+
+    def random_event(self, location_id: str) -> dict:
+        location = self.locations[location_id]
+        device = self.random.choice(location["devices"])
+        feature = self.random.choice([name for name in device["features"] if name != "diagnostic"] or ["diagnostic"])
+        state_name = self.random.choice(
+            [name for name in device["features"][feature]["states"] if name != "networklinkaddress"]
+        )
+        return {
+            "type": "device-state-changed",
+            "data": {
+                "deviceId": device["id"],
+                "gatewayId": location["gatewayserial"],
+                "locationId": location_id,
+                "modelId": device["modelId"],
+                "rootLocationId": location_id,
+                "changes": [
+                    {
+                        "feature": feature,
+                        "stateName": state_name,
+                        "value": STATE_VALUES[feature][state_name](self.random),
+                        "lastUpdated": format_timestamp(datetime.datetime.now(datetime.timezone.utc)),
+                    }
+                ],
+            },
+        }
+
+    async def _emit_events(self, location_id: str):
+        interval = 1 / self.rate
+        next_time = time.monotonic()
+        while True:
+            next_time += interval
+            await asyncio.sleep(max(next_time - time.monotonic(), 0))
+            sids = list(self._sockets[location_id])
+            if not sids:
+                continue
+            event = self.random_event(location_id)
+            for sid in sids:
+                await emit_event(self.sio, sid, event)
+                self.counters["events_emitted"] += 1
+
+    async def _disconnect_sockets(self):
+        while True:
+            await asyncio.sleep(self.disconnect_interval)
+            for sids in self._sockets.values():
+                for sid in list(sids):
+                    self.counters["forced_disconnects"] += 1
+                    await self.sio.disconnect(sid)
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Starts serving and emitting events. Returns the base URL to use for both sdk_url and web_socket_url."""
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        # The bound port, when asked for any free one
+        port = self._runner.addresses[0][1]
+        if self.rate > 0:
+            self._tasks = [asyncio.ensure_future(self._emit_events(location_id)) for location_id in self.locations]
+        if self.disconnect_interval:
+            self._tasks.append(asyncio.ensure_future(self._disconnect_sockets()))
+        return f"http://{host}:{port}"
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+
+async def _serve(server: FakeHomelyServer, host: str, port: int, report_interval: float):
+    url = await server.start(host, port)
+    logger.info(f"Fake Homely server listening on {url} for user '{server.username}'")
+    try:
+        while True:
+            await asyncio.sleep(report_interval)
+            logger.info(", ".join(f"{name}: {value}" for name, value in server.counters.items()))
+    finally:
+        await server.stop()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format="%(asctime)s %(name)-15s: %(levelname)-8s %(message)s")
+    logging.getLogger().setLevel(logging.INFO)
+    parser = argparse.ArgumentParser(prog="homelypy.fake_server", description="Local stand-in for the Homely API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--username", default="user")
+    parser.add_argument("--password", default="password")
+    parser.add_argument("--locations", type=int, default=1, help="Number of locations")
+    parser.add_argument("--devices", type=int, default=50, help="Number of devices per location")
+    parser.add_argument("--rate", type=float, default=10, help="Events per second per location")
+    parser.add_argument("--token-lifetime", type=int, default=1800, help="Access token lifetime in seconds")
+    parser.add_argument("--disconnect-interval", type=float, help="Drop all sockets at this interval in seconds")
+    parser.add_argument("--report-interval", type=float, default=10, help="Seconds between counter reports")
+    args = parser.parse_args()
+    fake_server = FakeHomelyServer(
+        args.username,
+        args.password,
+        args.locations,
+        args.devices,
+        args.rate,
+        args.token_lifetime,
+        disconnect_interval=args.disconnect_interval,
+    )
+    try:
+        asyncio.run(_serve(fake_server, args.host, args.port, args.report_interval))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,42 @@
+"""Filtering of the stream updates that do not meaningfully change a state."""
+from dataclasses import dataclass, field
+from typing import Any, Dict, Tuple, Union
+
+DeadbandKey = Union[str, Tuple[str, str]]
+
+
+@dataclass
+class ChangeFilter:
+    """
+    Decides whether an incoming value is a meaningful change of a state. Numeric values must differ by at least the
+    deadband of the state, looked up by (feature, stateName) and then by feature, e.g.
+    ChangeFilter({"temperature": 0.1, ("diagnostic", "networklinkstrength"): 1}). Updates that are not meaningful only
+    refresh the timestamp of the state, so the stored value stays the last meaningful one, and they are counted in
+    timestamp_only_updates.
+    """
+
+    deadbands: Dict[DeadbandKey, float] = field(default_factory=dict)
+    timestamp_only_updates: Dict[Tuple[str, str], int] = field(default_factory=dict)
+
+    def deadband(self, feature: str, state_name: str) -> float:
+        deadband = self.deadbands.get((feature, state_name))
+        if deadband is None:
+            deadband = self.deadbands.get(feature, 0)
+        return deadband
+
+    def is_change(self, feature: str, state_name: str, current: Any, value: Any) -> bool:
+        if current == value:
+            changed = False
+        elif (
+            isinstance(current, (int, float))
+            and isinstance(value, (int, float))
+            and not isinstance(current, bool)
+            and not isinstance(value, bool)
+        ):
+            changed = abs(value - current) >= self.deadband(feature, state_name)
+        else:
+            changed = True
+        if not changed:
+            key = (feature, state_name)
+            self.timestamp_only_updates[key] = self.timestamp_only_updates.get(key, 0) + 1
+        return changed
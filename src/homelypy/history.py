@@ -0,0 +1,161 @@
+"""Bounded in-process history of the numeric device states, kept in compact typed arrays."""
+import datetime
+from array import array
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple, Union
+
+DEFAULT_CAPACITY = 256
+
+Time = Union[datetime.datetime, float]
+SeriesKey = Tuple[str, str, str]
+
+
+def _seconds(value: Optional[Time], default: float) -> float:
+    if value is None:
+        return default
+    if isinstance(value, datetime.datetime):
+        return value.timestamp()
+    return value
+
+
+@dataclass
+class Aggregate:
+    count: int
+    min: float
+    max: float
+    mean: float
+    # Change of the value per second between the first and the last sample of the window
+    rate: Optional[float]
+
+
+class RingBuffer:
+    """Fixed capacity buffer of (timestamp, value) samples with timestamps in seconds since the epoch."""
+
+    __slots__ = ("capacity", "timestamps", "values", "start")
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        # The arrays grow up to the capacity, after which the oldest sample is overwritten
+        self.timestamps = array("d")
+        self.values = array("d")
+        self.start = 0
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    @property
+    def last_timestamp(self) -> Optional[float]:
+        if not self.timestamps:
+            return None
+        return self.timestamps[self.start - 1]
+
+    def append(self, timestamp: float, value: float):
+        if len(self.timestamps) < self.capacity:
+            self.timestamps.append(timestamp)
+            self.values.append(value)
+        else:
+            self.timestamps[self.start] = timestamp
+            self.values[self.start] = value
+            self.start = (self.start + 1) % self.capacity
+
+    def ordered(self) -> Tuple[array, array]:
+        """Returns copies of the timestamps and values, oldest first."""
+        if self.start == 0:
+            return self.timestamps[:], self.values[:]
+        return (
+            self.timestamps[self.start :] + self.timestamps[: self.start],
+            self.values[self.start :] + self.values[: self.start],
+        )
+
+    def window(self, since: float, until: float) -> Tuple[array, array]:
+        timestamps, values = self.ordered()
+        first = bisect_left(timestamps, since)
+        last = bisect_right(timestamps, until)
+        return timestamps[first:last], values[first:last]
+
+    def memory_usage(self) -> int:
+        return self.capacity * (self.timestamps.itemsize + self.values.itemsize)
+
+
+class HistoryStore:
+    """
+    Keeps the last `capacity` samples of every numeric state per device, e.g. temperature or metering demand. Set it as
+    SingleLocation.history, or pass it to Device.update_state, to record every update from the stream. Samples older
+    than the latest one of their series are ignored and counted in out_of_order.
+    """
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.out_of_order = 0
+        self._series: Dict[SeriesKey, RingBuffer] = {}
+
+    def record(self, device_id: str, feature: str, state_name: str, last_updated: datetime.datetime, value):
+        if value is None or last_updated is None or not isinstance(value, (int, float)) or isinstance(value, bool):
+            return
+        key = (device_id, feature, state_name)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = RingBuffer(self.capacity)
+        timestamp = last_updated.timestamp()
+        if series.last_timestamp is not None and timestamp < series.last_timestamp:
+            self.out_of_order += 1
+            return
+        series.append(timestamp, value)
+
+    def keys(self) -> List[SeriesKey]:
+        return list(self._series)
+
+    def memory_usage(self) -> int:
+        """Returns the number of bytes the sample arrays can grow to."""
+        return sum(series.memory_usage() for series in self._series.values())
+
+    def series(
+        self, device_id: str, feature: str, state_name: str, since: Optional[Time] = None, until: Optional[Time] = None
+    ) -> Tuple[array, array]:
+        """Returns the timestamps (seconds since the epoch) and values within the window, oldest first."""
+        series = self._series.get((device_id, feature, state_name))
+        if series is None:
+            return array("d"), array("d")
+        return series.window(_seconds(since, float("-inf")), _seconds(until, float("inf")))
+
+    def aggregate(
+        self, device_id: str, feature: str, state_name: str, since: Optional[Time] = None, until: Optional[Time] = None
+    ) -> Optional[Aggregate]:
+        timestamps, values = self.series(device_id, feature, state_name, since, until)
+        if not values:
+            return None
+        duration = timestamps[-1] - timestamps[0]
+        return Aggregate(
+            len(values),
+            min(values),
+            max(values),
+            sum(values) / len(values),
+            (values[-1] - values[0]) / duration if duration > 0 else None,
+        )
+
+    def resample(
+        self,
+        device_id: str,
+        feature: str,
+        state_name: str,
+        interval: float,
+        since: Optional[Time] = None,
+        until: Optional[Time] = None,
+    ) -> List[Tuple[float, float]]:
+        """
+        Returns the mean value of each interval (in seconds) that has samples, as (interval start, mean) pairs. The
+        intervals are aligned to the start of the window, or to the first sample if there is no start.
+        """
+        timestamps, values = self.series(device_id, feature, state_name, since, until)
+        if not timestamps:
+            return []
+        origin = _seconds(since, timestamps[0])
+        resampled = []
+        first = 0
+        while first < len(timestamps):
+            bucket = origin + ((timestamps[first] - origin) // interval) * interval
+            last = bisect_left(timestamps, bucket + interval, first)
+            resampled.append((bucket, sum(values[first:last]) / (last - first)))
+            first = last
+        return resampled
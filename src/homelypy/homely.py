@@ -1,24 +1,39 @@
 import datetime
 import logging
-
-from dateutil.parser import parse
-
-logging.basicConfig(
-    format="%(asctime)s %(threadName)-15s %(name)-15s: %(levelname)-8s %(message)s",
-    datefmt="%d/%m/%Y %H:%M:%S",
-)
 import argparse
-import json
+import contextlib
+import gzip
+import shutil
+import tempfile
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from getpass import getpass
-from typing import Callable, Dict, List, Tuple, Any, Optional
+from typing import TYPE_CHECKING, Callable, Dict, Iterator, List, Tuple, Any, Optional, BinaryIO
+
+from homelypy.coalescing import EventCoalescer
+from homelypy.devices import (
+    Location,
+    SingleLocation,
+    create_device_from_rest_response,
+    UnknownDeviceException,
+    Device,
+    LocationChanges,
+)
+from homelypy.metrics import NULL_METRICS, MetricsSink
+from homelypy.reconnect import ReconnectScheduler
+from homelypy.snapshot import LocationCache
+from homelypy.states import State
+from homelypy.streaming import LocationStream
+from homelypy.tokens import TokenCache, TokenManager
+from homelypy.timestamps import parse_timestamp
 
-import requests
-import socketio
-import websocket
+if TYPE_CHECKING:
+    # The transports are imported when first used, so that the data model can be used without loading them
+    import requests
+    import socketio
 
-from homelypy.devices import Location, SingleLocation, create_device_from_rest_response, UnknownDeviceException, Device
-from homelypy.states import State
+    from homelypy.recording import EventRecorder
 
 WEB_SOCKET_URL = "wss://sdk.iotiliti.cloud"
 
@@ -28,6 +43,13 @@ LOCATIONS_ENDPOINT = "/homely/locations"
 SINGLE_LOCATION_ENDPOINT = "/homely/home"
 REFRESH_TOKEN_ENDPOINT = "/homely/oauth/refresh-token"
 
+DEFAULT_TIMEOUT = 30
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_BACKOFF_FACTOR = 0.5
+DEFAULT_POOL_MAXSIZE = 10
+RETRY_STATUS_CODES = (500, 502, 503, 504)
+
 logger = logging.getLogger(__name__)
 
 
@@ -39,13 +61,124 @@ class AuthenticationFailedException(Exception):
     pass
 
 
-class Homely:
-    single_location: SingleLocation
-    state_change_callback: Callable[[SingleLocation, Device, List[State]], Any]
-    sio: socketio.Client
-
-    def __init__(self, username: str, password: str):
+def create_session(
+    max_retries: int = DEFAULT_MAX_RETRIES,
+    backoff_factor: float = DEFAULT_BACKOFF_FACTOR,
+    pool_maxsize: int = DEFAULT_POOL_MAXSIZE,
+) -> "requests.Session":
+    """
+    Creates a session with keep-alive connection pooling, retrying connection errors and 5xx responses with
+    exponential backoff.
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    retry_arguments = dict(
+        total=max_retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=RETRY_STATUS_CODES,
+        raise_on_status=False,
+    )
+    methods = frozenset({"GET", "POST"})
+    try:
+        retry = Retry(allowed_methods=methods, **retry_arguments)
+    except TypeError:
+        # urllib3 < 1.26
+        retry = Retry(method_whitelist=methods, **retry_arguments)
+    adapter = HTTPAdapter(max_retries=retry, pool_connections=pool_maxsize, pool_maxsize=pool_maxsize)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def create_locations(data: List[dict]) -> List[Location]:
+    """Creates the locations from the response of the locations endpoint."""
+    return [
+        Location(
+            location_data["name"],
+            location_data["role"],
+            location_data["userId"],
+            location_data["locationId"],
+            location_data["gatewayserial"],
+        )
+        for location_data in data
+    ]
+
+
+def create_single_location(data: dict) -> SingleLocation:
+    """Creates the location with all its known devices from the response of the home endpoint."""
+    devices = []
+    for device in data["devices"]:
+        try:
+            devices.append(create_device_from_rest_response(device))
+        except UnknownDeviceException as ex:
+            logger.error(str(ex))
+    return SingleLocation(
+        data["locationId"],
+        data["gatewayserial"],
+        data["name"],
+        data["alarmState"],
+        datetime.datetime.now(datetime.timezone.utc),
+        data["userRoleAtLocation"],
+        devices,
+    )
+
+
+def apply_stream_event(
+    single_location: SingleLocation, event: dict
+) -> Optional[Tuple[Optional[SingleLocation], Optional[Device], List[State]]]:
+    """
+    Applies an "event" message from the websocket to the location. Returns the arguments for the state change
+    callback, or None if no state was updated.
+    """
+    # {
+    #     "type": "device-state-changed",
+    #     "data": {
+    #         "deviceId": "ad5d19b5-3988-4ad2-96c0-08f6283e073a",
+    #         "gatewayId": "3b0187f4-878e-4b51-af2b-fc563b81f137",
+    #         "locationId": "48617520-863c-4e27-9a05-4ce3cce50f8e",
+    #         "modelId": "87fa1ae0-824f-4d42-be7a-cc5b6c7b1e35",
+    #         "rootLocationId": "d14a27d8-311c-41d8-b8c1-08b757c2253f",
+    #         "changes": [
+    #             {
+    #                 "feature": "temperature",
+    #                 "stateName": "temperature",
+    #                 "value": 4.8,
+    #                 "lastUpdated": "2023-01-25T10:27:07.786Z",
+    #             }
+    #         ],
+    #     },
+    # }
+    if event["type"] == "device-state-changed":
+        result = single_location.update_device_state_from_stream(event["data"])
+        if result is None or not result[1]:
+            return None
+        device, states = result
+        return None, device, states
+    elif event["type"] == "alarm-state-changed":
+        single_location.alarm_state = event["data"]["state"]
+        single_location.alarm_state_last_updated = parse_timestamp(event["data"]["timestamp"])
+        return single_location, None, []
+    return None
+
+
+class HomelyBase:
+    """Credentials and token bookkeeping shared by the synchronous and asynchronous clients."""
+
+    def __init__(
+        self,
+        username: str,
+        password: str,
+        sdk_url: str = SDK_URL,
+        web_socket_url: str = WEB_SOCKET_URL,
+        metrics: Optional[MetricsSink] = None,
+    ):
         super().__init__()
+        self.sdk_url = sdk_url
+        self.web_socket_url = web_socket_url
+        self.metrics = NULL_METRICS if metrics is None else metrics
         self.refresh_expires_in = 0
         self.expires_in = 0
         self.authentication_time = 0
@@ -54,58 +187,164 @@ class Homely:
         self.username = username
         self.password = password
 
-    def _register_callbacks(self):
-        @self.sio.event
-        def connect():
-            logger.info("websocket: connected to server")
+    def url(self, endpoint: str) -> str:
+        return self.sdk_url + endpoint
+
+    def store_authentication_information(self, data: Dict, authentication_time: Optional[float] = None):
+        self.access_token = data["access_token"]
+        self.authentication_time = time.time() if authentication_time is None else authentication_time
+        self.expires_in = data["expires_in"]
+        self.refresh_token = data["refresh_token"]
+        self.refresh_expires_in = data["refresh_expires_in"]
 
-        @self.sio.event
+    def authentication_information(self) -> Dict:
+        """Returns the tokens in the format of the token endpoint, with the time they were issued."""
+        return {
+            "access_token": self.access_token,
+            "expires_in": self.expires_in,
+            "refresh_token": self.refresh_token,
+            "refresh_expires_in": self.refresh_expires_in,
+            "authentication_time": self.authentication_time,
+        }
+
+    def invalidate_authentication_information(self):
+        self.refresh_expires_in = -1
+        self.expires_in = -1
+
+    def authentication_required(self) -> bool:
+        return time.time() - self.authentication_time > self.refresh_expires_in - 2
+
+    def refresh_required(self) -> bool:
+        return time.time() - self.authentication_time > self.expires_in - 2
+
+    def bearer_header(self) -> Dict:
+        return {"Authorization": f"Bearer {self.access_token}"}
+
+
+class Homely(HomelyBase):
+    single_location: Optional[SingleLocation] = None
+    state_change_callback: Optional[Callable[[SingleLocation, Device, List[State]], Any]] = None
+    sio: "socketio.Client"
+
+    def __init__(
+        self,
+        username: str,
+        password: str,
+        session: Optional["requests.Session"] = None,
+        timeout: float = DEFAULT_TIMEOUT,
+        sdk_url: str = SDK_URL,
+        web_socket_url: str = WEB_SOCKET_URL,
+        metrics: Optional[MetricsSink] = None,
+        token_cache: Optional[TokenCache] = None,
+        reconnect_scheduler: Callable[[], ReconnectScheduler] = ReconnectScheduler,
+        recorder: Optional["EventRecorder"] = None,
+    ):
+        """
+        If no session is given, a pooled session with retries is created using create_session(). Pass your own
+        session to control pooling and retries yourself. The timeout applies to every REST call. The URLs can point
+        to another server, such as homelypy.fake_server. Pass a Metrics instance (or another MetricsSink) to measure
+        the REST calls, authentication, reconnects and event processing. With a token cache, such as a
+        FileTokenCache, processes share their tokens instead of each logging in. Each websocket gets its own
+        scheduler from reconnect_scheduler, e.g. functools.partial(ReconnectScheduler, max_delay=60). An
+        EventRecorder journals every event the websockets receive.
+        """
+        super().__init__(username, password, sdk_url, web_socket_url, metrics)
+        self._owns_session = session is None
+        self.session = create_session() if session is None else session
+        self.timeout = timeout
+        self.single_locations: Dict[str, SingleLocation] = {}
+        self.sio_clients: Dict[str, "socketio.Client"] = {}
+        self.coalescer: Optional[EventCoalescer] = None
+        self.location_caches: Dict[str, LocationCache] = {}
+        self.token_manager = TokenManager(self, token_cache)
+        # Monotonic time each location lost its websocket connection, until it connects again
+        self._disconnected_at: Dict[str, float] = {}
+        self.reconnect_scheduler = reconnect_scheduler
+        self.reconnect_schedulers: Dict[str, ReconnectScheduler] = {}
+        self.recorder = recorder
+        # Events held back per location while it is refreshed, so that they apply on top of the fetched state
+        self._held_events: Dict[str, List[dict]] = {}
+        self._held_events_lock = threading.Lock()
+
+    def _register_callbacks(self, sio: "socketio.Client", single_location: SingleLocation):
+        @sio.event
+        def connect():
+            logger.info(f"websocket: connected to server for location {single_location}")
+            self.reconnect_schedulers[single_location.location_id].connected()
+            disconnected_at = self._disconnected_at.pop(single_location.location_id, None)
+            if disconnected_at is not None:
+                self.metrics.increment("reconnects_total")
+                self.metrics.observe("reconnect_duration_seconds", time.monotonic() - disconnected_at)
+                try:
+                    self.resync_location(single_location)
+                except Exception:
+                    logger.exception(f"Failed resyncing location {single_location} after reconnecting")
+
+        @sio.event
         def disconnect():
-            logger.info("websocket: disconnected from server")
+            logger.info(f"websocket: disconnected from server for location {single_location}")
+            self.reconnect_schedulers[single_location.location_id].disconnected()
+            self._disconnected_at.setdefault(single_location.location_id, time.monotonic())
             # Disconnected, refresh login
-            self.sio.connection_headers = self.build_connection_header()
+            sio.connection_headers = self.build_connection_header(single_location)
 
-        @self.sio.on("event")
+        @sio.on("event")
         def on_message(data):
-            # logger.info(data)
-            # {
-            #     "type": "device-state-changed",
-            #     "data": {
-            #         "deviceId": "ad5d19b5-3988-4ad2-96c0-08f6283e073a",
-            #         "gatewayId": "3b0187f4-878e-4b51-af2b-fc563b81f137",
-            #         "locationId": "48617520-863c-4e27-9a05-4ce3cce50f8e",
-            #         "modelId": "87fa1ae0-824f-4d42-be7a-cc5b6c7b1e35",
-            #         "rootLocationId": "d14a27d8-311c-41d8-b8c1-08b757c2253f",
-            #         "changes": [
-            #             {
-            #                 "feature": "temperature",
-            #                 "stateName": "temperature",
-            #                 "value": 4.8,
-            #                 "lastUpdated": "2023-01-25T10:27:07.786Z",
-            #             }
-            #         ],
-            #     },
-            # }
-            if data["type"] == "device-state-changed":
-                if self.single_location:
-                    device, states = self.single_location.update_device_state_from_stream(data["data"])
-                    if self.state_change_callback:
-                        self.state_change_callback(None, device, states)
-            elif data["type"] == "alarm-state-changed":
-                if self.single_location:
-                    self.single_location.alarm_state = data["data"]["state"]
-                    self.single_location.alarm_state_last_updated = parse(data["data"]["timestamp"])
-                    if self.state_change_callback:
-                        self.state_change_callback(self.single_location, None, [])
-
-    @staticmethod
-    def url(endpoint: str) -> str:
-        return SDK_URL + endpoint
+            if self.recorder is not None:
+                self.recorder.record(data)
+            self.metrics.increment("events_received_total", type=data.get("type"))
+            if self.coalescer is not None:
+                self.coalescer.add(self.route_event(data, single_location), data)
+            else:
+                self.handle_event(self.route_event(data, single_location), data)
+
+    def handle_event(self, single_location: SingleLocation, event: dict):
+        """Applies a stream event to the location, or holds it back until the location has been refreshed."""
+        with self._held_events_lock:
+            held = self._held_events.get(single_location.location_id)
+            if held is not None:
+                held.append(event)
+                return
+        self._apply_event(single_location, event)
+
+    def _apply_event(self, single_location: SingleLocation, event: dict):
+        start = time.perf_counter()
+        result = apply_stream_event(single_location, event)
+        self.metrics.observe("event_processing_seconds", time.perf_counter() - start, type=event["type"])
+        cache = self.location_caches.get(single_location.location_id)
+        if cache is not None:
+            cache.record(single_location, event)
+        if result is not None:
+            self.metrics.increment("events_applied_total", type=event["type"])
+            if self.state_change_callback:
+                with self.metrics.time("callback_duration_seconds"):
+                    self.state_change_callback(*result)
+
+    def route_event(self, event: dict, default: SingleLocation) -> SingleLocation:
+        """Finds the streamed location an event belongs to from its locationId or rootLocationId."""
+        data = event.get("data") or {}
+        for key in ("rootLocationId", "locationId"):
+            single_location = self.single_locations.get(data.get(key))
+            if single_location is not None:
+                return single_location
+        return default
+
+    def _request(self, method: str, endpoint: str, path: str = "", **kwargs) -> "requests.Response":
+        """Sends a request to the endpoint (with the path appended), recording its latency and status."""
+        send = self.session.post if method == "POST" else self.session.get
+        status = "error"
+        start = time.perf_counter()
+        try:
+            response = send(self.url(endpoint) + path, timeout=self.timeout, **kwargs)
+            status = str(response.status_code)
+            return response
+        finally:
+            self.metrics.observe("rest_request_duration_seconds", time.perf_counter() - start, endpoint=endpoint)
+            self.metrics.increment("rest_requests_total", endpoint=endpoint, status=status)
 
     def authenticate(self):
-        response = requests.post(
-            self.url(AUTHENTICATION_ENDPOINT),
-            data={"username": self.username, "password": self.password},
+        response = self._request(
+            "POST", AUTHENTICATION_ENDPOINT, data={"username": self.username, "password": self.password}
         )
         if response.status_code == 401:
             raise AuthenticationFailedException(response.text)
@@ -113,111 +352,340 @@ class Homely:
             raise ConnectionFailedException(response.text)
         data = response.json()
         self.store_authentication_information(data)
-
-    def store_authentication_information(self, data: Dict):
-        self.access_token = data["access_token"]
-        self.authentication_time = time.time()
-        self.expires_in = data["expires_in"]
-        self.refresh_token = data["refresh_token"]
-        self.refresh_expires_in = data["refresh_expires_in"]
+        self.metrics.increment("authentications_total")
 
     def reauthenticate(self):
-        response = requests.post(
-            self.url(REFRESH_TOKEN_ENDPOINT),
-            data={"refresh_token": self.refresh_token},
-        )
+        response = self._request("POST", REFRESH_TOKEN_ENDPOINT, data={"refresh_token": self.refresh_token})
         if response.status_code != 201:
-            self.refresh_expires_in = -1
-            self.expires_in = -1
+            self.invalidate_authentication_information()
             raise ConnectionFailedException(response.text)
         data = response.json()
         self.store_authentication_information(data)
+        self.metrics.increment("token_refreshes_total")
 
     def authenticate_if_required(self):
-        if time.time() - self.authentication_time > self.refresh_expires_in - 2:
-            self.authenticate()
-        elif time.time() - self.authentication_time > self.expires_in - 2:
-            self.reauthenticate()
+        # The token is shared by all threads, the token manager renews it once for all of them
+        self.token_manager.ensure_valid()
 
     @property
     def authorisation_header(self) -> Dict:
         self.authenticate_if_required()
-        return {"Authorization": f"Bearer {self.access_token}"}
+        return self.bearer_header()
 
     def get_locations(self) -> List[Location]:
-        response = requests.get(self.url(LOCATIONS_ENDPOINT), headers=self.authorisation_header)
+        response = self._request("GET", LOCATIONS_ENDPOINT, headers=self.authorisation_header)
         if response.status_code != 200:
             raise ConnectionFailedException(response.text)
-        return [
-            Location(
-                location_data["name"],
-                location_data["role"],
-                location_data["userId"],
-                location_data["locationId"],
-                location_data["gatewayserial"],
-            )
-            for location_data in response.json()
-        ]
+        return create_locations(response.json())
 
     def get_location_json(self, location_id) -> dict:
-        response = requests.get(
-            self.url(SINGLE_LOCATION_ENDPOINT) + f"/{location_id}",
-            headers=self.authorisation_header,
-        )
+        response = self._request("GET", SINGLE_LOCATION_ENDPOINT, f"/{location_id}", headers=self.authorisation_header)
         if response.status_code != 200:
             raise ConnectionFailedException(response.text)
         return response.json()
 
+    def download_location_json(
+        self, location_id, output: BinaryIO, single_line: bool = False, chunk_size: int = DOWNLOAD_CHUNK_SIZE
+    ) -> int:
+        """
+        Streams the raw JSON for the location to the binary file object without holding the whole response in
+        memory. With single_line, line breaks are replaced by spaces, which is safe since JSON strings cannot contain
+        raw line breaks. Returns the number of bytes written.
+        """
+        with self._request(
+            "GET", SINGLE_LOCATION_ENDPOINT, f"/{location_id}", headers=self.authorisation_header, stream=True
+        ) as response:
+            if response.status_code != 200:
+                raise ConnectionFailedException(response.text)
+            written = 0
+            for chunk in response.iter_content(chunk_size):
+                if single_line:
+                    chunk = chunk.replace(b"\r", b" ").replace(b"\n", b" ")
+                output.write(chunk)
+                written += len(chunk)
+        return written
+
     def get_location(self, location_id) -> SingleLocation:
-        data = self.get_location_json(location_id)
-        devices = []
-        for device in data["devices"]:
+        return create_single_location(self.get_location_json(location_id))
+
+    def iter_location(self, location_id, chunk_size: int = DOWNLOAD_CHUNK_SIZE) -> LocationStream:
+        """
+        Parses the location while it downloads, for locations too large to hold as JSON. Iterate the returned stream
+        to get each device as soon as it arrives, or call to_single_location() on it.
+        """
+        response = self._request(
+            "GET", SINGLE_LOCATION_ENDPOINT, f"/{location_id}", headers=self.authorisation_header, stream=True
+        )
+        if response.status_code != 200:
+            response.close()
+            raise ConnectionFailedException(response.text)
+
+        def chunks():
+            with response:
+                yield from response.iter_content(chunk_size)
+
+        return LocationStream(chunks())
+
+    def refresh_location(self, single_location: SingleLocation) -> LocationChanges:
+        """
+        Fetches the location again and updates the existing location in place, keeping the Device and State objects
+        of the devices that are still present. Events streamed for the location meanwhile are applied afterwards.
+        Returns the changes.
+        """
+        with self._holding_events(single_location):
+            return single_location.merge(self.get_location(single_location.location_id))
+
+    @contextlib.contextmanager
+    def _holding_events(self, single_location: SingleLocation) -> Iterator[None]:
+        """
+        Holds back the stream events of the location, which the websocket threads deliver while the location is being
+        fetched, and applies them in order when the block exits.
+        """
+        location_id = single_location.location_id
+        with self._held_events_lock:
+            if location_id in self._held_events:
+                # Already held by an enclosing block, which applies them
+                nested = True
+            else:
+                nested = False
+                self._held_events[location_id] = []
+        try:
+            yield
+        finally:
+            if not nested:
+                try:
+                    while True:
+                        with self._held_events_lock:
+                            events = self._held_events[location_id]
+                            if not events:
+                                del self._held_events[location_id]
+                                break
+                            self._held_events[location_id] = []
+                        for event in events:
+                            self._apply_held_event(single_location, event)
+                finally:
+                    # Only left behind if applying failed unexpectedly, stop holding so that the stream goes on
+                    with self._held_events_lock:
+                        events = self._held_events.pop(location_id, None)
+                    for event in events or ():
+                        self._apply_held_event(single_location, event)
+
+    def _apply_held_event(self, single_location: SingleLocation, event: dict):
+        # A failing callback must not keep the remaining held events from being applied
+        try:
+            self._apply_event(single_location, event)
+        except Exception:
+            logger.exception(f"Failed applying held back event to location {single_location}: {event}")
+
+    def resync_location(self, single_location: SingleLocation) -> LocationChanges:
+        """
+        Refreshes a streamed location after its websocket was down, and reports the state changes missed meanwhile
+        to the state change callback, as if they had been streamed. Events streamed during the resync are applied and
+        reported afterwards. Returns the changes.
+        """
+        with self._holding_events(single_location):
+            changes = self.refresh_location(single_location)
+            self.metrics.increment("resyncs_total")
+            cache = self.location_caches.get(single_location.location_id)
+            if cache is not None:
+                self._save_snapshot(single_location, cache)
+            logger.info(
+                f"Resynced location {single_location}: {len(changes.added)} added, {len(changes.removed)} removed "
+                f"and {len(changes.updated)} updated devices"
+            )
+            if self.state_change_callback:
+                if changes.alarm_state_changed:
+                    self.state_change_callback(single_location, None, [])
+                for device, states in changes.updated:
+                    if states:
+                        self.state_change_callback(None, device, states)
+        return changes
+
+    def warm_start_location(self, location_id, cache: LocationCache) -> SingleLocation:
+        """
+        Restores the location from the local snapshot and journal, so that streaming can begin immediately, and
+        reconciles it with the REST API in a background thread. Without a snapshot, the location is fetched as usual.
+        Events streamed for the location are journaled in the cache from now on.
+        """
+        single_location, events = cache.load()
+        if single_location is None:
+            single_location = self.get_location(location_id)
+            cache.save_snapshot(single_location)
+        else:
+            for event in events:
+                apply_stream_event(single_location, event)
+            threading.Thread(
+                target=self._reconcile_location,
+                args=(single_location, cache),
+                name=f"homely-reconcile-{single_location.name}",
+                daemon=True,
+            ).start()
+        self.location_caches[location_id] = cache
+        return single_location
+
+    def _reconcile_location(self, single_location: SingleLocation, cache: LocationCache):
+        # The snapshot is taken while the streamed events are held back, so that no other thread changes the location
+        with self._holding_events(single_location):
             try:
-                devices.append(create_device_from_rest_response(device))
-            except UnknownDeviceException as ex:
-                logger.error(str(ex))
-        return SingleLocation(
-            data["locationId"],
-            data["gatewayserial"],
-            data["name"],
-            data["alarmState"],
-            datetime.datetime.now(datetime.timezone.utc),
-            data["userRoleAtLocation"],
-            devices,
+                changes = self.refresh_location(single_location)
+            except Exception:
+                logger.exception(f"Failed reconciling location {single_location} with the REST API")
+                return
+            self._save_snapshot(single_location, cache)
+        logger.info(
+            f"Reconciled location {single_location} with the REST API: {len(changes.added)} added, "
+            f"{len(changes.removed)} removed and {len(changes.updated)} updated devices"
         )
 
-    def build_connection_header(self) -> dict:
-        return {**self.authorisation_header, "locationId": self.single_location.location_id}
+    @staticmethod
+    def _save_snapshot(single_location: SingleLocation, cache: LocationCache):
+        try:
+            cache.save_snapshot(single_location)
+        except Exception:
+            logger.exception(f"Failed saving a snapshot of location {single_location}")
+
+    def close(self):
+        """Stops renewing the token and closes the session, unless it was provided by the caller."""
+        self.token_manager.stop()
+        if self._owns_session:
+            self.session.close()
+        for cache in self.location_caches.values():
+            cache.close()
+
+    def build_connection_header(self, single_location: Optional[SingleLocation] = None) -> dict:
+        if single_location is None:
+            single_location = self.single_location
+        return {**self.authorisation_header, "locationId": single_location.location_id}
 
     def run_socket_io(
         self,
         single_location: SingleLocation,
         state_change_callback: Optional[Callable[[Device, List[State]], Any]] = None,
+        coalesce_window: Optional[float] = None,
+        trace_frames: bool = False,
     ):
+        self.run_socket_io_for_locations([single_location], state_change_callback, coalesce_window, trace_frames)
+
+    def run_socket_io_for_locations(
+        self,
+        single_locations: List[SingleLocation],
+        state_change_callback: Optional[Callable[[Device, List[State]], Any]] = None,
+        coalesce_window: Optional[float] = None,
+        trace_frames: bool = False,
+    ):
+        """
+        Streams all the given locations concurrently, one socket per location, and blocks forever. Every socket
+        reconnects on its own, sharing the authentication token. With a coalesce window (in seconds), the changes
+        each device sends within the window are applied as one update, with one callback. Locations without a
+        metrics sink of their own report to the one of the client. The token is renewed in the background ahead of
+        expiry while streaming. With trace_frames, every websocket frame is logged, which is slow.
+        """
         self.state_change_callback = state_change_callback
-        self.single_location = single_location
+        if coalesce_window:
+            self.coalescer = EventCoalescer(self.handle_event, coalesce_window)
+        self.single_location = single_locations[0]
+        self.single_locations = {single_location.location_id: single_location for single_location in single_locations}
+        for single_location in single_locations:
+            if single_location.metrics is None and self.metrics is not NULL_METRICS:
+                single_location.metrics = self.metrics
         self.authenticate_if_required()
-        websocket.enableTrace(True)
-        url = f"{WEB_SOCKET_URL}?locationId={single_location.location_id}&token=Bearer%20{self.access_token}"
-        logger.debug(f"Connecting to web socket {url}")
-        self.sio = socketio.Client(logger=logger, engineio_logger=False, reconnection=False)
-        self._register_callbacks()
+        self.token_manager.start()
+        if trace_frames:
+            import websocket
+
+            websocket.enableTrace(True)
         logging.getLogger("socketio").setLevel(logger.level)
         logging.getLogger("websocket").setLevel(logger.level)
         logging.getLogger("engineio").setLevel(logger.level)
+        if len(single_locations) == 1:
+            self._stream_location(single_locations[0])
+            return
+        threads = [
+            threading.Thread(
+                target=self._stream_location,
+                args=(single_location,),
+                name=f"homely-{single_location.name}",
+                daemon=True,
+            )
+            for single_location in single_locations
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def _stream_location(self, single_location: SingleLocation):
+        import socketio
+
+        scheduler = self.reconnect_schedulers[single_location.location_id] = self.reconnect_scheduler()
         while True:
+            sio = socketio.Client(logger=logger, engineio_logger=False, reconnection=False)
+            self.sio_clients[single_location.location_id] = sio
+            if single_location is self.single_location:
+                self.sio = sio
+            self._register_callbacks(sio, single_location)
             try:
-                header = self.build_connection_header()
-                self.sio.connect(url, headers=header)
-                self.sio.wait()
+                header = self.build_connection_header(single_location)
+                url = (
+                    f"{self.web_socket_url}?locationId={single_location.location_id}"
+                    f"&token=Bearer%20{self.access_token}"
+                )
+                logger.debug(f"Connecting to web socket {url}")
+                sio.connect(url, headers=header)
+                sio.wait()
             except:
-                logger.exception("Exception while running socketio")
+                logger.exception(f"Exception while running socketio for location {single_location}")
+            self._disconnected_at.setdefault(single_location.location_id, time.monotonic())
             try:
-                self.sio.disconnect()
+                sio.disconnect()
             except Exception as ex:
                 logger.warning(f"Failed disconnecting after unexpected websocket termination: {ex}")
-            logger.info("Socket terminating restarting in 5 seconds")
-            time.sleep(5)
+            delay = scheduler.next_delay()
+            logger.info(f"Socket for location {single_location} terminating restarting in {delay:.1f} seconds")
+            time.sleep(delay)
+
+
+def dump_locations(homely: Homely, locations: List[Location], workers: int = 4, jsonl_filename: Optional[str] = None):
+    """
+    Downloads the JSON of all the locations concurrently with a bounded number of workers. Each location is written
+    to location_<name>.json, or, with jsonl_filename, as one line of a single JSONL file that is gzip compressed if
+    the name ends with .gz.
+    """
+    jsonl_lock = threading.Lock()
+    jsonl_file = None
+    if jsonl_filename is not None:
+        jsonl_file = gzip.open(jsonl_filename, "wb") if jsonl_filename.endswith(".gz") else open(jsonl_filename, "wb")
+
+    def dump(location: Location):
+        start = time.perf_counter()
+        if jsonl_file is None:
+            filename = f"location_{location.name}.json"
+            with open(filename, "wb") as o:
+                written = homely.download_location_json(location.location_id, o)
+        else:
+            # Download to a temporary file first so that the workers only serialise on the local copy
+            filename = jsonl_filename
+            with tempfile.TemporaryFile() as temporary:
+                written = homely.download_location_json(location.location_id, temporary, single_line=True)
+                temporary.seek(0)
+                with jsonl_lock:
+                    shutil.copyfileobj(temporary, jsonl_file, DOWNLOAD_CHUNK_SIZE)
+                    jsonl_file.write(b"\n")
+        elapsed = time.perf_counter() - start
+        logger.info(
+            f"Full dump for location {location} written to {filename}: {written} bytes in {elapsed:.2f} s "
+            f"({written / max(elapsed, 1e-9) / 1024:.1f} KiB/s)"
+        )
+
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="homely-dump") as executor:
+            for _ in executor.map(dump, locations):
+                pass
+    finally:
+        if jsonl_file is not None:
+            jsonl_file.close()
+    logger.info(f"Dumped {len(locations)} locations in {time.perf_counter() - start:.2f} s")
 
 
 def test_callback(single_location: Optional[SingleLocation], device: Optional[Device], states: List[State]):
@@ -230,29 +698,46 @@ def test_callback(single_location: Optional[SingleLocation], device: Optional[De
 
 
 if __name__ == "__main__":
+    logging.basicConfig(
+        format="%(asctime)s %(threadName)-15s %(name)-15s: %(levelname)-8s %(message)s",
+        datefmt="%d/%m/%Y %H:%M:%S",
+    )
     logger.setLevel(logging.INFO)
     parser = argparse.ArgumentParser(prog="Homelypy", description="Query the Homely rest API")
     parser.add_argument("username", help="Same username as in the Homely app")
     parser.add_argument("-s", "--stream", action="store_true", help="Initiate websocket stream")
+    parser.add_argument("-a", "--all", action="store_true", help="Stream all locations instead of only the first")
+    parser.add_argument("-c", "--coalesce", type=float, help="Merge device changes within this many seconds")
     parser.add_argument("-d", "--debug", action="store_true", help="Debug output")
+    parser.add_argument("-t", "--trace", action="store_true", help="Log every websocket frame")
+    parser.add_argument("-w", "--workers", type=int, default=4, help="Number of locations to download concurrently")
+    parser.add_argument("-j", "--jsonl", help="Write all locations to one JSONL file, compressed if ending in .gz")
+    parser.add_argument("-r", "--record", help="Append the streamed events to this journal, see homelypy.recording")
     args = parser.parse_args()
     if args.debug:
         logger.setLevel(logging.DEBUG)
     password = getpass()
 
-    homely = Homely(args.username, password)
+    if args.record:
+        from homelypy.recording import EventRecorder
+
+        homely = Homely(args.username, password, recorder=EventRecorder(args.record))
+    else:
+        homely = Homely(args.username, password)
     locations = homely.get_locations()
     for location in locations:
         logger.info(f"Received location '{location}'")
-    for location in locations:
-        filename = f"location_{location.name}.json"
-        location_dictionary = homely.get_location_json(location.location_id)
-        # pprint(location_dictionary)
-        # logger.info("----------------------------------")
-        with open(filename, "w") as o:
-            json.dump(location_dictionary, o)
-        logger.info(f"Full dump for location {location} written to {filename}")
-
-    location = homely.get_location(locations[0].location_id)
+    dump_locations(homely, locations, args.workers, args.jsonl)
+
     if args.stream:
-        homely.run_socket_io(location, test_callback)
+        if args.all:
+            homely.run_socket_io_for_locations(
+                [homely.get_location(location.location_id) for location in locations],
+                test_callback,
+                args.coalesce,
+                args.trace,
+            )
+        else:
+            homely.run_socket_io(
+                homely.get_location(locations[0].location_id), test_callback, args.coalesce, args.trace
+            )
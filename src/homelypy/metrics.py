@@ -0,0 +1,161 @@
+"""Counters and histograms describing how the client behaves, with an exporter to the Prometheus text format."""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Upper bounds in seconds, suitable for both sub-millisecond event processing and multi-second REST calls
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+COUNTER = "counter"
+HISTOGRAM = "histogram"
+
+# Type and help text of every metric the client reports, the names are without the exporter prefix
+METRICS = {
+    "events_received_total": (COUNTER, "Events received from the websocket, by type"),
+    "events_applied_total": (COUNTER, "Events that updated the location, by type"),
+    "unknown_devices_total": (COUNTER, "Stream updates for devices that are not in the location"),
+    "unknown_features_total": (COUNTER, "Stream changes for states the device type does not have"),
+    "rest_requests_total": (COUNTER, "REST requests by endpoint and HTTP status, error if no response"),
+    "rest_request_duration_seconds": (HISTOGRAM, "REST request latency by endpoint"),
+    "authentications_total": (COUNTER, "Authentications with username and password"),
+    "token_refreshes_total": (COUNTER, "Access token refreshes with the refresh token"),
+    "reconnects_total": (COUNTER, "Websocket connections made after losing a connection"),
+    "reconnect_duration_seconds": (HISTOGRAM, "Time from losing a websocket connection until connected again"),
+    "resyncs_total": (COUNTER, "Locations refreshed over REST after reconnecting"),
+    "event_processing_seconds": (HISTOGRAM, "Time to apply an event to the location, by type"),
+    "callback_duration_seconds": (HISTOGRAM, "Time spent in the state change callback"),
+}
+
+
+def _labels(labels: Dict[str, str]) -> Labels:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+class MetricsSink:
+    """
+    Receives the measurements of the client. This base class discards them, so it costs next to nothing when metrics
+    are not wanted. Subclass it to forward the measurements to another system, or use Metrics to keep them in memory.
+    """
+
+    def increment(self, name: str, value: float = 1, **labels: str):
+        pass
+
+    def observe(self, name: str, value: float, **labels: str):
+        pass
+
+    @contextmanager
+    def time(self, name: str, **labels: str) -> Iterator[None]:
+        """Observes the duration of the block in seconds."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+
+NULL_METRICS = MetricsSink()
+
+
+@dataclass
+class Histogram:
+    buckets: Tuple[float, ...]
+    # Observations per bucket, not cumulative, with a last entry for those above the largest bucket
+    counts: List[int] = field(default_factory=list)
+    sum: float = 0.0
+    count: int = 0
+
+    def __post_init__(self):
+        if not self.counts:
+            self.counts = [0] * (len(self.buckets) + 1)
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics(MetricsSink):
+    """Thread safe in-memory sink keeping the value of every counter and histogram, per combination of labels."""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        self._lock = threading.Lock()
+
+    def increment(self, name: str, value: float = 1, **labels: str):
+        key = (name, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels: str):
+        key = (name, _labels(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self.buckets)
+            histogram.observe(value)
+
+    def counter(self, name: str, **labels: str) -> float:
+        return self._counters.get((name, _labels(labels)), 0)
+
+    def histogram(self, name: str, **labels: str) -> Optional[Histogram]:
+        return self._histograms.get((name, _labels(labels)))
+
+    def prometheus_text(self, prefix: str = "homely_") -> str:
+        return prometheus_text(self, prefix)
+
+
+def _format_labels(labels: Labels, extra: Labels = ()) -> str:
+    labels = labels + extra
+    if not labels:
+        return ""
+    escaped = (
+        (name, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for name, value in labels
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def prometheus_text(metrics: Metrics, prefix: str = "homely_") -> str:
+    """Returns the metrics in the Prometheus text exposition format, e.g. to serve from a /metrics endpoint."""
+    with metrics._lock:
+        counters = sorted(metrics._counters.items())
+        histograms = sorted(
+            (key, Histogram(histogram.buckets, list(histogram.counts), histogram.sum, histogram.count))
+            for key, histogram in metrics._histograms.items()
+        )
+    lines = []
+    described = set()
+
+    def describe(name: str, default_type: str):
+        if name not in described:
+            described.add(name)
+            metric_type, description = METRICS.get(name, (default_type, None))
+            if description:
+                lines.append(f"# HELP {prefix}{name} {description}")
+            lines.append(f"# TYPE {prefix}{name} {metric_type}")
+
+    for (name, labels), value in counters:
+        describe(name, COUNTER)
+        lines.append(f"{prefix}{name}{_format_labels(labels)} {_format_value(value)}")
+    for (name, labels), histogram in histograms:
+        describe(name, HISTOGRAM)
+        cumulative = 0
+        for bound, count in zip(histogram.buckets + (float("inf"),), histogram.counts):
+            cumulative += count
+            bucket_labels = _format_labels(labels, (("le", _format_value(bound)),))
+            lines.append(f"{prefix}{name}_bucket{bucket_labels} {cumulative}")
+        lines.append(f"{prefix}{name}_sum{_format_labels(labels)} {_format_value(histogram.sum)}")
+        lines.append(f"{prefix}{name}_count{_format_labels(labels)} {histogram.count}")
+    return "\n".join(lines) + "\n" if lines else ""
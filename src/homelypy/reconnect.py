@@ -0,0 +1,57 @@
+"""Delays between websocket reconnects, with exponential backoff and jitter so that clients spread their reconnects."""
+import random
+import time
+from typing import Optional
+
+DEFAULT_INITIAL_DELAY = 1.0
+DEFAULT_MAX_DELAY = 300.0
+DEFAULT_MULTIPLIER = 2.0
+DEFAULT_JITTER = 0.5
+# Seconds a connection must last before the backoff starts over
+DEFAULT_STABLE_AFTER = 60.0
+
+
+class ReconnectScheduler:
+    """
+    Schedules the reconnects of one websocket. The n-th consecutive delay is initial_delay * multiplier ** n, capped at
+    max_delay, and then reduced by a random fraction of up to `jitter` of itself. Call connected() and disconnected()
+    as the connection comes and goes: once a connection has lasted stable_after seconds, the next delay starts over
+    from the initial delay.
+    """
+
+    def __init__(
+        self,
+        initial_delay: float = DEFAULT_INITIAL_DELAY,
+        max_delay: float = DEFAULT_MAX_DELAY,
+        multiplier: float = DEFAULT_MULTIPLIER,
+        jitter: float = DEFAULT_JITTER,
+        stable_after: float = DEFAULT_STABLE_AFTER,
+        rng: Optional[random.Random] = None,
+    ):
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        self.jitter = jitter
+        self.stable_after = stable_after
+        self.rng = rng if rng is not None else random.Random()
+        self.attempt = 0
+        self._connected_at: Optional[float] = None
+
+    def connected(self):
+        self._connected_at = time.monotonic()
+
+    def disconnected(self):
+        if self._connected_at is not None and time.monotonic() - self._connected_at >= self.stable_after:
+            self.attempt = 0
+        self._connected_at = None
+
+    def next_delay(self) -> float:
+        """Returns the seconds to wait before the next connection attempt, and counts the attempt."""
+        # Connection attempts that never connected also end here
+        self.disconnected()
+        delay = self.initial_delay * self.multiplier**self.attempt
+        if delay < self.max_delay:
+            self.attempt += 1
+        else:
+            delay = self.max_delay
+        return delay * (1 - self.jitter * self.rng.random())
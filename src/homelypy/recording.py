@@ -0,0 +1,147 @@
+"""
+Records the raw websocket events to an append-only journal file, and replays them into a location, to reproduce
+incidents and measure event processing on real traffic offline.
+
+    python -m homelypy.recording events.journal location_<name>.json --speed 10
+"""
+import argparse
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import Any, Callable, Iterator, Optional, Tuple
+
+from homelypy.devices import SingleLocation
+from homelypy.homely import apply_stream_event, create_single_location
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_MAGIC = b"HOMELYJ1"
+# Receive time in seconds since the epoch and the length of the JSON payload that follows
+RECORD_HEADER = struct.Struct("<dI")
+
+
+class EventRecorder:
+    """
+    Appends every raw "event" payload, with the time it was received, to a journal file. Each record is a fixed size
+    header followed by the compact JSON of the event. Pass the recorder to Homely or AsyncHomely to record what their
+    websockets deliver, before it is applied. Records are flushed every flush_every events and when closing.
+    """
+
+    def __init__(self, path: str, flush_every: int = 1):
+        self.path = path
+        self.flush_every = flush_every
+        self.recorded = 0
+        self._lock = threading.Lock()
+        self._journal = open(path, "ab")
+        if self._journal.tell() == 0:
+            self._journal.write(JOURNAL_MAGIC)
+        else:
+            with open(path, "rb") as journal:
+                if journal.read(len(JOURNAL_MAGIC)) != JOURNAL_MAGIC:
+                    self._journal.close()
+                    raise ValueError(f"{path} is not an event journal")
+
+    def record(self, event: dict, received: Optional[float] = None):
+        payload = json.dumps(event, separators=(",", ":")).encode()
+        header = RECORD_HEADER.pack(time.time() if received is None else received, len(payload))
+        with self._lock:
+            self._journal.write(header + payload)
+            self.recorded += 1
+            if self.recorded % self.flush_every == 0:
+                self._journal.flush()
+
+    def close(self):
+        with self._lock:
+            self._journal.close()
+
+    def __enter__(self) -> "EventRecorder":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class EventReplayer:
+    """
+    Reads a journal written by EventRecorder through a memory map. A record cut off at the end of the file, as left by
+    a process that died while writing, is ignored.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as journal:
+            size = os.fstat(journal.fileno()).st_size
+            if size < len(JOURNAL_MAGIC) or journal.read(len(JOURNAL_MAGIC)) != JOURNAL_MAGIC:
+                raise ValueError(f"{path} is not an event journal")
+            self._map = mmap.mmap(journal.fileno(), 0, access=mmap.ACCESS_READ) if size > len(JOURNAL_MAGIC) else b""
+
+    def __iter__(self) -> Iterator[Tuple[float, dict]]:
+        """Yields (receive time, event) for every record."""
+        journal = self._map
+        position = len(JOURNAL_MAGIC)
+        end = len(journal)
+        while position + RECORD_HEADER.size <= end:
+            received, length = RECORD_HEADER.unpack_from(journal, position)
+            position += RECORD_HEADER.size
+            if position + length > end:
+                logger.warning(f"Ignoring truncated record at the end of journal {self.path}")
+                break
+            yield received, json.loads(journal[position : position + length])
+            position += length
+
+    def replay(
+        self,
+        single_location: SingleLocation,
+        state_change_callback: Optional[Callable[..., Any]] = None,
+        speed: Optional[float] = 1.0,
+        sleep: Callable[[float], Any] = time.sleep,
+    ) -> int:
+        """
+        Applies the recorded events to the location, calling the state change callback like Homely.run_socket_io
+        does. With speed 1 the events are applied as far apart as they were received, with speed 10 ten times as fast,
+        and with speed None as fast as possible. Returns the number of events applied.
+        """
+        count = 0
+        start = first = None
+        for received, event in self:
+            if speed is not None:
+                if first is None:
+                    start, first = time.monotonic(), received
+                delay = start + (received - first) / speed - time.monotonic()
+                if delay > 0:
+                    sleep(delay)
+            result = apply_stream_event(single_location, event)
+            count += 1
+            if result is not None and state_change_callback is not None:
+                state_change_callback(*result)
+        return count
+
+    def close(self):
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+
+    def __enter__(self) -> "EventReplayer":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format="%(asctime)s %(name)-15s: %(levelname)-8s %(message)s", level=logging.INFO)
+    parser = argparse.ArgumentParser(prog="homelypy.recording", description="Replay a journal of websocket events")
+    parser.add_argument("journal", help="Journal written with --record")
+    parser.add_argument("location", help="Location JSON to apply the events to, as dumped by homelypy.homely")
+    parser.add_argument("--speed", type=float, help="Replay this many times as fast as recorded, default no delays")
+    args = parser.parse_args()
+    with open(args.location) as location_file:
+        location = create_single_location(json.load(location_file))
+    with EventReplayer(args.journal) as replayer:
+        start_time = time.perf_counter()
+        applied = replayer.replay(location, speed=args.speed)
+        elapsed = time.perf_counter() - start_time
+    logger.info(f"Replayed {applied} events in {elapsed:.3f} seconds, {applied / max(elapsed, 1e-9):.0f} events/s")
@@ -0,0 +1,93 @@
+"""On-disk snapshot of a location plus a journal of the stream events applied since, for fast warm starts."""
+import json
+import logging
+import os
+import pickle
+import threading
+from typing import List, Optional, Tuple
+
+from homelypy.devices import SingleLocation
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_JOURNAL_EVENTS = 10000
+
+
+class LocationCache:
+    """
+    Stores a pickled snapshot of a SingleLocation in location_<id>.snapshot and appends every applied stream event to
+    location_<id>.journal as a JSON line. Once the journal holds max_journal_events events, a new snapshot is written
+    and the journal is truncated. Only load caches written by yourself, since the snapshot is a pickle.
+    """
+
+    def __init__(self, directory: str, location_id: str, max_journal_events: int = DEFAULT_MAX_JOURNAL_EVENTS):
+        self.location_id = location_id
+        self.snapshot_path = os.path.join(directory, f"location_{location_id}.snapshot")
+        self.journal_path = os.path.join(directory, f"location_{location_id}.journal")
+        self.max_journal_events = max_journal_events
+        self.journal_events = 0
+        self._journal = None
+        self._lock = threading.Lock()
+
+    def load(self) -> Tuple[Optional[SingleLocation], List[dict]]:
+        """Returns the snapshot, or None if there is none, and the journaled events to apply to it."""
+        try:
+            with open(self.snapshot_path, "rb") as snapshot:
+                single_location = pickle.load(snapshot)
+        except FileNotFoundError:
+            return None, []
+        except Exception as ex:
+            logger.warning(f"Ignoring unreadable snapshot {self.snapshot_path}: {ex}")
+            return None, []
+        events = []
+        try:
+            with open(self.journal_path, "r") as journal:
+                for line in journal:
+                    try:
+                        events.append(json.loads(line))
+                    except ValueError:
+                        # The last line may be incomplete if the process died while writing it
+                        logger.warning(f"Ignoring unreadable line in journal {self.journal_path}")
+        except FileNotFoundError:
+            pass
+        self.journal_events = len(events)
+        return single_location, events
+
+    def save_snapshot(self, single_location: SingleLocation):
+        """
+        Atomically replaces the snapshot and truncates the journal. If the location cannot be pickled, e.g. because
+        another thread changed it meanwhile, the snapshot and journal are left as they were and the error is raised.
+        """
+        # Pickled before touching any file, so that a failure leaves no partial snapshot behind
+        data = pickle.dumps(single_location, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            temporary_path = self.snapshot_path + ".tmp"
+            with open(temporary_path, "wb") as snapshot:
+                snapshot.write(data)
+            os.replace(temporary_path, self.snapshot_path)
+            if self._journal is not None:
+                self._journal.close()
+            self._journal = open(self.journal_path, "w")
+            self.journal_events = 0
+
+    def record(self, single_location: SingleLocation, event: dict):
+        """Appends an applied event to the journal, compacting it into a new snapshot when it is full."""
+        with self._lock:
+            if self._journal is None:
+                self._journal = open(self.journal_path, "a")
+            self._journal.write(json.dumps(event, separators=(",", ":")) + "\n")
+            self._journal.flush()
+            self.journal_events += 1
+            compact = self.journal_events >= self.max_journal_events
+        if compact:
+            try:
+                self.save_snapshot(single_location)
+            except Exception:
+                # The journal stays complete, so compacting is simply tried again on the next event
+                logger.exception(f"Failed compacting journal {self.journal_path} into a new snapshot")
+
+    def close(self):
+        with self._lock:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
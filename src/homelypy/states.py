@@ -1,27 +1,75 @@
 """Defines the type of states that can be found in the  features provided by a Homely device."""
+import dataclasses
 import datetime
 from dataclasses import dataclass
-from typing import Any, Optional
+from typing import Any, Optional, Dict, Tuple
 
-from dateutil.parser import parse
+from homelypy.filters import ChangeFilter
+from homelypy.timestamps import parse_timestamp
 
 
 @dataclass
 class State:
+    __slots__ = ("feature_name",)
+
     feature_name: str
 
     @classmethod
     def create_from_rest_response(cls, data: dict) -> "State":
         raise NotImplementedError
 
+    @classmethod
+    def stream_fields(cls) -> Dict[str, Tuple[str, str]]:
+        """
+        Maps the state names used by the API (e.g. "networklinkstrength") to the names of the value and timestamp
+        fields of this class (e.g. "network_link_strength" and "network_link_strength_last_updated").
+        """
+        mapping = cls.__dict__.get("_stream_fields")
+        if mapping is None:
+            names = [field.name for field in dataclasses.fields(cls)]
+            mapping = {}
+            for name in names:
+                if name == "feature_name" or name.endswith(("_last_updated", "_last_update")):
+                    continue
+                timestamp_name = f"{name}_last_updated" if f"{name}_last_updated" in names else f"{name}_last_update"
+                mapping[name.replace("_", "")] = (name, timestamp_name)
+            cls._stream_fields = mapping
+        return mapping
+
+    def update_from(self, other: "State", change_filter: Optional[ChangeFilter] = None) -> bool:
+        """
+        Copies the values of another state of the same class that are at least as recent as the local ones, with their
+        timestamps, so that a fetched state never replaces a newer streamed one. Returns True if any value changed,
+        as decided by the change filter if given. Timestamp-only updates are not changes.
+        """
+        changed = False
+        for state_name, (value_name, timestamp_name) in self.stream_fields().items():
+            last_updated = getattr(other, timestamp_name)
+            current_last_updated = getattr(self, timestamp_name)
+            if current_last_updated is not None and (last_updated is None or last_updated < current_last_updated):
+                continue
+            value = getattr(other, value_name)
+            current = getattr(self, value_name)
+            if change_filter is not None:
+                value_changed = change_filter.is_change(self.feature_name, state_name, current, value)
+            else:
+                value_changed = current != value
+            if value_changed:
+                setattr(self, value_name, value)
+                changed = True
+            setattr(self, timestamp_name, last_updated)
+        return changed
+
 
 def extract_value_and_last_updated(data: dict) -> tuple[Any, datetime.datetime]:
-    timestamp = parse(data["lastUpdated"]) if data["lastUpdated"] is not None else None
+    timestamp = parse_timestamp(data["lastUpdated"]) if data["lastUpdated"] is not None else None
     return data["value"], timestamp
 
 
 @dataclass
 class BasicAlarmState(State):
+    __slots__ = ("alarm", "alarm_last_updated", "tamper", "tamper_last_updated")
+
     @classmethod
     def create_from_rest_response(cls, data: dict) -> "BasicAlarmState":
         my_data = data["features"]["alarm"]["states"]
@@ -42,6 +90,8 @@ class BasicAlarmState(State):
 
 @dataclass
 class SmokeAlarmState(State):
+    __slots__ = ("fire", "fire_last_updated")
+
     @classmethod
     def create_from_rest_response(cls, data: dict) -> "SmokeAlarmState":
         my_data = data["features"]["alarm"]["states"]
@@ -59,6 +109,8 @@ class SmokeAlarmState(State):
 
 @dataclass
 class MotionSensorState(BasicAlarmState):
+    __slots__ = ("sensitivity_level", "sensitivity_level_last_updated")
+
     sensitivity_level: Optional[float]
     sensitivity_level_last_updated: Optional[datetime.datetime]
 
@@ -81,6 +133,8 @@ class MotionSensorState(BasicAlarmState):
 
 @dataclass
 class BatteryState(State):
+    __slots__ = ("low", "low_last_updated", "voltage", "voltage_last_updated", "defect", "defect_last_updated")
+
     @classmethod
     def create_from_rest_response(cls, data: dict) -> "BatteryState":
         my_data = data["features"]["battery"]["states"]
@@ -107,6 +161,8 @@ class BatteryState(State):
 
 @dataclass
 class TemperatureState(State):
+    __slots__ = ("temperature", "temperature_last_updated")
+
     @classmethod
     def create_from_rest_response(cls, data: dict) -> "TemperatureState":
         my_data = data["features"]["temperature"]["states"]
@@ -124,6 +180,17 @@ class TemperatureState(State):
 
 @dataclass
 class MeteringState(State):
+    __slots__ = (
+        "summation_delivered",
+        "summation_delivered_last_updated",
+        "summation_received",
+        "summation_received_last_update",
+        "demand",
+        "demand_last_updated",
+        "check",
+        "check_last_updated",
+    )
+
     @classmethod
     def create_from_rest_response(cls, data: dict) -> "MeteringState":
         my_data = data["features"]["metering"]["states"]
@@ -155,6 +222,13 @@ class MeteringState(State):
 
 @dataclass
 class DiagnosticState(State):
+    __slots__ = (
+        "network_link_address",
+        "network_link_address_last_updated",
+        "network_link_strength",
+        "network_link_strength_last_updated",
+    )
+
     @classmethod
     def create_from_rest_response(cls, data: dict) -> "DiagnosticState":
         my_data = data["features"]["diagnostic"]["states"]
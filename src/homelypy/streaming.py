@@ -0,0 +1,134 @@
+"""
+Incremental parsing of the /homely/home response, yielding the devices as they arrive instead of after the whole
+body has been read. Only one device, and one chunk of the body, is held in memory at a time.
+"""
+import codecs
+import datetime
+import json
+import logging
+from typing import Any, Dict, Iterable, Iterator, List
+
+from homelypy.devices import Device, SingleLocation, UnknownDeviceException, create_device_from_rest_response
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = " \t\n\r"
+
+
+class _JsonScanner:
+    """
+    Walks the top level object of a location with json.JSONDecoder.raw_decode, decoding the other fields and each
+    element of the devices array separately, so the C decoder does all the parsing. A value cut off at the end of the
+    buffer fails to decode, or may decode to a prefix of itself, so it is decoded again after reading the next chunk.
+    """
+
+    def __init__(self, chunks: Iterable[bytes], fields: Dict[str, Any]):
+        self._chunks = iter(chunks)
+        self._fields = fields
+        self._text_decoder = codecs.getincrementaldecoder("utf-8")()
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._position = 0
+        self._eof = False
+
+    def _read(self) -> bool:
+        if self._eof:
+            return False
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            self._eof = True
+            text = self._text_decoder.decode(b"", final=True)
+        else:
+            text = self._text_decoder.decode(chunk)
+        # Drop what has been parsed, so that the buffer only grows to the largest value plus a chunk
+        self._buffer = self._buffer[self._position :] + text
+        self._position = 0
+        return True
+
+    def _peek(self) -> str:
+        """Skips whitespace and returns the next character, or an empty string at the end."""
+        while True:
+            while self._position < len(self._buffer) and self._buffer[self._position] in _WHITESPACE:
+                self._position += 1
+            if self._position < len(self._buffer):
+                return self._buffer[self._position]
+            if not self._read():
+                return ""
+
+    def _expect(self, characters: str) -> str:
+        character = self._peek()
+        if not character or character not in characters:
+            raise ValueError(f"Expected one of '{characters}' in location JSON but found '{character}'")
+        self._position += 1
+        return character
+
+    def _value(self) -> Any:
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._position)
+            except json.JSONDecodeError:
+                if self._read():
+                    continue
+                raise
+            if end == len(self._buffer) and self._read():
+                continue
+            self._position = end
+            return value
+
+    def __iter__(self) -> Iterator[dict]:
+        self._expect("{")
+        if self._peek() == "}":
+            return
+        while True:
+            key = self._value()
+            self._expect(":")
+            if key == "devices" and self._peek() == "[":
+                self._position += 1
+                if self._peek() == "]":
+                    self._position += 1
+                else:
+                    while True:
+                        yield self._value()
+                        if self._expect(",]") == "]":
+                            break
+            else:
+                self._fields[key] = self._value()
+            if self._expect(",}") == "}":
+                return
+
+
+class LocationStream:
+    """
+    Parses a /homely/home response from an iterable of byte chunks, e.g. Homely.iter_location. Iterating yields the
+    devices as their JSON arrives, skipping unknown models. The other fields of the location, such as locationId,
+    are in `fields` once seen, and all of them once the iteration is done. to_single_location() builds the location
+    from the devices that have not been iterated yet.
+    """
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self.fields: Dict[str, Any] = {}
+        self._device_data = iter(_JsonScanner(chunks, self.fields))
+
+    def iter_device_data(self) -> Iterator[dict]:
+        """Yields the JSON of each device, including those of unknown models."""
+        return self._device_data
+
+    def __iter__(self) -> Iterator[Device]:
+        for data in self._device_data:
+            try:
+                yield create_device_from_rest_response(data)
+            except UnknownDeviceException as ex:
+                logger.error(str(ex))
+
+    def to_single_location(self) -> SingleLocation:
+        devices: List[Device] = list(self)
+        return SingleLocation(
+            self.fields["locationId"],
+            self.fields["gatewayserial"],
+            self.fields["name"],
+            self.fields["alarmState"],
+            datetime.datetime.now(datetime.timezone.utc),
+            self.fields["userRoleAtLocation"],
+            devices,
+        )
@@ -0,0 +1,149 @@
+"""Routes state changes to the handlers subscribed to a device, model, feature or alarm state."""
+import itertools
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from homelypy.devices import Device, SingleLocation
+from homelypy.states import State
+
+logger = logging.getLogger(__name__)
+
+DeviceHandler = Callable[[Device, List[State]], Any]
+AlarmHandler = Callable[[SingleLocation], Any]
+
+
+@dataclass(eq=False)
+class Subscription:
+    handler: Callable[..., Any]
+    device_id: Optional[str] = None
+    model_name: Optional[str] = None
+    feature: Optional[str] = None
+    predicate: Optional[Callable[[Device, List[State]], bool]] = None
+    # Only for alarm subscriptions, None for all locations
+    location_id: Optional[str] = None
+    alarm: bool = False
+    sequence: int = field(default=0, repr=False)
+    registry: Optional["SubscriptionRegistry"] = field(default=None, repr=False)
+
+    def cancel(self):
+        if self.registry is not None:
+            self.registry.unsubscribe(self)
+
+
+class SubscriptionRegistry:
+    """
+    Calls the handlers subscribed to each state change. The registry takes the same arguments as the state change
+    callback, so pass it as state_change_callback to Homely.run_socket_io, or to a CallbackDispatcher. Subscriptions
+    are indexed by device id, then model name, then feature, so an event only reaches the handlers that may want it.
+    Handlers can be added and removed while events are dispatched.
+    """
+
+    def __init__(self):
+        self._by_device_id: Dict[str, List[Subscription]] = {}
+        self._by_model_name: Dict[str, List[Subscription]] = {}
+        self._by_feature: Dict[str, List[Subscription]] = {}
+        self._unindexed: List[Subscription] = []
+        self._by_location_id: Dict[Optional[str], List[Subscription]] = {}
+        self._sequence = itertools.count(1)
+        # Held while modifying, the lists are replaced rather than changed so that dispatch needs no lock
+        self._lock = threading.Lock()
+
+    def _index(self, subscription: Subscription):
+        if subscription.alarm:
+            return self._by_location_id, subscription.location_id
+        if subscription.device_id is not None:
+            return self._by_device_id, subscription.device_id
+        if subscription.model_name is not None:
+            return self._by_model_name, subscription.model_name
+        if subscription.feature is not None:
+            return self._by_feature, subscription.feature
+        return None, None
+
+    def _add(self, subscription: Subscription) -> Subscription:
+        with self._lock:
+            subscription.sequence = next(self._sequence)
+            subscription.registry = self
+            index, key = self._index(subscription)
+            if index is None:
+                self._unindexed = self._unindexed + [subscription]
+            else:
+                index[key] = index.get(key, []) + [subscription]
+        return subscription
+
+    def subscribe(
+        self,
+        handler: DeviceHandler,
+        device_id: Optional[str] = None,
+        model_name: Optional[str] = None,
+        feature: Optional[str] = None,
+        predicate: Optional[Callable[[Device, List[State]], bool]] = None,
+    ) -> Subscription:
+        """
+        Calls handler(device, states) for the state changes matching all the given criteria, or for every change if
+        none are given. With a feature, e.g. "temperature" or "alarm", only the changed states of that feature are
+        passed. The predicate gets the device and the states that would be passed.
+        """
+        return self._add(Subscription(handler, device_id, model_name, feature, predicate))
+
+    def subscribe_alarm(self, handler: AlarmHandler, location_id: Optional[str] = None) -> Subscription:
+        """Calls handler(single_location) when the alarm state of the location, or of any location, changes."""
+        return self._add(Subscription(handler, location_id=location_id, alarm=True))
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            index, key = self._index(subscription)
+            if index is None:
+                self._unindexed = [s for s in self._unindexed if s is not subscription]
+                return
+            remaining = [s for s in index.get(key, ()) if s is not subscription]
+            if remaining:
+                index[key] = remaining
+            else:
+                index.pop(key, None)
+
+    def __len__(self) -> int:
+        indexes = (self._by_device_id, self._by_model_name, self._by_feature, self._by_location_id)
+        return len(self._unindexed) + sum(len(subscriptions) for index in indexes for subscriptions in index.values())
+
+    def _call(self, subscription: Subscription, *args):
+        try:
+            subscription.handler(*args)
+        except Exception:
+            logger.exception(f"Subscription handler {subscription.handler} failed")
+
+    def __call__(self, single_location: Optional[SingleLocation], device: Optional[Device], states: List[State]):
+        if device is None:
+            if single_location is not None:
+                self._dispatch_alarm(single_location)
+            return
+        candidates = []
+        for subscriptions in (
+            self._by_device_id.get(device.id),
+            self._by_model_name.get(device.model_name),
+            *(self._by_feature.get(feature) for feature in {state.feature_name for state in states}),
+            self._unindexed,
+        ):
+            if subscriptions:
+                candidates.extend(subscriptions)
+        if len(candidates) > 1:
+            candidates.sort(key=lambda subscription: subscription.sequence)
+        for subscription in candidates:
+            if subscription.device_id is not None and subscription.device_id != device.id:
+                continue
+            if subscription.model_name is not None and subscription.model_name != device.model_name:
+                continue
+            matching = states
+            if subscription.feature is not None:
+                matching = [state for state in states if state.feature_name == subscription.feature]
+                if not matching:
+                    continue
+            if subscription.predicate is not None and not subscription.predicate(device, matching):
+                continue
+            self._call(subscription, device, matching)
+
+    def _dispatch_alarm(self, single_location: SingleLocation):
+        candidates = self._by_location_id.get(single_location.location_id, []) + self._by_location_id.get(None, [])
+        for subscription in sorted(candidates, key=lambda subscription: subscription.sequence):
+            self._call(subscription, single_location)
@@ -0,0 +1,176 @@
+"""Synthetic Homely payloads for benchmarks and the fake server. All generators are seeded, so runs are reproducible."""
+import datetime
+import random
+import uuid
+from typing import Callable, Dict, List, Optional
+
+from homelypy.devices import DEVICE_MAP
+
+EPOCH = datetime.datetime(2023, 1, 1, tzinfo=datetime.timezone.utc)
+
+# Generators for the value of each (feature, stateName) in the REST payloads and the stream
+STATE_VALUES: Dict[str, Dict[str, Callable[[random.Random], object]]] = {
+    "alarm": {
+        "alarm": lambda rng: rng.random() < 0.1,
+        "tamper": lambda rng: False,
+        "fire": lambda rng: False,
+        "sensitivitylevel": lambda rng: rng.choice([None, 1, 2, 3]),
+    },
+    "battery": {
+        "low": lambda rng: rng.random() < 0.05,
+        "voltage": lambda rng: round(rng.uniform(2.5, 3.1), 1),
+        "defect": lambda rng: False,
+    },
+    "diagnostic": {
+        "networklinkaddress": lambda rng: f"0015BC{rng.getrandbits(40):010X}",
+        "networklinkstrength": lambda rng: rng.randrange(0, 101),
+    },
+    "temperature": {"temperature": lambda rng: round(rng.uniform(-10, 30), 1)},
+    "metering": {
+        "summationdelivered": lambda rng: rng.randrange(0, 100000),
+        "summationreceived": lambda rng: rng.randrange(0, 1000),
+        "demand": lambda rng: rng.randrange(0, 10000),
+        "check": lambda rng: False,
+    },
+}
+
+# The features and states reported by each model in DEVICE_MAP
+MODEL_STATES: Dict[str, Dict[str, List[str]]] = {
+    "Motion Sensor Mini": {
+        "alarm": ["alarm", "tamper", "sensitivitylevel"],
+        "battery": ["low", "voltage", "defect"],
+        "diagnostic": ["networklinkaddress", "networklinkstrength"],
+        "temperature": ["temperature"],
+    },
+    "Smoke Alarm": {
+        "alarm": ["fire"],
+        "battery": ["low", "voltage"],
+        "diagnostic": ["networklinkaddress", "networklinkstrength"],
+        "temperature": ["temperature"],
+    },
+    "Window Sensor": {
+        "alarm": ["alarm", "tamper"],
+        "battery": ["low", "voltage", "defect"],
+        "diagnostic": ["networklinkaddress", "networklinkstrength"],
+        "temperature": ["temperature"],
+    },
+    "EMI Norwegian HAN": {
+        "diagnostic": ["networklinkaddress", "networklinkstrength"],
+        "metering": ["summationdelivered", "summationreceived", "demand", "check"],
+    },
+}
+MODEL_STATES["Motion Sensor 2 Alarm"] = MODEL_STATES["Motion Sensor Mini"]
+MODEL_STATES["Intelligent Smoke Alarm"] = MODEL_STATES["Smoke Alarm"]
+MODEL_STATES["Heat Alarm"] = MODEL_STATES["Smoke Alarm"]
+MODEL_STATES["Window Alarm Sensor"] = MODEL_STATES["Window Sensor"]
+
+# Rough relative frequency of the state names in a real stream
+STREAM_WEIGHTS = {
+    "temperature": 10,
+    "networklinkstrength": 10,
+    "demand": 20,
+    "summationdelivered": 5,
+    "alarm": 5,
+    "voltage": 2,
+}
+
+
+def timestamp(rng: random.Random) -> str:
+    value = EPOCH + datetime.timedelta(milliseconds=rng.randrange(0, 365 * 24 * 3600 * 1000))
+    return value.strftime("%Y-%m-%dT%H:%M:%S.") + f"{value.microsecond // 1000:03d}Z"
+
+
+def state(rng: random.Random, value) -> dict:
+    return {"lastUpdated": timestamp(rng), "value": value}
+
+
+def device_response(rng: random.Random, model_name: str) -> dict:
+    return {
+        "features": {
+            feature: {
+                "states": {
+                    state_name: state(rng, STATE_VALUES[feature][state_name](rng)) for state_name in state_names
+                }
+            }
+            for feature, state_names in MODEL_STATES[model_name].items()
+        },
+        "id": str(uuid.UUID(int=rng.getrandbits(128))),
+        "location": f"Floor {rng.randrange(0, 3)} - Room {rng.randrange(0, 20)}",
+        "modelId": str(uuid.UUID(int=rng.getrandbits(128))),
+        "modelName": model_name,
+        "name": model_name,
+        "online": True,
+        "serialNumber": f"0015BC{rng.getrandbits(40):010X}",
+    }
+
+
+def location_response(device_count: int, seed: int = 0, model_names: Optional[List[str]] = None) -> dict:
+    """Returns a /homely/home payload with the devices spread evenly over the models (all of DEVICE_MAP by default)."""
+    rng = random.Random(seed)
+    model_names = model_names or sorted(DEVICE_MAP)
+    return {
+        "locationId": str(uuid.UUID(int=rng.getrandbits(128))),
+        "gatewayserial": "0215BC001E014469",
+        "name": "Synthetic home",
+        "alarmState": "DISARMED",
+        "userRoleAtLocation": "ADMIN",
+        "devices": [device_response(rng, model_names[i % len(model_names)]) for i in range(device_count)],
+    }
+
+
+def stream_events(location: dict, event_count: int, seed: int = 0) -> List[dict]:
+    """Returns the "data" part of device-state-changed events for random states of the devices in a location."""
+    rng = random.Random(seed)
+    devices = location["devices"]
+    events = []
+    for _ in range(event_count):
+        device = rng.choice(devices)
+        choices = [
+            (feature, state_name)
+            for feature, states in device["features"].items()
+            for state_name in states["states"]
+            if feature != "diagnostic" or state_name != "networklinkaddress"
+        ]
+        feature, state_name = rng.choices(choices, [STREAM_WEIGHTS.get(name, 1) for _, name in choices])[0]
+        events.append(
+            {
+                "deviceId": device["id"],
+                "gatewayId": "3b0187f4-878e-4b51-af2b-fc563b81f137",
+                "locationId": location["locationId"],
+                "modelId": device["modelId"],
+                "rootLocationId": location["locationId"],
+                "changes": [
+                    {
+                        "feature": feature,
+                        "stateName": state_name,
+                        "value": STATE_VALUES[feature][state_name](rng),
+                        "lastUpdated": timestamp(rng),
+                    }
+                ],
+            }
+        )
+    return events
+
+
+def temperature_events(location: dict, event_count: int, seed: int = 0) -> List[dict]:
+    """Returns the "data" part of temperature device-state-changed events for the devices that have a temperature."""
+    rng = random.Random(seed)
+    devices = [device for device in location["devices"] if "temperature" in device["features"]]
+    return [
+        {
+            "deviceId": device["id"],
+            "gatewayId": "3b0187f4-878e-4b51-af2b-fc563b81f137",
+            "locationId": location["locationId"],
+            "modelId": device["modelId"],
+            "rootLocationId": location["locationId"],
+            "changes": [
+                {
+                    "feature": "temperature",
+                    "stateName": "temperature",
+                    "value": round(rng.uniform(-10, 30), 1),
+                    "lastUpdated": timestamp(rng),
+                }
+            ],
+        }
+        for device in (rng.choice(devices) for _ in range(event_count))
+    ]
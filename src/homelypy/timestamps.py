@@ -0,0 +1,83 @@
+"""Parsing of the timestamps found in Homely REST responses and websocket events."""
+import datetime
+import functools
+from typing import Optional
+
+DEFAULT_CACHE_SIZE = 256
+
+_UTC = datetime.timezone.utc
+
+
+def _parse_homely_format(value: str) -> Optional[datetime.datetime]:
+    """Parses the fixed YYYY-MM-DDTHH:MM:SS.mmmZ format used by the Homely API. Returns None for anything else."""
+    if (
+        len(value) != 24
+        or value[4] != "-"
+        or value[7] != "-"
+        or value[10] != "T"
+        or value[13] != ":"
+        or value[16] != ":"
+        or value[19] != "."
+        or value[23] != "Z"
+    ):
+        return None
+    try:
+        return datetime.datetime(
+            int(value[0:4]),
+            int(value[5:7]),
+            int(value[8:10]),
+            int(value[11:13]),
+            int(value[14:16]),
+            int(value[17:19]),
+            int(value[20:23]) * 1000,
+            tzinfo=_UTC,
+        )
+    except ValueError:
+        return None
+
+
+def _parse_timestamp(value: str) -> datetime.datetime:
+    timestamp = _parse_homely_format(value)
+    if timestamp is None:
+        # Rarely needed, so dateutil is only imported when it is
+        from dateutil.parser import parse
+
+        timestamp = parse(value)
+    return timestamp
+
+
+_cached_parse_timestamp = functools.lru_cache(maxsize=DEFAULT_CACHE_SIZE)(_parse_timestamp)
+_use_cache = True
+
+
+def configure_timestamp_cache(maxsize: int = DEFAULT_CACHE_SIZE):
+    """Sets the size of the LRU cache used for repeated timestamps. A size of 0 disables the cache."""
+    global _cached_parse_timestamp, _use_cache
+    _use_cache = maxsize > 0
+    _cached_parse_timestamp = functools.lru_cache(maxsize=max(maxsize, 0))(_parse_timestamp)
+
+
+def timestamp_at_least(value: str, other: str) -> bool:
+    """
+    Returns whether the timestamp is at or after the other one. Two timestamps in the fixed format of the Homely API
+    sort in time order as strings, so they are compared without parsing them; anything else is parsed.
+    """
+    if (
+        len(value) == 24
+        and len(other) == 24
+        and value[10] == other[10] == "T"
+        and value[19] == other[19] == "."
+        and value[23] == other[23] == "Z"
+    ):
+        return value >= other
+    return parse_timestamp(value) >= parse_timestamp(other)
+
+
+def parse_timestamp(value: str) -> datetime.datetime:
+    """
+    Parses a timestamp from the Homely API. The fixed format sent by the API is handled by a specialised parser,
+    anything else falls back to dateutil.
+    """
+    if _use_cache:
+        return _cached_parse_timestamp(value)
+    return _parse_timestamp(value)
@@ -0,0 +1,168 @@
+"""Keeps the access token of the Homely client fresh, refreshing it once for all threads and ahead of expiry."""
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Iterator, Optional
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows, where the cache is only shared within the process
+    fcntl = None
+
+if TYPE_CHECKING:
+    from homelypy.homely import Homely
+
+logger = logging.getLogger(__name__)
+
+# Tokens are renewed when they are valid for less than this many seconds when used
+EXPIRY_MARGIN = 2
+# The background thread renews tokens this many seconds before they expire
+DEFAULT_REFRESH_MARGIN = 60
+# Seconds to wait before retrying after a failed background renewal
+RETRY_INTERVAL = 10
+
+
+class TokenCache:
+    """
+    Storage for tokens shared between clients, keyed by user and server. This base class stores nothing, see
+    FileTokenCache for one that is shared between processes.
+    """
+
+    def load(self, key: str) -> Optional[dict]:
+        return None
+
+    def save(self, key: str, data: dict):
+        pass
+
+    @contextmanager
+    def lock(self) -> Iterator[None]:
+        """Held while a token is renewed, so that other clients wait and use the new token from the cache."""
+        yield
+
+
+class FileTokenCache(TokenCache):
+    """
+    Stores the tokens in a JSON file, readable only by the owner, so that several processes of the same user share
+    one login. On platforms with fcntl, renewals are also serialised between processes with a lock file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _read(self) -> dict:
+        try:
+            with open(self.path, "r") as cache:
+                return json.load(cache)
+        except FileNotFoundError:
+            return {}
+        except ValueError:
+            logger.warning(f"Ignoring unreadable token cache {self.path}")
+            return {}
+
+    def load(self, key: str) -> Optional[dict]:
+        return self._read().get(key)
+
+    def save(self, key: str, data: dict):
+        tokens = self._read()
+        tokens[key] = data
+        temporary_path = self.path + ".tmp"
+        with open(os.open(temporary_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w") as cache:
+            json.dump(tokens, cache)
+        os.replace(temporary_path, self.path)
+
+    @contextmanager
+    def lock(self) -> Iterator[None]:
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(os.open(self.path + ".lock", os.O_RDWR | os.O_CREAT, 0o600), "r+") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class TokenManager:
+    """
+    Renews the token of a Homely client when needed. Concurrent callers that find the token expiring wait for a
+    single renewal instead of each starting their own. The token is refreshed with the refresh token where possible,
+    falling back to the username and password. With start(), a background thread renews the token refresh_margin
+    seconds ahead of expiry, so that requests and reconnects do not wait for it. With a cache, a valid token saved by
+    another client is used instead of logging in again.
+    """
+
+    def __init__(
+        self, homely: "Homely", cache: Optional[TokenCache] = None, refresh_margin: float = DEFAULT_REFRESH_MARGIN
+    ):
+        self.homely = homely
+        self.cache = cache if cache is not None else TokenCache()
+        self.refresh_margin = refresh_margin
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def key(self) -> str:
+        return f"{self.homely.username}@{self.homely.sdk_url}"
+
+    def valid_for(self) -> float:
+        """Seconds until the access token expires, negative if it has."""
+        return self.homely.authentication_time + self.homely.expires_in - time.time()
+
+    def ensure_valid(self, margin: float = EXPIRY_MARGIN):
+        """Makes sure the access token is valid for at least margin seconds, renewing it if not."""
+        if self.valid_for() > margin:
+            return
+        with self._lock:
+            # Another thread may have renewed the token while this one waited
+            if self.valid_for() > margin:
+                return
+            with self.cache.lock():
+                cached = self.cache.load(self.key)
+                if cached is not None and cached["authentication_time"] + cached["expires_in"] - time.time() > margin:
+                    self.homely.store_authentication_information(cached, cached["authentication_time"])
+                    return
+                self._renew(margin)
+                self.cache.save(self.key, self.homely.authentication_information())
+
+    def _renew(self, margin: float):
+        refresh_valid_for = self.homely.authentication_time + self.homely.refresh_expires_in - time.time()
+        if self.homely.refresh_token is not None and refresh_valid_for > margin:
+            try:
+                self.homely.reauthenticate()
+                return
+            except Exception as ex:
+                logger.warning(f"Refreshing the access token failed, logging in again: {ex}")
+        self.homely.authenticate()
+
+    def start(self):
+        """Starts renewing the token in the background, if not already running."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="homely-token", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        delay = 0.0
+        while not self._stopped.wait(delay):
+            try:
+                self.ensure_valid(self.refresh_margin)
+                # Never renew more often than every RETRY_INTERVAL, even for tokens shorter lived than the margin
+                delay = max(self.valid_for() - self.refresh_margin, RETRY_INTERVAL)
+            except Exception:
+                logger.exception(f"Renewing the access token failed, retrying in {RETRY_INTERVAL} seconds")
+                delay = RETRY_INTERVAL
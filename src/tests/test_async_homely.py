@@ -0,0 +1,203 @@
+import asyncio
+import functools
+import unittest
+from unittest import IsolatedAsyncioTestCase
+
+try:
+    from aiohttp import web
+    from aiohttp.test_utils import TestServer
+except ImportError:
+    raise unittest.SkipTest("aiohttp is not installed")
+import socketio
+
+from homelypy.async_homely import AsyncHomely
+from homelypy.fake_server import emit_event
+from homelypy.homely import AuthenticationFailedException
+from homelypy.metrics import Metrics
+from homelypy.reconnect import ReconnectScheduler
+
+LOCATION_ID = "48617520-863c-4e27-9a05-4ce3cce50f8e"
+DEVICE_ID = "28e0b340-26a6-475c-a419-a5f31bc8f479"
+TOKEN = {"access_token": "access", "expires_in": 60, "refresh_token": "refresh", "refresh_expires_in": 1800}
+HOME = {
+    "locationId": LOCATION_ID,
+    "gatewayserial": "0215BC001E014469",
+    "name": "Home",
+    "alarmState": "DISARMED",
+    "userRoleAtLocation": "ADMIN",
+    "devices": [
+        {
+            "features": {
+                "temperature": {"states": {"temperature": {"lastUpdated": "2022-12-31T16:27:03.967Z", "value": 19.4}}},
+                "diagnostic": {
+                    "states": {
+                        "networklinkaddress": {"lastUpdated": "2022-12-22T05:50:26.083Z", "value": "0015BC002C101A48"},
+                        "networklinkstrength": {"lastUpdated": "2022-12-31T16:27:48.088Z", "value": 89},
+                    }
+                },
+                "metering": {
+                    "states": {
+                        "check": {"lastUpdated": None, "value": None},
+                        "demand": {"lastUpdated": "2023-01-25T10:27:03.520Z", "value": 1520},
+                        "summationdelivered": {"lastUpdated": "2023-01-25T10:27:03.520Z", "value": 21760},
+                        "summationreceived": {"lastUpdated": "2023-01-25T10:27:03.520Z", "value": 0},
+                    }
+                },
+            },
+            "id": DEVICE_ID,
+            "location": "Floor 0 - Hallway",
+            "modelId": "a6bd2d4a-3a52-4c12-bd1d-8f1b4a5c7b0e",
+            "modelName": "EMI Norwegian HAN",
+            "name": "HAN plug",
+            "online": True,
+            "serialNumber": "0015BC001B024D7A",
+        }
+    ],
+}
+EVENT = {
+    "type": "device-state-changed",
+    "data": {
+        "deviceId": DEVICE_ID,
+        "locationId": LOCATION_ID,
+        "rootLocationId": LOCATION_ID,
+        "changes": [
+            {"feature": "metering", "stateName": "demand", "value": 2000, "lastUpdated": "2023-01-25T10:28:03.520Z"}
+        ],
+    },
+}
+
+
+class TestAsyncHomely(IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.sio = socketio.AsyncServer(async_mode="aiohttp")
+        self.home_delay = 0
+        app = web.Application()
+        app.router.add_post("/homely/oauth/token", self.token)
+        app.router.add_get("/homely/locations", self.locations)
+        app.router.add_get(f"/homely/home/{LOCATION_ID}", self.home)
+        self.sio.attach(app)
+
+        @self.sio.event
+        async def connect(sid, environ):
+            self.sio.start_background_task(emit_event, self.sio, sid, EVENT)
+
+        self.server = TestServer(app)
+        await self.server.start_server()
+        base_url = str(self.server.make_url("")).rstrip("/")
+        self.homely = AsyncHomely("user", "password", sdk_url=base_url, web_socket_url=base_url)
+
+    async def asyncTearDown(self):
+        await self.homely.close()
+        await self.server.close()
+
+    async def token(self, request):
+        data = await request.post()
+        if data["password"] != "password":
+            return web.Response(status=401, text="Unauthorized")
+        return web.json_response(TOKEN, status=201)
+
+    async def locations(self, request):
+        self.assertEqual("Bearer access", request.headers["Authorization"])
+        return web.json_response(
+            [{"name": "Home", "role": "ADMIN", "userId": "user", "locationId": LOCATION_ID, "gatewayserial": "1"}]
+        )
+
+    async def home(self, request):
+        await asyncio.sleep(self.home_delay)
+        return web.json_response(HOME)
+
+    async def test_get_location(self):
+        locations = await self.homely.get_locations()
+        location = await self.homely.get_location(locations[0].location_id)
+        self.assertEqual(1520, location.find_device(DEVICE_ID).metering.demand)
+
+    async def test_authentication_failure(self):
+        self.homely.password = "wrong"
+        with self.assertRaises(AuthenticationFailedException):
+            await self.homely.get_locations()
+
+    async def test_stream(self):
+        location = await self.homely.get_location(LOCATION_ID)
+        stream = self.homely.stream(location)
+        single_location, device, states = await asyncio.wait_for(stream.__anext__(), 10)
+        await stream.aclose()
+        self.assertIsNone(single_location)
+        self.assertEqual(DEVICE_ID, device.id)
+        self.assertEqual([device.metering], states)
+        self.assertEqual(2000, device.metering.demand)
+
+    async def test_events_during_resync_apply_on_top(self):
+        alarm_event = {
+            "type": "alarm-state-changed",
+            "data": {"locationId": LOCATION_ID, "state": "ARMED_AWAY", "timestamp": "2023-01-25T10:28:03.520Z"},
+        }
+        connections = []
+
+        @self.sio.event
+        async def connect(sid, environ):
+            connections.append(sid)
+            if len(connections) == 1:
+                self.sio.start_background_task(self.sio.disconnect, sid)
+            else:
+                # Arrives while the client fetches the location after reconnecting
+                self.home_delay = 0.3
+                self.sio.start_background_task(emit_event, self.sio, sid, alarm_event)
+
+        self.homely.metrics = metrics = Metrics()
+        self.homely.reconnect_scheduler = functools.partial(ReconnectScheduler, initial_delay=0.01)
+        location = await self.homely.get_location(LOCATION_ID)
+        stream = self.homely.stream(location)
+        single_location, device, states = await asyncio.wait_for(stream.__anext__(), 10)
+        self.assertEqual(1, metrics.counter("resyncs_total"))
+        await asyncio.sleep(0.3)
+        await stream.aclose()
+        self.assertIs(location, single_location)
+        self.assertEqual("ARMED_AWAY", location.alarm_state)
+
+    async def test_failing_callback_does_not_stall_events_after_resync(self):
+        alarm_event = {
+            "type": "alarm-state-changed",
+            "data": {"locationId": LOCATION_ID, "state": "ARMED_AWAY", "timestamp": "2023-01-25T10:28:03.520Z"},
+        }
+        connections = []
+
+        async def emit_later(sid):
+            await asyncio.sleep(0.5)
+            await emit_event(self.sio, sid, EVENT)
+
+        @self.sio.event
+        async def connect(sid, environ):
+            connections.append(sid)
+            if len(connections) == 1:
+                self.sio.start_background_task(self.sio.disconnect, sid)
+            else:
+                self.home_delay = 0.2
+                self.sio.start_background_task(emit_event, self.sio, sid, alarm_event)
+                self.sio.start_background_task(emit_later, sid)
+
+        calls = []
+
+        def callback(single_location, device, states):
+            calls.append(device)
+            if device is None:
+                raise RuntimeError("callback failed")
+
+        self.homely.reconnect_scheduler = functools.partial(ReconnectScheduler, initial_delay=0.01)
+        location = await self.homely.get_location(LOCATION_ID)
+        device = location.find_device(DEVICE_ID)
+        task = asyncio.ensure_future(self.homely.run_socket_io(location, callback))
+        try:
+            with self.assertLogs("homelypy.async_homely", "ERROR"):
+                for _ in range(100):
+                    if device.metering.demand == 2000:
+                        break
+                    await asyncio.sleep(0.05)
+        finally:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self.assertEqual("ARMED_AWAY", location.alarm_state)
+        self.assertEqual(2000, device.metering.demand)
+        self.assertEqual([None, device], calls)
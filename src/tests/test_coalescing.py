@@ -0,0 +1,58 @@
+import time
+from unittest import TestCase
+
+from homelypy.coalescing import EventCoalescer
+from homelypy.devices import create_device_from_rest_response
+
+from tests.test_devices import _single_location, _temperature_sensor_response
+
+
+def _event(device_id: str, feature: str, state_name: str, value, last_updated: str) -> dict:
+    return {
+        "type": "device-state-changed",
+        "data": {
+            "deviceId": device_id,
+            "changes": [{"feature": feature, "stateName": state_name, "value": value, "lastUpdated": last_updated}],
+        },
+    }
+
+
+class TestEventCoalescer(TestCase):
+    def setUp(self):
+        self.handled = []
+        self.location = _single_location(
+            [create_device_from_rest_response(_temperature_sensor_response("a", "serial-a", "Kitchen"))]
+        )
+        # A window long enough for the test to control delivery with flush()
+        self.coalescer = EventCoalescer(lambda single_location, event: self.handled.append(event), window=60)
+
+    def tearDown(self):
+        self.coalescer.stop()
+
+    def test_merges_changes_per_device(self):
+        self.coalescer.add(self.location, _event("a", "temperature", "temperature", 4.8, "2023-01-25T10:27:07.786Z"))
+        self.coalescer.add(self.location, _event("a", "alarm", "alarm", True, "2023-01-25T10:27:07.900Z"))
+        self.coalescer.add(self.location, _event("a", "temperature", "temperature", 5.0, "2023-01-25T10:27:08.000Z"))
+        self.coalescer.add(self.location, _event("b", "temperature", "temperature", 1.0, "2023-01-25T10:27:08.000Z"))
+        self.assertEqual([], self.handled)
+        self.coalescer.flush()
+        self.assertEqual(2, len(self.handled))
+        self.assertEqual(
+            [("temperature", 5.0), ("alarm", True)],
+            [(change["feature"], change["value"]) for change in self.handled[0]["data"]["changes"]],
+        )
+        self.assertEqual(4, self.coalescer.received)
+
+    def test_other_events_pass_through(self):
+        event = {"type": "alarm-state-changed", "data": {"state": "ARMED_AWAY"}}
+        self.coalescer.add(self.location, event)
+        self.assertEqual([event], self.handled)
+
+    def test_window_expiry(self):
+        coalescer = EventCoalescer(lambda single_location, event: self.handled.append(event), window=0.01)
+        coalescer.add(self.location, _event("a", "temperature", "temperature", 4.8, "2023-01-25T10:27:07.786Z"))
+        deadline = time.monotonic() + 5
+        while not self.handled and time.monotonic() < deadline:
+            time.sleep(0.01)
+        coalescer.stop()
+        self.assertEqual(1, len(self.handled))
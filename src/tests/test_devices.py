@@ -3,8 +3,10 @@ from unittest import TestCase
 
 from dateutil.tz import tzutc
 
+from homelypy.filters import ChangeFilter
+from homelypy.history import HistoryStore
 from homelypy.devices import create_device_from_rest_response, WindowSensor, SmokeAlarm, MotionSensorMini, \
-    UnknownDeviceException
+    UnknownDeviceException, SingleLocation, AlarmStates, EMIHANPowersSensor
 
 
 class TestDeviceCreation(TestCase):
@@ -150,3 +152,314 @@ class TestDeviceCreation(TestCase):
         device: MotionSensorMini = create_device_from_rest_response(rest_response)
         self.assertTrue(isinstance(device, MotionSensorMini))
         self.assertEqual(89, device.diagnostic.network_link_strength)
+
+
+class TestDeviceUpdate(TestCase):
+    def setUp(self):
+        self.device: EMIHANPowersSensor = create_device_from_rest_response(
+            {
+                "features": {
+                    "diagnostic": {
+                        "states": {
+                            "networklinkaddress": {"lastUpdated": "2022-12-23T21:40:30.214Z", "value": "0015BC00"},
+                            "networklinkstrength": {"lastUpdated": "2022-12-31T16:17:42.676Z", "value": 47},
+                        }
+                    },
+                    "metering": {
+                        "states": {
+                            "check": {"lastUpdated": None, "value": None},
+                            "demand": {"lastUpdated": "2023-01-25T10:27:03.520Z", "value": 1520},
+                            "summationdelivered": {"lastUpdated": "2023-01-25T10:27:03.520Z", "value": 21760},
+                            "summationreceived": {"lastUpdated": "2023-01-25T10:27:03.520Z", "value": 0},
+                        }
+                    },
+                },
+                "id": "3a1a3d45-2b23-4f55-8d8f-0a8c1ef0f9d1",
+                "location": "Floor 0 - Hallway",
+                "modelId": "a6bd2d4a-3a52-4c12-bd1d-8f1b4a5c7b0e",
+                "modelName": "EMI Norwegian HAN",
+                "name": "HAN plug",
+                "online": True,
+                "serialNumber": "0015BC001B024D7A",
+            }
+        )
+
+    def test_stream_names_map_to_fields(self):
+        states = self.device.update_state(
+            [
+                {
+                    "feature": "metering",
+                    "stateName": "summationdelivered",
+                    "value": 21800,
+                    "lastUpdated": "2023-01-25T10:28:03.520Z",
+                },
+                {
+                    "feature": "metering",
+                    "stateName": "summationreceived",
+                    "value": 5,
+                    "lastUpdated": "2023-01-25T10:28:03.520Z",
+                },
+                {
+                    "feature": "diagnostic",
+                    "stateName": "networklinkstrength",
+                    "value": 50,
+                    "lastUpdated": "2023-01-25T10:28:04.000Z",
+                },
+            ]
+        )
+        self.assertEqual([self.device.metering, self.device.diagnostic], states)
+        self.assertEqual(21800, self.device.metering.summation_delivered)
+        self.assertEqual(
+            datetime.datetime(2023, 1, 25, 10, 28, 3, 520000, tzinfo=tzutc()),
+            self.device.metering.summation_delivered_last_updated,
+        )
+        self.assertEqual(5, self.device.metering.summation_received)
+        self.assertEqual(50, self.device.diagnostic.network_link_strength)
+        self.assertFalse(hasattr(self.device.metering, "summationdelivered"))
+
+    def test_change_filter(self):
+        change_filter = ChangeFilter({("diagnostic", "networklinkstrength"): 5})
+        changes = [
+            {"feature": "metering", "stateName": "demand", "value": 1520, "lastUpdated": "2023-01-25T10:28:03.520Z"},
+            {
+                "feature": "diagnostic",
+                "stateName": "networklinkstrength",
+                "value": 50,
+                "lastUpdated": "2023-01-25T10:28:04.000Z",
+            },
+        ]
+        self.assertEqual([], self.device.update_state(changes, change_filter))
+        self.assertEqual(47, self.device.diagnostic.network_link_strength)
+        self.assertEqual(
+            datetime.datetime(2023, 1, 25, 10, 28, 4, tzinfo=tzutc()),
+            self.device.diagnostic.network_link_strength_last_updated,
+        )
+        self.assertEqual(
+            {("metering", "demand"): 1, ("diagnostic", "networklinkstrength"): 1}, change_filter.timestamp_only_updates
+        )
+        changes[0]["value"] = 1521
+        changes[1]["value"] = 51
+        self.assertEqual([self.device.metering], self.device.update_state(changes, change_filter))
+        changes[1]["value"] = 52
+        self.assertEqual([self.device.diagnostic], self.device.update_state(changes[1:], change_filter))
+
+    def test_no_instance_dictionaries(self):
+        self.assertFalse(hasattr(self.device, "__dict__"))
+        self.assertFalse(hasattr(self.device.metering, "__dict__"))
+
+    def test_unknown_change_is_ignored(self):
+        states = self.device.update_state(
+            [
+                {"feature": "temperature", "stateName": "temperature", "value": 4.8, "lastUpdated": None},
+                {"feature": "metering", "stateName": "bogus", "value": 1, "lastUpdated": None},
+            ]
+        )
+        self.assertEqual([], states)
+        self.assertFalse(hasattr(self.device, "temperature"))
+
+
+def _temperature_sensor_response(device_id: str, serial_number: str, location: str) -> dict:
+    return {
+        "features": {
+            "alarm": {
+                "states": {
+                    "alarm": {"lastUpdated": "2022-12-31T16:34:31.189Z", "value": False},
+                    "tamper": {"lastUpdated": "2022-06-10T15:43:20.402Z", "value": False},
+                }
+            },
+            "battery": {
+                "states": {
+                    "low": {"lastUpdated": "2022-06-10T15:29:20.956Z", "value": False},
+                    "voltage": {"lastUpdated": "2022-12-09T12:33:11.390Z", "value": 2.9},
+                }
+            },
+            "diagnostic": {
+                "states": {
+                    "networklinkaddress": {"lastUpdated": "2022-11-19T22:00:31.223Z", "value": "0015BC0041001B88"},
+                    "networklinkstrength": {"lastUpdated": "2022-12-31T16:07:13.769Z", "value": 92},
+                }
+            },
+            "temperature": {"states": {"temperature": {"lastUpdated": "2022-12-31T16:26:12.692Z", "value": 16}}},
+        },
+        "id": device_id,
+        "location": location,
+        "modelId": "87fa1ae0-824f-4d42-be7a-cc5b6c7b1e35",
+        "modelName": "Window Sensor",
+        "name": "Window Sensor",
+        "online": True,
+        "serialNumber": serial_number,
+    }
+
+
+def _single_location(devices) -> SingleLocation:
+    return SingleLocation(
+        "48617520-863c-4e27-9a05-4ce3cce50f8e",
+        "0215BC001E014469",
+        "Home",
+        AlarmStates.DISARMED,
+        datetime.datetime(2023, 1, 25, tzinfo=tzutc()),
+        "ADMIN",
+        devices,
+    )
+
+
+class TestSingleLocation(TestCase):
+    def setUp(self):
+        self.kitchen = create_device_from_rest_response(_temperature_sensor_response("a", "serial-a", "Kitchen"))
+        self.hallway = create_device_from_rest_response(_temperature_sensor_response("b", "serial-b", "Hallway"))
+        self.location = _single_location([self.kitchen, self.hallway])
+
+    def test_find_device(self):
+        self.assertIs(self.kitchen, self.location.find_device("a"))
+        self.assertIs(self.hallway, self.location.find_device_by_serial_number("serial-b"))
+        self.assertEqual([self.kitchen, self.hallway], self.location.find_devices_by_model_name("Window Sensor"))
+        self.assertEqual([self.hallway], self.location.find_devices_by_location("Hallway"))
+        self.assertIsNone(self.location.find_device("unknown"))
+
+    def test_add_and_remove_device(self):
+        attic = create_device_from_rest_response(_temperature_sensor_response("c", "serial-c", "Attic"))
+        self.location.add_device(attic)
+        self.assertIs(attic, self.location.find_device("c"))
+        self.assertIs(self.kitchen, self.location.remove_device("a"))
+        self.assertIsNone(self.location.find_device("a"))
+        self.assertIsNone(self.location.find_device_by_serial_number("serial-a"))
+        self.assertEqual([], self.location.find_devices_by_location("Kitchen"))
+        self.assertEqual([self.hallway, attic], self.location.devices)
+
+    def test_update_device_state_from_stream(self):
+        device, states = self.location.update_device_state_from_stream(
+            {
+                "deviceId": "b",
+                "changes": [
+                    {
+                        "feature": "temperature",
+                        "stateName": "temperature",
+                        "value": 4.8,
+                        "lastUpdated": "2023-01-25T10:27:07.786Z",
+                    }
+                ],
+            }
+        )
+        self.assertIs(self.hallway, device)
+        self.assertEqual(4.8, self.hallway.temperature.temperature)
+        self.assertEqual([self.hallway.temperature], states)
+
+    def test_history(self):
+        self.location.history = HistoryStore()
+        self.location.update_device_state_from_stream(
+            {
+                "deviceId": "b",
+                "changes": [
+                    {"feature": "temperature", "stateName": "temperature", "value": 4.8, "lastUpdated": None},
+                    {
+                        "feature": "temperature",
+                        "stateName": "temperature",
+                        "value": 4.9,
+                        "lastUpdated": "2023-01-25T10:27:07.786Z",
+                    },
+                ],
+            }
+        )
+        _, values = self.location.history.series("b", "temperature", "temperature")
+        self.assertEqual([4.9], list(values))
+
+    def test_apply_events(self):
+        def event(device_id, value, last_updated):
+            return {
+                "deviceId": device_id,
+                "changes": [
+                    {"feature": "temperature", "stateName": "temperature", "value": value, "lastUpdated": last_updated}
+                ],
+            }
+
+        delta = self.location.apply_events(
+            [
+                event("a", 20, "2023-01-25T10:27:07.786Z"),
+                event("b", 5, "2023-01-25T10:27:08.000Z"),
+                event("a", 18, "2023-01-25T10:27:06.000Z"),
+                event("unknown", 5, "2023-01-25T10:27:08.000Z"),
+                event("a", 21, "2023-01-25T10:27:09.000Z"),
+            ]
+        )
+        self.assertEqual([(self.kitchen, [self.kitchen.temperature]), (self.hallway, [self.hallway.temperature])], delta)
+        self.assertEqual(21, self.kitchen.temperature.temperature)
+        self.assertEqual(5, self.hallway.temperature.temperature)
+
+    def test_apply_events_compares_parsed_timestamps(self):
+        def event(value, last_updated=None):
+            change = {"feature": "temperature", "stateName": "temperature", "value": value}
+            if last_updated is not None:
+                change["lastUpdated"] = last_updated
+            return {"deviceId": "a", "changes": [change]}
+
+        self.location.apply_events([event(19), event(20)])
+        self.assertEqual(20, self.kitchen.temperature.temperature)
+        self.location.apply_events(
+            [event(21, "2023-01-25T10:30:00.000Z"), event(22, "2023-01-25T12:00:00.000+02:00"), event(23)]
+        )
+        self.assertEqual(21, self.kitchen.temperature.temperature)
+
+    def test_merge(self):
+        kitchen = _temperature_sensor_response("a", "serial-a", "Kitchen")
+        kitchen["features"]["temperature"]["states"]["temperature"] = {
+            "lastUpdated": "2023-01-25T10:27:07.786Z",
+            "value": 21,
+        }
+        attic = _temperature_sensor_response("c", "serial-c", "Attic")
+        fresh = _single_location([create_device_from_rest_response(kitchen), create_device_from_rest_response(attic)])
+        fresh.alarm_state = AlarmStates.ARMED_AWAY
+        temperature = self.kitchen.temperature
+
+        changes = self.location.merge(fresh)
+        self.assertEqual([(self.kitchen, [temperature])], changes.updated)
+        self.assertEqual([self.hallway], changes.removed)
+        self.assertEqual(["c"], [device.id for device in changes.added])
+        self.assertTrue(changes.alarm_state_changed)
+        self.assertIs(temperature, self.location.find_device("a").temperature)
+        self.assertEqual(21, temperature.temperature)
+        self.assertIsNone(self.location.find_device("b"))
+        self.assertEqual(["a", "c"], [device.id for device in self.location.devices])
+        self.assertFalse(self.location.merge(fresh))
+
+    def _fresh_kitchen(self, value: float, last_updated: str):
+        kitchen = _temperature_sensor_response("a", "serial-a", "Kitchen")
+        kitchen["features"]["temperature"]["states"]["temperature"] = {"lastUpdated": last_updated, "value": value}
+        hallway = _temperature_sensor_response("b", "serial-b", "Hallway")
+        return _single_location([create_device_from_rest_response(kitchen), create_device_from_rest_response(hallway)])
+
+    def test_merge_keeps_newer_streamed_state(self):
+        self.location.update_device_state_from_stream(
+            {
+                "deviceId": "a",
+                "changes": [
+                    {
+                        "feature": "temperature",
+                        "stateName": "temperature",
+                        "value": 25,
+                        "lastUpdated": "2030-01-01T00:00:00.000Z",
+                    }
+                ],
+            }
+        )
+        self.assertFalse(self.location.merge(self._fresh_kitchen(16, "2022-12-31T16:26:12.692Z")))
+        self.assertEqual(25, self.kitchen.temperature.temperature)
+        self.assertEqual(2030, self.kitchen.temperature.temperature_last_updated.year)
+
+    def test_merge_timestamp_only_update_is_not_a_change(self):
+        self.location.change_filter = ChangeFilter({"temperature": 1})
+        self.assertFalse(self.location.merge(self._fresh_kitchen(16, "2023-01-25T10:27:07.786Z")))
+        self.assertEqual(2023, self.kitchen.temperature.temperature_last_updated.year)
+        self.assertFalse(self.location.merge(self._fresh_kitchen(16.5, "2023-01-26T10:27:07.786Z")))
+        self.assertEqual(16, self.kitchen.temperature.temperature)
+        self.assertEqual(26, self.kitchen.temperature.temperature_last_updated.day)
+
+    def test_merge_reindexes_only_for_indexed_attributes(self):
+        by_id = self.location._devices_by_id
+        fresh = self._fresh_kitchen(16, "2022-12-31T16:26:12.692Z")
+        fresh.find_device("a").online = False
+        self.assertEqual([(self.kitchen, [])], self.location.merge(fresh).updated)
+        self.assertIs(by_id, self.location._devices_by_id)
+        fresh.find_device("a").location = "Attic"
+        self.location.merge(fresh)
+        self.assertEqual([self.kitchen], self.location.find_devices_by_location("Attic"))
+        self.assertEqual([], self.location.find_devices_by_location("Kitchen"))
@@ -0,0 +1,64 @@
+import threading
+from types import SimpleNamespace
+from unittest import TestCase
+
+from homelypy.dispatch import CallbackDispatcher, BackpressurePolicy
+
+
+class TestCallbackDispatcher(TestCase):
+    def setUp(self):
+        self.release = threading.Event()
+        self.started = threading.Event()
+        self.calls = []
+
+    def slow_callback(self, single_location, device, states):
+        self.started.set()
+        self.release.wait(5)
+        self.calls.append((device.id, list(states)))
+
+    def stall(self, dispatcher: CallbackDispatcher):
+        """Keeps the single worker busy with a first event so that the following ones stay queued."""
+        dispatcher(None, SimpleNamespace(id="first"), [])
+        self.assertTrue(self.started.wait(5))
+
+    def test_block(self):
+        with CallbackDispatcher(self.slow_callback) as dispatcher:
+            self.release.set()
+            for i in range(10):
+                dispatcher(None, SimpleNamespace(id=str(i)), [i])
+            self.assertTrue(dispatcher.join(5))
+        self.assertEqual([(str(i), [i]) for i in range(10)], self.calls)
+        self.assertEqual(10, dispatcher.processed)
+
+    def test_drop_oldest(self):
+        dispatcher = CallbackDispatcher(self.slow_callback, max_queue_size=2, policy=BackpressurePolicy.DROP_OLDEST)
+        self.stall(dispatcher)
+        for i in range(5):
+            dispatcher(None, SimpleNamespace(id=str(i)), [])
+        self.assertEqual(2, dispatcher.queue_depth)
+        self.assertEqual(3, dispatcher.dropped)
+        self.release.set()
+        dispatcher.stop(5)
+        self.assertEqual(["first", "3", "4"], [device_id for device_id, _ in self.calls])
+
+    def test_coalesce_latest(self):
+        dispatcher = CallbackDispatcher(self.slow_callback, policy=BackpressurePolicy.COALESCE_LATEST)
+        self.stall(dispatcher)
+        temperature, battery = object(), object()
+        dispatcher(None, SimpleNamespace(id="a"), [temperature])
+        dispatcher(None, SimpleNamespace(id="b"), [temperature])
+        dispatcher(None, SimpleNamespace(id="a"), [temperature, battery])
+        self.assertEqual(2, dispatcher.queue_depth)
+        self.assertEqual(1, dispatcher.coalesced)
+        self.release.set()
+        dispatcher.stop(5)
+        self.assertEqual([("first", []), ("a", [temperature, battery]), ("b", [temperature])], self.calls)
+
+    def test_failing_callback(self):
+        def failing_callback(single_location, device, states):
+            raise ValueError("Database unavailable")
+
+        with CallbackDispatcher(failing_callback) as dispatcher:
+            dispatcher(None, SimpleNamespace(id="a"), [])
+            self.assertTrue(dispatcher.join(5))
+        self.assertEqual(1, dispatcher.failed)
@@ -0,0 +1,130 @@
+import asyncio
+import functools
+import gc
+import os
+import tempfile
+import unittest
+import warnings
+from unittest import IsolatedAsyncioTestCase
+
+try:
+    from homelypy import fake_server
+    from homelypy.fake_server import FakeHomelyServer
+except ImportError:
+    raise unittest.SkipTest("aiohttp is not installed")
+
+from homelypy.async_homely import AsyncHomely
+from homelypy.homely import AuthenticationFailedException, Homely
+from homelypy.metrics import Metrics
+from homelypy.recording import EventRecorder, EventReplayer
+from homelypy.reconnect import ReconnectScheduler
+
+
+class TestFakeHomelyServer(IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.server = FakeHomelyServer(location_count=2, device_count=20, rate=50)
+        self.base_url = await self.server.start()
+        self.homely = AsyncHomely("user", "password", sdk_url=self.base_url, web_socket_url=self.base_url)
+
+    async def asyncTearDown(self):
+        await self.homely.close()
+        await self.server.stop()
+
+    async def test_get_locations(self):
+        locations = await self.homely.get_locations()
+        self.assertEqual(2, len(locations))
+        location = await self.homely.get_location(locations[1].location_id)
+        self.assertEqual(20, len(location.devices))
+        self.assertEqual(1, self.server.counters["authentications"])
+
+    async def test_sync_client(self):
+        homely = Homely("user", "password", sdk_url=self.base_url, web_socket_url=self.base_url)
+        try:
+            loop = asyncio.get_running_loop()
+            locations = await loop.run_in_executor(None, homely.get_locations)
+            location = await loop.run_in_executor(None, homely.get_location, locations[0].location_id)
+        finally:
+            homely.close()
+        self.assertEqual(20, len(location.devices))
+
+    async def test_authentication_failure(self):
+        self.homely.password = "wrong"
+        with self.assertRaises(AuthenticationFailedException):
+            await self.homely.get_locations()
+        self.assertEqual(1, self.server.counters["rejected_requests"])
+
+    async def test_refresh_token(self):
+        await self.homely.get_locations()
+        await self.homely.reauthenticate()
+        await self.homely.get_locations()
+        self.assertEqual(1, self.server.counters["refreshes"])
+
+    async def test_stream(self):
+        location_id = next(iter(self.server.locations))
+        location = await self.homely.get_location(location_id)
+        stream = self.homely.stream(location)
+        single_location, device, states = await asyncio.wait_for(stream.__anext__(), 10)
+        await stream.aclose()
+        self.assertIs(device, location.find_device(device.id))
+        self.assertTrue(states)
+        self.assertEqual(1, self.server.counters["connections"])
+        self.assertGreaterEqual(self.server.counters["events_emitted"], 1)
+
+    async def test_record_and_replay(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "events.journal")
+            location_id = next(iter(self.server.locations))
+            initial = await self.homely.get_location(location_id)
+            location = await self.homely.get_location(location_id)
+            self.homely.recorder = EventRecorder(path)
+            stream = self.homely.stream(location)
+            for _ in range(3):
+                await asyncio.wait_for(stream.__anext__(), 10)
+            await stream.aclose()
+            self.homely.recorder.close()
+            with EventReplayer(path) as replayer:
+                self.assertGreaterEqual(replayer.replay(initial, speed=None), 3)
+        self.assertEqual(location.devices, initial.devices)
+
+    async def test_direct_emit_is_still_needed(self):
+        if not fake_server._DIRECT_EMIT:
+            self.skipTest("emit_event uses the public AsyncServer.emit")
+        location_id = next(iter(self.server.locations))
+        location = await self.homely.get_location(location_id)
+        stream = self.homely.stream(location)
+        await asyncio.wait_for(stream.__anext__(), 10)
+        sid = next(iter(self.server._sockets[location_id]))
+        try:
+            with warnings.catch_warnings():
+                # The failing emit leaves its coroutines unawaited
+                warnings.simplefilter("ignore", RuntimeWarning)
+                with self.assertRaises(TypeError, msg="AsyncServer.emit works, drop the workaround"):
+                    await self.server.sio.emit("event", self.server.random_event(location_id), room=sid)
+                gc.collect()
+        finally:
+            await stream.aclose()
+
+    async def test_reconnect_and_resync(self):
+        await self.server.stop()
+        self.server = FakeHomelyServer(device_count=5, rate=20, disconnect_interval=0.3)
+        base_url = await self.server.start()
+        metrics = Metrics()
+        self.homely = AsyncHomely(
+            "user",
+            "password",
+            sdk_url=base_url,
+            web_socket_url=base_url,
+            metrics=metrics,
+            reconnect_scheduler=functools.partial(ReconnectScheduler, initial_delay=0.05),
+        )
+        location = await self.homely.get_location(next(iter(self.server.locations)))
+        task = asyncio.ensure_future(self.homely.run_socket_io(location))
+        for _ in range(100):
+            if metrics.counter("resyncs_total"):
+                break
+            await asyncio.sleep(0.05)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        self.assertGreaterEqual(self.server.counters["forced_disconnects"], 1)
+        self.assertGreaterEqual(metrics.counter("reconnects_total"), 1)
+        self.assertGreaterEqual(metrics.counter("resyncs_total"), 1)
@@ -0,0 +1,44 @@
+import datetime
+from unittest import TestCase
+
+from homelypy.history import HistoryStore
+
+START = datetime.datetime(2023, 1, 25, 10, 0, tzinfo=datetime.timezone.utc)
+
+
+def at(seconds: float) -> datetime.datetime:
+    return START + datetime.timedelta(seconds=seconds)
+
+
+class TestHistoryStore(TestCase):
+    def setUp(self):
+        self.history = HistoryStore(capacity=4)
+        for seconds, value in [(0, 10.0), (10, 12.0), (20, 11.0), (30, 15.0), (40, 13.0), (50, 17.0)]:
+            self.history.record("a", "temperature", "temperature", at(seconds), value)
+
+    def test_ring_buffer_keeps_latest(self):
+        timestamps, values = self.history.series("a", "temperature", "temperature")
+        self.assertEqual([11.0, 15.0, 13.0, 17.0], list(values))
+        self.assertEqual([at(s).timestamp() for s in (20, 30, 40, 50)], list(timestamps))
+
+    def test_aggregate(self):
+        aggregate = self.history.aggregate("a", "temperature", "temperature", since=at(25), until=at(50))
+        self.assertEqual(3, aggregate.count)
+        self.assertEqual(13.0, aggregate.min)
+        self.assertEqual(17.0, aggregate.max)
+        self.assertEqual(15.0, aggregate.mean)
+        self.assertEqual(0.1, aggregate.rate)
+        self.assertIsNone(self.history.aggregate("b", "temperature", "temperature"))
+
+    def test_resample(self):
+        self.assertEqual(
+            [(at(0).timestamp(), 13.0), (at(40).timestamp(), 15.0)],
+            self.history.resample("a", "temperature", "temperature", 40, since=at(0)),
+        )
+
+    def test_ignores_out_of_order_and_non_numeric(self):
+        self.history.record("a", "temperature", "temperature", at(45), 1.0)
+        self.history.record("a", "diagnostic", "networklinkaddress", at(60), "0015BC0041001B88")
+        self.history.record("a", "alarm", "tamper", at(60), True)
+        self.assertEqual(1, self.history.out_of_order)
+        self.assertEqual([("a", "temperature", "temperature")], self.history.keys())
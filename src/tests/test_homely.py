@@ -0,0 +1,153 @@
+import gzip
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from unittest import TestCase
+
+from homelypy.devices import Location
+from homelypy.homely import (
+    Homely,
+    create_session,
+    dump_locations,
+    RETRY_STATUS_CODES,
+    AUTHENTICATION_ENDPOINT,
+    LOCATIONS_ENDPOINT,
+    SINGLE_LOCATION_ENDPOINT,
+    SDK_URL,
+)
+
+
+class FakeResponse:
+    def __init__(self, status_code: int, data):
+        self.status_code = status_code
+        self.data = data
+        self.text = str(data)
+
+    def json(self):
+        return self.data
+
+    def iter_content(self, chunk_size):
+        content = json.dumps(self.data, indent=2).encode()
+        for start in range(0, len(content), chunk_size):
+            yield content[start : start + chunk_size]
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+class FakeSession:
+    def __init__(self, responses: dict):
+        self.responses = responses
+        self.calls = []
+
+    def post(self, url, data=None, timeout=None):
+        self.calls.append(("POST", url, timeout))
+        return self.responses[url]
+
+    def get(self, url, headers=None, timeout=None, stream=False):
+        self.calls.append(("GET", url, timeout))
+        return self.responses[url]
+
+
+TOKEN = {"access_token": "access", "expires_in": 60, "refresh_token": "refresh", "refresh_expires_in": 1800}
+
+
+def url(endpoint: str) -> str:
+    return SDK_URL + endpoint
+
+
+class TestSession(TestCase):
+    def test_create_session(self):
+        session = create_session(max_retries=5, backoff_factor=1, pool_maxsize=4)
+        adapter = session.get_adapter("https://sdk.iotiliti.cloud")
+        self.assertEqual(5, adapter.max_retries.total)
+        self.assertEqual(1, adapter.max_retries.backoff_factor)
+        self.assertEqual(set(RETRY_STATUS_CODES), set(adapter.max_retries.status_forcelist))
+        self.assertEqual(4, adapter._pool_maxsize)
+
+    def test_injected_session_is_reused(self):
+        session = FakeSession(
+            {
+                url(AUTHENTICATION_ENDPOINT): FakeResponse(201, TOKEN),
+                url(LOCATIONS_ENDPOINT): FakeResponse(
+                    200,
+                    [
+                        {
+                            "name": "Home",
+                            "role": "ADMIN",
+                            "userId": "user",
+                            "locationId": "location",
+                            "gatewayserial": "serial",
+                        }
+                    ],
+                ),
+            }
+        )
+        homely = Homely("user", "password", session=session, timeout=7)
+        locations = homely.get_locations()
+        homely.get_locations()
+        self.assertEqual("location", locations[0].location_id)
+        self.assertEqual(
+            [
+                ("POST", url(AUTHENTICATION_ENDPOINT), 7),
+                ("GET", url(LOCATIONS_ENDPOINT), 7),
+                ("GET", url(LOCATIONS_ENDPOINT), 7),
+            ],
+            session.calls,
+        )
+
+
+class TestRouteEvent(TestCase):
+    def test_route_by_location_id(self):
+        homely = Homely("user", "password", session=FakeSession({}))
+        home, cabin = object(), object()
+        homely.single_locations = {"home": home, "cabin": cabin}
+        self.assertIs(cabin, homely.route_event({"data": {"rootLocationId": "cabin", "locationId": "x"}}, home))
+        self.assertIs(cabin, homely.route_event({"data": {"locationId": "cabin"}}, home))
+        self.assertIs(home, homely.route_event({"data": {"locationId": "unknown"}}, home))
+
+
+class TestDumpLocations(TestCase):
+    def test_dump_to_compressed_jsonl(self):
+        locations = [Location(f"Home {i}", "ADMIN", "user", f"location-{i}", "serial") for i in range(5)]
+        responses = {url(AUTHENTICATION_ENDPOINT): FakeResponse(201, TOKEN)}
+        for location in locations:
+            responses[url(SINGLE_LOCATION_ENDPOINT) + f"/{location.location_id}"] = FakeResponse(
+                200, {"locationId": location.location_id, "name": "multi\nline"}
+            )
+        homely = Homely("user", "password", session=FakeSession(responses))
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "locations.jsonl.gz")
+            dump_locations(homely, locations, workers=3, jsonl_filename=filename)
+            with gzip.open(filename, "rt") as jsonl:
+                dumped = [json.loads(line) for line in jsonl]
+        self.assertEqual(
+            sorted(location.location_id for location in locations), sorted(d["locationId"] for d in dumped)
+        )
+        self.assertEqual("multi\nline", dumped[0]["name"])
+
+
+class TestImport(TestCase):
+    def test_import_has_no_side_effects(self):
+        script = (
+            "import logging, sys\n"
+            "import homelypy.homely\n"
+            "print([name for name in ('requests', 'socketio', 'websocket', 'dateutil') if name in sys.modules])\n"
+            "print(logging.getLogger().handlers)\n"
+        )
+        output = subprocess.run(
+            [sys.executable, "-c", script],
+            capture_output=True,
+            text=True,
+            check=True,
+            env={**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)},
+        ).stdout
+        self.assertEqual("[]\n[]\n", output)
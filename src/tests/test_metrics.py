@@ -0,0 +1,109 @@
+import pickle
+from unittest import TestCase
+
+from homelypy.homely import (
+    AUTHENTICATION_ENDPOINT,
+    LOCATIONS_ENDPOINT,
+    Homely,
+    create_single_location,
+)
+from homelypy.metrics import Metrics, NULL_METRICS, prometheus_text
+from homelypy.synthetic import location_response
+from tests.test_homely import FakeResponse, FakeSession, TOKEN, url
+
+
+class TestMetrics(TestCase):
+    def test_counters_by_labels(self):
+        metrics = Metrics()
+        metrics.increment("events_received_total", type="device-state-changed")
+        metrics.increment("events_received_total", 2, type="device-state-changed")
+        metrics.increment("events_received_total", type="alarm-state-changed")
+        self.assertEqual(3, metrics.counter("events_received_total", type="device-state-changed"))
+        self.assertEqual(1, metrics.counter("events_received_total", type="alarm-state-changed"))
+        self.assertEqual(0, metrics.counter("reconnects_total"))
+
+    def test_histogram(self):
+        metrics = Metrics(buckets=(0.1, 1))
+        for value in (0.05, 0.1, 0.5, 2):
+            metrics.observe("callback_duration_seconds", value)
+        histogram = metrics.histogram("callback_duration_seconds")
+        self.assertEqual([2, 1, 1], histogram.counts)
+        self.assertEqual(4, histogram.count)
+        self.assertAlmostEqual(2.65, histogram.sum)
+
+    def test_prometheus_text(self):
+        metrics = Metrics(buckets=(0.1, 1))
+        metrics.increment("rest_requests_total", endpoint="/homely/locations", status="200")
+        metrics.increment("unknown_features_total", feature='odd"name', state="x")
+        metrics.observe("callback_duration_seconds", 0.5)
+        text = prometheus_text(metrics)
+        self.assertIn("# TYPE homely_rest_requests_total counter\n", text)
+        self.assertIn('homely_rest_requests_total{endpoint="/homely/locations",status="200"} 1\n', text)
+        self.assertIn('homely_unknown_features_total{feature="odd\\"name",state="x"} 1\n', text)
+        self.assertIn("# TYPE homely_callback_duration_seconds histogram\n", text)
+        self.assertIn('homely_callback_duration_seconds_bucket{le="0.1"} 0\n', text)
+        self.assertIn('homely_callback_duration_seconds_bucket{le="1"} 1\n', text)
+        self.assertIn('homely_callback_duration_seconds_bucket{le="+Inf"} 1\n', text)
+        self.assertIn("homely_callback_duration_seconds_count 1\n", text)
+        self.assertEqual("", prometheus_text(Metrics()))
+
+    def test_null_metrics(self):
+        with NULL_METRICS.time("callback_duration_seconds"):
+            NULL_METRICS.increment("reconnects_total")
+
+
+class TestClientMetrics(TestCase):
+    def setUp(self):
+        self.metrics = Metrics()
+        self.data = location_response(10)
+        self.single_location = create_single_location(self.data)
+        self.device = self.single_location.devices[0]
+
+    def test_rest_and_authentication(self):
+        session = FakeSession(
+            {url(AUTHENTICATION_ENDPOINT): FakeResponse(201, TOKEN), url(LOCATIONS_ENDPOINT): FakeResponse(500, "")}
+        )
+        homely = Homely("user", "password", session=session, metrics=self.metrics)
+        with self.assertRaises(Exception):
+            homely.get_locations()
+        self.assertEqual(1, self.metrics.counter("authentications_total"))
+        self.assertEqual(0, self.metrics.counter("token_refreshes_total"))
+        self.assertEqual(1, self.metrics.counter("rest_requests_total", endpoint=AUTHENTICATION_ENDPOINT, status="201"))
+        self.assertEqual(1, self.metrics.counter("rest_requests_total", endpoint=LOCATIONS_ENDPOINT, status="500"))
+        self.assertEqual(1, self.metrics.histogram("rest_request_duration_seconds", endpoint=LOCATIONS_ENDPOINT).count)
+
+    def test_event_metrics(self):
+        calls = []
+        homely = Homely("user", "password", session=FakeSession({}), metrics=self.metrics)
+        homely.state_change_callback = lambda *args: calls.append(args)
+        self.single_location.metrics = self.metrics
+        event = {
+            "type": "device-state-changed",
+            "data": {
+                "deviceId": self.device.id,
+                "changes": [
+                    {"feature": "bogus", "stateName": "bogus", "value": 1, "lastUpdated": "2023-01-25T10:27:07.786Z"},
+                    {
+                        "feature": "diagnostic",
+                        "stateName": "networklinkstrength",
+                        "value": 101,
+                        "lastUpdated": "2023-01-25T10:27:07.786Z",
+                    },
+                ],
+            },
+        }
+        homely.handle_event(self.single_location, event)
+        homely.handle_event(self.single_location, {"type": "device-state-changed", "data": {"deviceId": "x"}})
+        self.assertEqual(1, len(calls))
+        self.assertEqual(1, self.metrics.counter("events_applied_total", type="device-state-changed"))
+        self.assertEqual(1, self.metrics.counter("unknown_devices_total"))
+        self.assertEqual(1, self.metrics.counter("unknown_features_total", feature="bogus", state="bogus"))
+        self.assertEqual(2, self.metrics.histogram("event_processing_seconds", type="device-state-changed").count)
+        self.assertEqual(1, self.metrics.histogram("callback_duration_seconds").count)
+
+    def test_pickle_location_without_metrics(self):
+        self.single_location.metrics = self.metrics
+        restored = pickle.loads(pickle.dumps(self.single_location))
+        self.assertIsNone(restored.metrics)
+        self.assertIs(self.metrics, self.single_location.metrics)
+        self.assertEqual(self.device.id, restored.find_device(self.device.id).id)
@@ -0,0 +1,134 @@
+import copy
+import random
+import threading
+from typing import Tuple
+from unittest import TestCase
+
+from homelypy.devices import LocationChanges, SingleLocation
+from homelypy.homely import AUTHENTICATION_ENDPOINT, SINGLE_LOCATION_ENDPOINT, Homely, create_single_location
+from homelypy.metrics import Metrics
+from homelypy.reconnect import ReconnectScheduler
+from homelypy.synthetic import location_response
+from tests.test_homely import FakeResponse, FakeSession, TOKEN, url
+
+
+class TestReconnectScheduler(TestCase):
+    def test_backoff_is_capped(self):
+        scheduler = ReconnectScheduler(initial_delay=1, max_delay=10, multiplier=2, jitter=0)
+        self.assertEqual([1, 2, 4, 8, 10, 10], [scheduler.next_delay() for _ in range(6)])
+
+    def test_jitter(self):
+        scheduler = ReconnectScheduler(initial_delay=8, max_delay=8, jitter=0.5, rng=random.Random(1))
+        delays = [scheduler.next_delay() for _ in range(100)]
+        self.assertTrue(all(4 <= delay <= 8 for delay in delays))
+        self.assertGreater(len(set(delays)), 1)
+
+    def test_reset_after_stable_connection(self):
+        scheduler = ReconnectScheduler(initial_delay=1, jitter=0, stable_after=0)
+        scheduler.next_delay()
+        scheduler.next_delay()
+        scheduler.connected()
+        scheduler.disconnected()
+        self.assertEqual(1, scheduler.next_delay())
+
+    def test_short_connection_keeps_backing_off(self):
+        scheduler = ReconnectScheduler(initial_delay=1, jitter=0, stable_after=60)
+        scheduler.next_delay()
+        scheduler.connected()
+        self.assertEqual(2, scheduler.next_delay())
+
+
+class TestResync(TestCase):
+    def test_missed_changes_are_reported(self):
+        data = location_response(5)
+        single_location = create_single_location(copy.deepcopy(data))
+        device_data = data["devices"][0]
+        device_data["features"]["diagnostic"]["states"]["networklinkstrength"]["value"] = 101
+        data["alarmState"] = "ARMED_AWAY"
+        session = FakeSession(
+            {
+                url(AUTHENTICATION_ENDPOINT): FakeResponse(201, TOKEN),
+                url(SINGLE_LOCATION_ENDPOINT) + f"/{data['locationId']}": FakeResponse(200, data),
+            }
+        )
+        metrics = Metrics()
+        homely = Homely("user", "password", session=session, metrics=metrics)
+        calls = []
+        homely.state_change_callback = lambda *args: calls.append(args)
+        changes = homely.resync_location(single_location)
+        device = single_location.find_device(device_data["id"])
+        self.assertEqual([(device, [device.diagnostic])], changes.updated)
+        self.assertEqual([(single_location, None, []), (None, device, [device.diagnostic])], calls)
+        self.assertEqual(101, device.diagnostic.network_link_strength)
+        self.assertEqual(1, metrics.counter("resyncs_total"))
+
+    def _strength_event(self, device_id: str, value: int, last_updated: str) -> dict:
+        return {
+            "type": "device-state-changed",
+            "data": {
+                "deviceId": device_id,
+                "changes": [
+                    {
+                        "feature": "diagnostic",
+                        "stateName": "networklinkstrength",
+                        "value": value,
+                        "lastUpdated": last_updated,
+                    }
+                ],
+            },
+        }
+
+    def _resync_while_streaming(self, callback) -> Tuple[Homely, SingleLocation, LocationChanges]:
+        """Resyncs a location while a newer device event and alarm event are streamed during the REST call."""
+        data = location_response(5)
+        single_location = create_single_location(copy.deepcopy(data))
+        streamed_events = [
+            self._strength_event(data["devices"][0]["id"], 101, "2030-01-01T00:00:00.000Z"),
+            {"type": "alarm-state-changed", "data": {"state": "ARMED_AWAY", "timestamp": "2030-01-01T00:00:00.000Z"}},
+        ]
+        location_url = url(SINGLE_LOCATION_ENDPOINT) + f"/{data['locationId']}"
+        session = FakeSession(
+            {url(AUTHENTICATION_ENDPOINT): FakeResponse(201, TOKEN), location_url: FakeResponse(200, data)}
+        )
+        homely = Homely("user", "password", session=session)
+        homely.state_change_callback = callback
+        get = session.get
+
+        def get_while_streaming(url, **kwargs):
+            # The websocket delivers newer events on its own threads while the REST call is in flight
+            if url == location_url:
+                for streamed in streamed_events:
+                    thread = threading.Thread(target=homely.handle_event, args=(single_location, streamed))
+                    thread.start()
+                    thread.join()
+            return get(url, **kwargs)
+
+        session.get = get_while_streaming
+        return homely, single_location, homely.resync_location(single_location)
+
+    def test_events_during_resync_apply_on_top(self):
+        calls = []
+        homely, single_location, changes = self._resync_while_streaming(lambda *args: calls.append(args))
+        device = single_location.devices[0]
+        self.assertFalse(changes)
+        self.assertEqual(101, device.diagnostic.network_link_strength)
+        self.assertEqual("ARMED_AWAY", single_location.alarm_state)
+        self.assertEqual([(None, device, [device.diagnostic]), (single_location, None, [])], calls)
+
+    def test_failing_callback_does_not_stall_held_events(self):
+        calls = []
+
+        def callback(*args):
+            calls.append(args)
+            if args[1] is not None:
+                raise RuntimeError("callback failed")
+
+        with self.assertLogs("homelypy.homely", "ERROR"):
+            homely, single_location, _ = self._resync_while_streaming(callback)
+        device = single_location.devices[0]
+        self.assertEqual("ARMED_AWAY", single_location.alarm_state)
+        self.assertEqual({}, homely._held_events)
+        with self.assertRaises(RuntimeError):
+            homely.handle_event(single_location, self._strength_event(device.id, 102, "2031-01-01T00:00:00.000Z"))
+        self.assertEqual(102, device.diagnostic.network_link_strength)
+        self.assertEqual(3, len(calls))
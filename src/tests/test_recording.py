@@ -0,0 +1,84 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from homelypy.homely import apply_stream_event, create_single_location
+from homelypy.recording import JOURNAL_MAGIC, EventRecorder, EventReplayer
+from homelypy.synthetic import location_response, stream_events
+
+
+class TestEventJournal(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "events.journal")
+        self.data = location_response(10)
+        self.events = [
+            {"type": "device-state-changed", "data": data} for data in stream_events(self.data, 20)
+        ] + [{"type": "alarm-state-changed", "data": {"state": "ARMED_AWAY", "timestamp": "2023-01-25T10:27:07.786Z"}}]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def record(self, events, received=1000.0):
+        with EventRecorder(self.path) as recorder:
+            for index, event in enumerate(events):
+                recorder.record(event, received + index)
+
+    def test_round_trip(self):
+        self.record(self.events[:5])
+        self.record(self.events[5:], 2000.0)
+        with EventReplayer(self.path) as replayer:
+            records = list(replayer)
+        self.assertEqual(self.events, [event for _, event in records])
+        expected_times = [1000.0 + index for index in range(5)] + [2000.0 + index for index in range(16)]
+        self.assertEqual(expected_times, [received for received, _ in records])
+
+    def test_not_a_journal(self):
+        with open(self.path, "wb") as journal:
+            journal.write(b'{"type": "alarm-state-changed"}\n')
+        with self.assertRaises(ValueError):
+            EventRecorder(self.path)
+        with self.assertRaises(ValueError):
+            EventReplayer(self.path)
+
+    def test_empty_journal(self):
+        EventRecorder(self.path).close()
+        with open(self.path, "rb") as journal:
+            self.assertEqual(JOURNAL_MAGIC, journal.read())
+        with EventReplayer(self.path) as replayer:
+            self.assertEqual([], list(replayer))
+
+    def test_truncated_record_is_ignored(self):
+        self.record(self.events[:3])
+        with open(self.path, "r+b") as journal:
+            journal.truncate(os.path.getsize(self.path) - 5)
+        with EventReplayer(self.path) as replayer, self.assertLogs("homelypy.recording", "WARNING"):
+            self.assertEqual(self.events[:2], [event for _, event in replayer])
+
+    def test_replay_as_fast_as_possible(self):
+        self.record(self.events)
+        expected = create_single_location(self.data)
+        for event in self.events:
+            apply_stream_event(expected, event)
+        single_location = create_single_location(self.data)
+        callbacks = []
+        with EventReplayer(self.path) as replayer:
+            count = replayer.replay(
+                single_location, lambda *args: callbacks.append(args), speed=None, sleep=self.fail
+            )
+        self.assertEqual(len(self.events), count)
+        self.assertEqual(expected.devices, single_location.devices)
+        self.assertEqual("ARMED_AWAY", single_location.alarm_state)
+        self.assertEqual((single_location, None, []), callbacks[-1])
+
+    def test_replay_speed(self):
+        with EventRecorder(self.path) as recorder:
+            for received, event in zip((100.0, 100.0, 101.0, 103.0), self.events):
+                recorder.record(event, received)
+        delays = []
+        with EventReplayer(self.path) as replayer:
+            replayer.replay(create_single_location(self.data), speed=10, sleep=delays.append)
+        # The sleep does not advance the clock, so each delay is the offset from the first event
+        self.assertEqual(2, len(delays))
+        self.assertAlmostEqual(0.1, delays[0], places=2)
+        self.assertAlmostEqual(0.3, delays[1], places=2)
@@ -0,0 +1,127 @@
+import tempfile
+import threading
+import time
+from unittest import TestCase
+
+from homelypy.homely import Homely, AUTHENTICATION_ENDPOINT, SINGLE_LOCATION_ENDPOINT
+from homelypy.snapshot import LocationCache
+
+from tests.test_devices import _temperature_sensor_response
+from tests.test_homely import FakeResponse, FakeSession, TOKEN, url
+
+LOCATION_ID = "48617520-863c-4e27-9a05-4ce3cce50f8e"
+
+
+def _home(temperature: float) -> dict:
+    device = _temperature_sensor_response("a", "serial-a", "Kitchen")
+    device["features"]["temperature"]["states"]["temperature"]["value"] = temperature
+    return {
+        "locationId": LOCATION_ID,
+        "gatewayserial": "0215BC001E014469",
+        "name": "Home",
+        "alarmState": "DISARMED",
+        "userRoleAtLocation": "ADMIN",
+        "devices": [device],
+    }
+
+
+def _temperature_event(value: float) -> dict:
+    return {
+        "type": "device-state-changed",
+        "data": {
+            "deviceId": "a",
+            "locationId": LOCATION_ID,
+            "changes": [
+                {
+                    "feature": "temperature",
+                    "stateName": "temperature",
+                    "value": value,
+                    "lastUpdated": "2023-01-25T10:27:07.786Z",
+                }
+            ],
+        },
+    }
+
+
+class TestWarmStart(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.responses = {
+            url(AUTHENTICATION_ENDPOINT): FakeResponse(201, TOKEN),
+            url(SINGLE_LOCATION_ENDPOINT) + f"/{LOCATION_ID}": FakeResponse(200, _home(16)),
+        }
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def start(self) -> Homely:
+        return Homely("user", "password", session=FakeSession(self.responses))
+
+    def test_restore_from_snapshot_and_journal(self):
+        homely = self.start()
+        location = homely.warm_start_location(LOCATION_ID, LocationCache(self.directory.name, LOCATION_ID))
+        homely.handle_event(location, _temperature_event(20))
+        homely.handle_event(location, _temperature_event(21))
+        homely.close()
+
+        self.responses[url(SINGLE_LOCATION_ENDPOINT) + f"/{LOCATION_ID}"] = FakeResponse(200, _home(22))
+        homely = self.start()
+        cache = LocationCache(self.directory.name, LOCATION_ID)
+        restored = homely.warm_start_location(LOCATION_ID, cache)
+        self.assertEqual(21, restored.find_device("a").temperature.temperature)
+        # Reconciling writes a new snapshot, which empties the journal
+        deadline = time.monotonic() + 5
+        while cache.journal_events and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(0, cache.journal_events)
+        # The REST value is older than the journaled stream value, so it must not replace it
+        self.assertEqual(21, restored.find_device("a").temperature.temperature)
+        homely.close()
+
+    def test_journal_compaction(self):
+        homely = self.start()
+        cache = LocationCache(self.directory.name, LOCATION_ID, max_journal_events=2)
+        location = homely.warm_start_location(LOCATION_ID, cache)
+        for value in (20, 21, 23):
+            homely.handle_event(location, _temperature_event(value))
+        self.assertEqual(1, cache.journal_events)
+        homely.close()
+        restored, events = LocationCache(self.directory.name, LOCATION_ID).load()
+        self.assertEqual(21, restored.find_device("a").temperature.temperature)
+        self.assertEqual(1, len(events))
+
+    def test_failed_compaction_keeps_journal(self):
+        homely = self.start()
+        cache = LocationCache(self.directory.name, LOCATION_ID, max_journal_events=2)
+        location = homely.warm_start_location(LOCATION_ID, cache)
+        # Fails pickling, as a dict changed by another thread meanwhile would
+        location.unpicklable = threading.Lock()
+        with self.assertLogs("homelypy.snapshot", "ERROR"):
+            for value in (20, 21):
+                homely.handle_event(location, _temperature_event(value))
+        self.assertEqual(2, cache.journal_events)
+        del location.unpicklable
+        homely.handle_event(location, _temperature_event(23))
+        self.assertEqual(0, cache.journal_events)
+        homely.close()
+
+    def test_failed_reconcile_snapshot_is_logged(self):
+        homely = self.start()
+        homely.warm_start_location(LOCATION_ID, LocationCache(self.directory.name, LOCATION_ID))
+        homely.close()
+        homely = self.start()
+        cache = LocationCache(self.directory.name, LOCATION_ID)
+
+        def save_snapshot(single_location):
+            raise RuntimeError("dictionary changed size during iteration")
+
+        cache.save_snapshot = save_snapshot
+        with self.assertLogs("homelypy.homely", "ERROR"):
+            location = homely.warm_start_location(LOCATION_ID, cache)
+            for thread in threading.enumerate():
+                if thread.name.startswith("homely-reconcile"):
+                    thread.join(5)
+        self.assertEqual({}, homely._held_events)
+        homely.handle_event(location, _temperature_event(20))
+        self.assertEqual(20, location.find_device("a").temperature.temperature)
+        homely.close()
@@ -0,0 +1,67 @@
+import json
+from unittest import TestCase
+
+from homelypy.homely import AUTHENTICATION_ENDPOINT, SINGLE_LOCATION_ENDPOINT, Homely, create_single_location
+from homelypy.streaming import LocationStream
+from homelypy.synthetic import location_response
+from tests.test_homely import FakeResponse, FakeSession, TOKEN, url
+
+
+def chunked(data, size: int = 7, indent=None):
+    content = json.dumps(data, indent=indent, ensure_ascii=False).encode()
+    return [content[start : start + size] for start in range(0, len(content), size)]
+
+
+class TestLocationStream(TestCase):
+    def setUp(self):
+        self.data = location_response(20)
+        self.data["name"] = "Hytta på fjellet ✓"
+
+    def test_devices_match_full_parse(self):
+        stream = LocationStream(chunked(self.data))
+        self.assertEqual(create_single_location(self.data).devices, list(stream))
+        self.assertEqual("Hytta på fjellet ✓", stream.fields["name"])
+
+    def test_to_single_location(self):
+        for size in (1, 5, 64 * 1024):
+            single_location = LocationStream(chunked(self.data, size, indent=2)).to_single_location()
+            expected = create_single_location(self.data)
+            self.assertEqual(expected.location_id, single_location.location_id)
+            self.assertEqual(expected.alarm_state, single_location.alarm_state)
+            self.assertEqual(expected.devices, single_location.devices)
+
+    def test_devices_before_other_fields(self):
+        data = {"devices": self.data["devices"], "extra": {"nested": [1, 2.5, None]}, "locationId": "x"}
+        stream = LocationStream(chunked(data))
+        first = next(iter(stream))
+        self.assertEqual(self.data["devices"][0]["id"], first.id)
+        self.assertEqual(19, len(list(stream)))
+        self.assertEqual({"extra": {"nested": [1, 2.5, None]}, "locationId": "x"}, stream.fields)
+
+    def test_unknown_models_are_skipped(self):
+        self.data["devices"][0]["modelName"] = "Bogus model"
+        stream = LocationStream(chunked(self.data))
+        with self.assertLogs("homelypy.streaming", "ERROR"):
+            self.assertEqual(19, len(list(stream)))
+
+    def test_no_devices(self):
+        self.data["devices"] = []
+        self.assertEqual([], LocationStream(chunked(self.data)).to_single_location().devices)
+
+    def test_truncated_json(self):
+        with self.assertRaises(ValueError):
+            list(LocationStream(chunked(self.data)[:-20]))
+
+
+class TestIterLocation(TestCase):
+    def test_iter_location(self):
+        data = location_response(10)
+        session = FakeSession(
+            {
+                url(AUTHENTICATION_ENDPOINT): FakeResponse(201, TOKEN),
+                url(SINGLE_LOCATION_ENDPOINT) + f"/{data['locationId']}": FakeResponse(200, data),
+            }
+        )
+        homely = Homely("user", "password", session=session)
+        single_location = homely.iter_location(data["locationId"], chunk_size=100).to_single_location()
+        self.assertEqual(create_single_location(data).devices, single_location.devices)
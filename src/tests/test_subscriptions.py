@@ -0,0 +1,81 @@
+from unittest import TestCase
+
+from homelypy.homely import create_single_location
+from homelypy.subscriptions import SubscriptionRegistry
+from homelypy.synthetic import location_response
+
+
+class TestSubscriptionRegistry(TestCase):
+    def setUp(self):
+        self.single_location = create_single_location(location_response(8))
+        self.registry = SubscriptionRegistry()
+        self.calls = []
+        self.window_sensor = self.single_location.find_devices_by_model_name("Window Sensor")[0]
+        self.han = self.single_location.find_devices_by_model_name("EMI Norwegian HAN")[0]
+
+    def handler(self, name: str):
+        return lambda *args: self.calls.append((name, *args))
+
+    def test_device_subscription(self):
+        self.registry.subscribe(self.handler("window"), device_id=self.window_sensor.id)
+        states = [self.window_sensor.temperature, self.window_sensor.alarm]
+        self.registry(None, self.window_sensor, states)
+        self.registry(None, self.han, [self.han.metering])
+        self.assertEqual([("window", self.window_sensor, states)], self.calls)
+
+    def test_feature_subscription_gets_feature_states(self):
+        self.registry.subscribe(self.handler("temperature"), feature="temperature")
+        self.registry(None, self.window_sensor, [self.window_sensor.temperature, self.window_sensor.alarm])
+        self.registry(None, self.window_sensor, [self.window_sensor.battery])
+        self.assertEqual([("temperature", self.window_sensor, [self.window_sensor.temperature])], self.calls)
+
+    def test_combined_criteria_and_predicate(self):
+        self.registry.subscribe(self.handler("model"), model_name="EMI Norwegian HAN", feature="metering")
+        self.registry.subscribe(
+            self.handler("high demand"), feature="metering", predicate=lambda device, states: device.metering.demand > 5
+        )
+        self.han.metering.demand = 1
+        self.registry(None, self.han, [self.han.metering])
+        self.registry(None, self.han, [self.han.diagnostic])
+        self.assertEqual([("model", self.han, [self.han.metering])], self.calls)
+
+    def test_handlers_called_in_subscription_order(self):
+        self.registry.subscribe(self.handler("all"))
+        self.registry.subscribe(self.handler("device"), device_id=self.han.id)
+        self.registry.subscribe(self.handler("feature"), feature="metering")
+        self.registry(None, self.han, [self.han.metering])
+        self.assertEqual(["all", "device", "feature"], [call[0] for call in self.calls])
+
+    def test_unsubscribe(self):
+        subscription = self.registry.subscribe(self.handler("device"), device_id=self.han.id)
+        other = self.registry.subscribe(self.handler("all"))
+        self.assertEqual(2, len(self.registry))
+        subscription.cancel()
+        self.registry.unsubscribe(other)
+        self.registry(None, self.han, [self.han.metering])
+        self.assertEqual([], self.calls)
+        self.assertEqual(0, len(self.registry))
+
+    def test_unsubscribe_during_dispatch(self):
+        subscriptions = []
+        self.registry.subscribe(lambda device, states: subscriptions[1].cancel())
+        subscriptions.append(self.registry.subscribe(self.handler("first"), device_id=self.han.id))
+        subscriptions.append(self.registry.subscribe(self.handler("second"), device_id=self.han.id))
+        self.registry(None, self.han, [self.han.metering])
+        self.registry(None, self.han, [self.han.metering])
+        self.assertEqual(["first", "second", "first"], [call[0] for call in self.calls])
+
+    def test_alarm_subscriptions(self):
+        self.registry.subscribe_alarm(self.handler("this"), self.single_location.location_id)
+        self.registry.subscribe_alarm(self.handler("other"), "other")
+        self.registry.subscribe_alarm(self.handler("any"))
+        self.registry.subscribe(self.handler("device"))
+        self.registry(self.single_location, None, [])
+        self.assertEqual([("this", self.single_location), ("any", self.single_location)], self.calls)
+
+    def test_failing_handler(self):
+        self.registry.subscribe(lambda device, states: 1 / 0)
+        self.registry.subscribe(self.handler("all"))
+        with self.assertLogs("homelypy.subscriptions", "ERROR"):
+            self.registry(None, self.han, [self.han.metering])
+        self.assertEqual(1, len(self.calls))
@@ -0,0 +1,14 @@
+from unittest import TestCase
+
+from homelypy.devices import DEVICE_MAP
+from homelypy.homely import create_single_location
+from homelypy.synthetic import MODEL_STATES, location_response
+
+
+class TestSynthetic(TestCase):
+    def test_every_model_has_synthetic_states(self):
+        self.assertEqual(set(DEVICE_MAP), set(MODEL_STATES))
+
+    def test_location_has_every_model(self):
+        single_location = create_single_location(location_response(len(DEVICE_MAP)))
+        self.assertEqual(set(DEVICE_MAP), {device.model_name for device in single_location.devices})
@@ -0,0 +1,38 @@
+import datetime
+from unittest import TestCase
+
+from dateutil.parser import parse
+from dateutil.tz import tzutc
+
+from homelypy.timestamps import parse_timestamp, configure_timestamp_cache, timestamp_at_least
+
+
+class TestParseTimestamp(TestCase):
+    def tearDown(self):
+        configure_timestamp_cache()
+
+    def test_homely_format(self):
+        self.assertEqual(
+            datetime.datetime(2023, 1, 25, 10, 27, 7, 786000, tzinfo=tzutc()),
+            parse_timestamp("2023-01-25T10:27:07.786Z"),
+        )
+
+    def test_matches_dateutil(self):
+        for value in ["2022-12-31T16:34:31.189Z", "2022-06-10T00:00:00.000Z", "2020-02-29T23:59:59.999Z"]:
+            self.assertEqual(parse(value), parse_timestamp(value))
+
+    def test_fallback_to_dateutil(self):
+        for value in ["2023-01-25T10:27:07Z", "2023-01-25T10:27:07.786123+01:00", "2023-01-25"]:
+            self.assertEqual(parse(value), parse_timestamp(value))
+
+    def test_timestamp_at_least(self):
+        self.assertTrue(timestamp_at_least("2023-01-25T10:27:08.000Z", "2023-01-25T10:27:07.786Z"))
+        self.assertTrue(timestamp_at_least("2023-01-25T10:27:07.786Z", "2023-01-25T10:27:07.786Z"))
+        self.assertFalse(timestamp_at_least("2023-01-25T10:27:07.786Z", "2023-01-25T10:27:08.000Z"))
+        # As strings these would sort the other way round
+        self.assertTrue(timestamp_at_least("2023-01-25T10:27:08.500Z", "2023-01-25T10:27:08Z"))
+        self.assertFalse(timestamp_at_least("2023-01-25T12:00:00.000+02:00", "2023-01-25T10:30:00.000Z"))
+
+    def test_without_cache(self):
+        configure_timestamp_cache(0)
+        self.assertEqual(parse("2023-01-25T10:27:07.786Z"), parse_timestamp("2023-01-25T10:27:07.786Z"))
@@ -0,0 +1,81 @@
+import os
+import tempfile
+import threading
+import time
+from unittest import TestCase
+
+from homelypy.homely import AUTHENTICATION_ENDPOINT, REFRESH_TOKEN_ENDPOINT, Homely
+from homelypy.tokens import FileTokenCache
+from tests.test_homely import FakeResponse, FakeSession, TOKEN, url
+
+REFRESHED_TOKEN = {**TOKEN, "access_token": "refreshed", "refresh_token": "refreshed"}
+
+
+class SlowSession(FakeSession):
+    def post(self, url, data=None, timeout=None):
+        time.sleep(0.05)
+        return super().post(url, data, timeout)
+
+
+def posts(session: FakeSession, endpoint: str) -> int:
+    return sum(1 for method, called_url, _ in session.calls if method == "POST" and called_url == url(endpoint))
+
+
+class TestTokenManager(TestCase):
+    def setUp(self):
+        self.session = SlowSession(
+            {
+                url(AUTHENTICATION_ENDPOINT): FakeResponse(201, TOKEN),
+                url(REFRESH_TOKEN_ENDPOINT): FakeResponse(201, REFRESHED_TOKEN),
+            }
+        )
+        self.homely = Homely("user", "password", session=self.session)
+
+    def test_single_flight(self):
+        headers = []
+        threads = [
+            threading.Thread(target=lambda: headers.append(self.homely.authorisation_header)) for _ in range(10)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(1, posts(self.session, AUTHENTICATION_ENDPOINT))
+        self.assertEqual([{"Authorization": "Bearer access"}] * 10, headers)
+
+    def test_refresh_expiring_token(self):
+        self.homely.store_authentication_information(TOKEN, time.time() - 59)
+        self.assertEqual({"Authorization": "Bearer refreshed"}, self.homely.authorisation_header)
+        self.assertEqual(0, posts(self.session, AUTHENTICATION_ENDPOINT))
+        self.assertEqual(1, posts(self.session, REFRESH_TOKEN_ENDPOINT))
+
+    def test_failed_refresh_logs_in_again(self):
+        self.session.responses[url(REFRESH_TOKEN_ENDPOINT)] = FakeResponse(400, "Bad request")
+        self.homely.store_authentication_information(TOKEN, time.time() - 59)
+        with self.assertLogs("homelypy.tokens", "WARNING"):
+            self.assertEqual({"Authorization": "Bearer access"}, self.homely.authorisation_header)
+        self.assertEqual(1, posts(self.session, AUTHENTICATION_ENDPOINT))
+
+    def test_background_refresh(self):
+        self.homely.store_authentication_information(TOKEN)
+        self.homely.token_manager.refresh_margin = 100
+        self.homely.token_manager.start()
+        deadline = time.time() + 5
+        while self.homely.access_token != "refreshed" and time.time() < deadline:
+            time.sleep(0.01)
+        self.homely.close()
+        self.assertEqual("refreshed", self.homely.access_token)
+        self.assertEqual(1, posts(self.session, REFRESH_TOKEN_ENDPOINT))
+
+    def test_shared_file_cache(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "tokens.json")
+            first = Homely("user", "password", session=self.session, token_cache=FileTokenCache(path))
+            self.assertEqual({"Authorization": "Bearer access"}, first.authorisation_header)
+            second_session = FakeSession({})
+            second = Homely("user", "password", session=second_session, token_cache=FileTokenCache(path))
+            self.assertEqual({"Authorization": "Bearer access"}, second.authorisation_header)
+            self.assertEqual([], second_session.calls)
+            self.assertEqual(first.authentication_time, second.authentication_time)
+            if os.name == "posix":
+                self.assertEqual(0o600, os.stat(path).st_mode & 0o777)